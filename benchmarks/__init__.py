@@ -0,0 +1,13 @@
+'''
+Benchmarks of the flasher, one module each. Run them from the top of the repository, e.g.
+python -m benchmarks.processSupervisorBenchmark
+'''
+import os
+import sys
+
+# The modules in flasher/ and web/ import each other by plain name, as when the apps are started from those directories
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _directory in ["web", "flasher"]:
+    _directory = os.path.join(_root, _directory)
+    if not _directory in sys.path:
+        sys.path.insert(0, _directory)
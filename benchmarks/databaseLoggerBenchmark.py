@@ -0,0 +1,94 @@
+'''
+Compares a commit per row on the calling thread with the DatabaseLogger's writer thread,
+and stats from the raw rows with stats over indexed epoch windows and from the rollups
+usage: python -m benchmarks.databaseLoggerBenchmark [rows]
+'''
+import os
+import sqlite3 as sql
+import sys
+import tempfile
+import time
+from datetime import datetime
+from config import RUN_NAME
+from databaseLogger import DatabaseLogger, StatsWindow
+from runState import RunState
+
+LEGACY_TODAY = " strftime('%Y-%m-%d', timestamp) == strftime('%Y-%m-%d', datetime('now','localtime')) "
+
+class _BenchmarkSuite():
+    @staticmethod
+    def statsTableName():
+        return "benchmark"
+
+    @staticmethod
+    def getStatsQueries(window):
+        return [
+            "select count(*) as 'total', sum(1-result) as 'failed', sum(result) as 'passed' from benchmark where {0}".format(window.where()),
+            "select avg(elapsedTime) as 'averageTime' from benchmark where result=1 AND {0}".format(window.where()),
+            "select error as errors_key, count(error) as errors_val from benchmark where error != 0 and {0} group by error order by error".format(window.where())
+        ]
+
+    @staticmethod
+    def getRollupStatsQueries(window):
+        return [
+            "select ifnull(sum(total),0) as 'total', sum(total-passed) as 'failed', sum(passed) as 'passed' from benchmark_rollup where {0}".format(window.where('hour')),
+            "select sum(passedElapsedTime)*1.0/sum(passed) as 'averageTime' from benchmark_rollup where {0}".format(window.where('hour')),
+            "select error as errors_key, sum(count) as errors_val from benchmark_rollup_errors where {0} group by error order by error".format(window.where('hour'))
+        ]
+
+    @staticmethod
+    def statsTableColumns():
+        return [['flashTime', 'REAL', 0], ['stage', 'TEXT', '']]
+
+def _legacyInsert(con, info, hostName):
+    '''
+    What onUpdateStateInfo did: create the table, then build the INSERT as a string and commit, all on the calling thread
+    '''
+    suiteClass = info['suiteClass']
+    cols = [col for col in DatabaseLogger.COMMON_COLUMNS if col[0] != 'epoch'] + suiteClass.statsTableColumns()
+    con.execute('create table if not exists {0} ({1})'.format(suiteClass.statsTableName(), ', '.join(item[0] + ' ' + item[1] for item in cols)))
+    con.commit()
+    values = ["'" + str(info['chipId']) + "'", "'" + str(datetime.fromtimestamp(time.time())) + "'", '1', str(info['errorNumber']),
+              str(info['elapsedTime']), "'" + str(info['uid']) + "'", "'" + hostName + "'", "'" + RUN_NAME + "'",
+              str(info['returnValues']['flashTime']), "'" + info['returnValues']['stage'] + "'"]
+    query = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(suiteClass.statsTableName(), ','.join(col[0] for col in cols), ','.join(values))
+    con.execute(query)
+    con.commit()
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    infos = [{'uid': str(i % 49), 'state': RunState.PASS_STATE if i % 5 else RunState.FAIL_STATE, 'suiteClass': _BenchmarkSuite, 'errorNumber': 0 if i % 5 else i % 7, 'elapsedTime': 120,
+              'chipId': 'chip' + str(i), 'returnValues': {'flashTime': 100.5, 'stage': 'Stage5'}} for i in range(rows)]
+    directory = tempfile.mkdtemp()
+    print "%-8s %8s %16s %16s" % ("path", "rows", "caller seconds", "total seconds")
+
+    fileName = os.path.join(directory, "legacy.db")
+    con = sql.connect(fileName)
+    start = time.time()
+    for info in infos:
+        _legacyInsert(con, info, "benchmark")
+    elapsed = time.time() - start
+    con.close()
+    print "%-8s %8d %16.3f %16.3f" % ("legacy", rows, elapsed, elapsed)
+
+    logger = DatabaseLogger(fileName=os.path.join(directory, "batched.db"))
+    start = time.time()
+    for info in infos:
+        logger.onUpdateStateInfo(info)
+    callerElapsed = time.time() - start
+    logger.flush()
+    print "%-8s %8d %16.3f %16.3f" % ("batched", rows, callerElapsed, time.time() - start)
+
+    print "%-8s %16s" % ("stats", "query seconds")
+    queries = _BenchmarkSuite.getStatsQueries(StatsWindow.today())
+    legacyQueries = [query.replace(StatsWindow.today().where(), LEGACY_TODAY) for query in queries]
+    rollupQueries = _BenchmarkSuite.getRollupStatsQueries(StatsWindow.today())
+    for name, statsQueries in [("legacy", legacyQueries), ("window", queries), ("rollup", rollupQueries)]:
+        start = time.time()
+        for i in range(10):
+            stats = logger.computeStats(statsQueries)
+        print "%-8s %16.4f %s" % (name, (time.time() - start) / 10, dict(stats))
+    logger.close()
+
+if __name__ == "__main__":
+    exit(main())
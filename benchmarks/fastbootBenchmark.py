@@ -0,0 +1,81 @@
+'''
+Fake devices flashed at once from one shared mapping of a sparse image,
+against each port reading the image into its own memory like a fastboot process does.
+Checks that a device unsparses exactly the original data
+usage: python -m benchmarks.fastbootBenchmark [MB] [ports]
+'''
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from fastboot import FastbootClient, FakeDevice, SharedImage, SPARSE_HEADER, SPARSE_MAGIC, CHUNK_HEADER, CHUNK_RAW, CHUNK_FILL, CHUNK_DONT_CARE
+
+def _writeSparseImage(imagePath, megabytes, blockSize=4096):
+    '''
+    A sparse image of raw chunks separated by fill and don't care chunks
+    :return the unsparsed data
+    '''
+    chunks = []
+    data = bytearray()
+    blocks = 0
+    for i in range(megabytes):
+        raw = os.urandom(1 << 20)
+        chunks.append(CHUNK_HEADER.pack(CHUNK_RAW, 0, len(raw) / blockSize, CHUNK_HEADER.size + len(raw)) + raw)
+        data.extend(raw)
+        chunks.append(CHUNK_HEADER.pack(CHUNK_FILL, 0, 16, CHUNK_HEADER.size + 4) + '\xff\xff\xff\xff')
+        data.extend('\xff' * 16 * blockSize)
+        chunks.append(CHUNK_HEADER.pack(CHUNK_DONT_CARE, 0, 16, CHUNK_HEADER.size))
+        data.extend('\0' * 16 * blockSize)
+        blocks += len(raw) / blockSize + 32
+    with open(imagePath, 'wb') as image:
+        image.write(SPARSE_HEADER.pack(SPARSE_MAGIC, 1, 0, SPARSE_HEADER.size, CHUNK_HEADER.size, blockSize, blocks, len(chunks), 0))
+        for chunk in chunks:
+            image.write(chunk)
+    return data
+
+def _flashPorts(ports, openImage, maxDownload):
+    devices = [FakeDevice(maxDownload=maxDownload) for i in range(ports)]
+    def flash(device):
+        image, release = openImage()
+        try:
+            FastbootClient(device).flash("UBI", image, 600)
+        finally:
+            release()
+    threads = [threading.Thread(target=flash, args=(device,)) for device in devices]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, sum(device.received for device in devices)
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    ports = int(sys.argv[2]) if len(sys.argv) > 2 else 49
+    directory = tempfile.mkdtemp()
+    imagePath = os.path.join(directory, "rootfs.ubi.sparse")
+    data = _writeSparseImage(imagePath, megabytes)
+
+    print "%-14s %6s %10s %12s %16s" % ("engine", "ports", "seconds", "MB sent", "max RSS MB")
+    def shared():
+        image = SharedImage.open(imagePath)
+        return image.data, image.close
+    seconds, sent = _flashPorts(ports, shared, 16 << 20)
+    print "%-14s %6d %10.2f %12.0f %16.0f" % ("shared mmap", ports, seconds, sent / 1e6, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+    def private():
+        with open(imagePath, 'rb') as imageFile:
+            return imageFile.read(), lambda: None
+    seconds, sent = _flashPorts(ports, private, 16 << 20)
+    print "%-14s %6d %10.2f %12.0f %16.0f" % ("private copies", ports, seconds, sent / 1e6, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+    device = FakeDevice(maxDownload=16 << 20, keep=True)
+    image = SharedImage.open(imagePath)
+    FastbootClient(device).flash("UBI", image.data, 600)
+    image.close()
+    print "unsparsed image matches: %s" % (device.partitions["UBI"] == data)
+    os.remove(imagePath)
+    os.rmdir(directory)
+
+if __name__ == "__main__":
+    exit(main())
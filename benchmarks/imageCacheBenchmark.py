@@ -0,0 +1,37 @@
+'''
+Time until the app can start, and until the hash is known, with sha1sum run at startup
+and with the cache on a first and a second launch
+usage: python -m benchmarks.imageCacheBenchmark [MB]
+'''
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from imageCache import ImageCache
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    directory = tempfile.mkdtemp()
+    with open(os.path.join(directory, "rootfs.ubi"), 'wb') as image:
+        for i in range(megabytes):
+            image.write(os.urandom(1 << 20))
+    print "%-16s %16s %16s" % (str(megabytes) + " MB image", "startup seconds", "hash seconds")
+    start = time.time()
+    subprocess.Popen(["sha1sum " + directory + "/rootfs.ubi | cut -d' ' -f1"], stdout=subprocess.PIPE, shell=True).communicate()
+    elapsed = time.time() - start
+    print "%-16s %16.3f %16.3f" % ("sha1sum", elapsed, elapsed)
+    for launch in ["first launch", "second launch"]:
+        start = time.time()
+        cache = ImageCache(directory).start()
+        cache.listing()
+        started = time.time() - start
+        cache.get("rootfs.ubi")
+        print "%-16s %16.3f %16.3f" % (launch, started, time.time() - start)
+        cache.thread.join() # it still writes the manifest
+    os.remove(os.path.join(directory, "rootfs.ubi"))
+    os.remove(os.path.join(directory, ".manifest.json"))
+    os.rmdir(directory)
+
+if __name__ == "__main__":
+    exit(main())
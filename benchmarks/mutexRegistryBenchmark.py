@@ -0,0 +1,52 @@
+'''
+Threads taking turns on one lock, plain threading.Lock against FairLock
+usage: python -m benchmarks.mutexRegistryBenchmark [threads] [rounds]
+'''
+import sys
+import threading
+import time
+from mutexRegistry import FairLock
+
+def _contend(acquire, release, threads, rounds, work):
+    '''
+    :return (seconds, largest number of times one thread got the lock ahead of a thread that asked before it)
+    '''
+    asked = {} # thread index -> sequence number of its pending request
+    sequence = [0]
+    bookkeeping = threading.Lock()
+    overtakes = [0]
+
+    def run(index):
+        for i in range(rounds):
+            with bookkeeping:
+                asked[index] = sequence[0]
+                sequence[0] += 1
+            acquire(index)
+            with bookkeeping:
+                mine = asked.pop(index)
+                overtakes[0] = max(overtakes[0], len([other for other in asked.values() if other < mine]))
+            time.sleep(work)
+            release(index)
+    workers = [threading.Thread(target=run, args=(index,)) for index in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.time() - start, overtakes[0]
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 49
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    work = .001
+    plain = threading.Lock()
+    seconds, overtakes = _contend(lambda owner: plain.acquire(), lambda owner: plain.release(), threads, rounds, work)
+    print "threading.Lock: %d threads x %d rounds in %.2f s, granted ahead of up to %d earlier requests" % (threads, rounds, seconds, overtakes)
+    fair = FairLock("benchmark")
+    seconds, overtakes = _contend(fair.acquire, fair.release, threads, rounds, work)
+    print "FairLock:       %d threads x %d rounds in %.2f s, granted ahead of up to %d earlier requests" % (threads, rounds, seconds, overtakes)
+    print fair.formatMetrics().split("\n")[0]
+    print "   wait: " + fair.waitTime.format()
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,85 @@
+'''
+Compares the thread per concern approach chip-flash used to be run with against the ProcessSupervisor,
+for a number of ports running a fake chip-flash at once
+usage: python -m benchmarks.processSupervisorBenchmark [ports...]
+'''
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from processSupervisor import ProcessSupervisor
+
+FAKE_CHIP_FLASH = '''#!/bin/sh
+i=0
+while [ $i -lt $1 ]; do
+    echo "writing 'UBI' $i/$1..."
+    sleep 0.2
+    i=$((i+1))
+done
+exit 0
+'''
+
+def _legacyRun(cmd, timeout):
+    '''
+    What CommandRunner.call_and_return used to do: a kill Timer and a progress thread next to the blocked caller
+    '''
+    from threading import Timer, Event
+    stopped = Event()
+    def loop():
+        while not stopped.wait(1):
+            pass
+    progressThread = threading.Thread(target=loop)
+    progressThread.daemon = True
+    progressThread.start()
+    proc = subprocess.Popen(cmd, shell=False, preexec_fn=os.setsid, stdout=subprocess.PIPE)
+    timer = Timer(timeout, os.killpg, [proc.pid, signal.SIGTERM])
+    timer.daemon = True
+    timer.start()
+    out, err = proc.communicate()
+    timer.cancel()
+    stopped.set()
+    return out, proc.returncode
+
+def _benchmark(ports, steps, supervised):
+    supervisor = ProcessSupervisor.get()
+    script = tempfile.NamedTemporaryFile(suffix='-chip-flash', delete=False)
+    script.write(FAKE_CHIP_FLASH)
+    script.close()
+    os.chmod(script.name, 0755)
+    cmd = [script.name, str(steps)]
+
+    def port():
+        if supervised:
+            supervisor.spawn(cmd, timeout=60, lineObserver=lambda line: None).result()
+        else:
+            _legacyRun(cmd, 60)
+
+    baseThreads = threading.active_count()
+    startCpu = sum(os.times()[0:2])
+    startTime = time.time()
+    workers = [threading.Thread(target=port) for i in range(ports)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    peakThreads = 0
+    while any(worker.is_alive() for worker in workers):
+        peakThreads = max(peakThreads, threading.active_count() - baseThreads)
+        time.sleep(.05)
+    elapsed = time.time() - startTime
+    cpu = sum(os.times()[0:2]) - startCpu
+    os.remove(script.name)
+    return peakThreads, cpu, elapsed
+
+def main():
+    portCounts = [int(arg) for arg in sys.argv[1:]] or [7, 49, 100]
+    print "%-6s %-11s %12s %12s %12s" % ("ports", "mode", "peak threads", "cpu seconds", "wall seconds")
+    for ports in portCounts:
+        for supervised in [False, True]:
+            peakThreads, cpu, elapsed = _benchmark(ports, 10, supervised)
+            print "%-6d %-11s %12d %12.2f %12.2f" % (ports, "supervisor" if supervised else "legacy", peakThreads, cpu, elapsed)
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,55 @@
+'''
+Log in to fake CHIP consoles on ptys in parallel, some starting at u-boot
+and some rejecting the first password, and print the login latency of each port.
+Then run test_008_xio's ten commands per pin pair, one send at a time and with send_many
+usage: python -m benchmarks.serialconnectionBenchmark [ports]
+'''
+import os
+import sys
+import threading
+import time
+from fakeChip import FakeChip
+from metrics import Histogram
+from serialconnection import SerialConnection
+
+def _benchmark(ports):
+    chips = [FakeChip(bootTime=.2, latency=.002, uboot=(i % 7 == 0), badLogins=(1 if i % 5 == 0 else 0)).start() for i in range(ports)]
+    connections = [SerialConnection(serialDeviceName=chip.path) for chip in chips]
+    results = []
+    commands = ["echo %d" % i for i in range(7)] + ["echo 1", "true", "false"]
+    sendTimes = []
+    batchTimes = []
+    def login(connection):
+        connection.connect(timeout=30)
+        results.append(connection.send("echo hi"))
+        start = time.time()
+        sent = [connection.send(command) for command in commands]
+        sendTimes.append(time.time() - start)
+        start = time.time()
+        batch = connection.send_many(commands)
+        batchTimes.append(time.time() - start)
+        assert sent[7] == "1" and [code for output, code in batch] == [0] * 9 + [1], batch
+    threads = [threading.Thread(target=login, args=(connection,)) for connection in connections]
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w') # the login chatter of every port
+    start = time.time()
+    try:
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+    finally:
+        sys.stdout = stdout
+    elapsed = time.time() - start
+    [connection.close() for connection in connections]
+    [chip.close() for chip in chips]
+    latencies = Histogram()
+    for connection in connections:
+        latencies.add(connection.lastLoginSeconds)
+    print "%d ports logged in %d times, %d answered, in %.2f seconds" % (ports, latencies.count, results.count("hi"), elapsed)
+    print "login seconds: " + latencies.format()
+    print "xio pair, 10 commands: send %.1f ms, send_many %.1f ms (mean per port)" % (sum(sendTimes) * 1000 / ports, sum(batchTimes) * 1000 / ports)
+
+def main():
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 7)
+
+if __name__ == "__main__":
+    exit(main())
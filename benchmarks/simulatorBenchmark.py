@@ -0,0 +1,77 @@
+'''
+A headless Controller running simulated fleets of 7, 49 and 200 ports.
+Reports boards through hwtest per hour, and the time the Controller spends in its
+polling and update calls, which is what the GUI's main thread would spend
+usage: python -m benchmarks.simulatorBenchmark [seconds per fleet] [speed] [ports ...]
+'''
+import logging
+import os
+import sys
+import time
+from controller import Controller
+from runState import RunState
+from simulator import SimulatedFleet
+
+def _benchmark(ports, seconds, speed):
+    fleet = SimulatedFleet(ports, speed, seed=ports)
+    controller = Controller(logging.getLogger("simulator"), rulesFile=fleet.rulesFile, devRoot=fleet.devRoot)
+    controller.configure()
+    finished = {} # suite name -> [passed, failed]
+    def onState(info):
+        if info.get('state') in [RunState.PASS_STATE, RunState.FAIL_STATE] and 'suiteClass' in info:
+            counts = finished.setdefault(info['suiteClass'].__name__, [0, 0])
+            counts[0 if info['state'] == RunState.PASS_STATE else 1] += 1
+    controller.addStateListener(onState)
+    fleet.start()
+    sys.stdout.flush()
+    saved = [os.dup(1), os.dup(2)]
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    for fd in [1, 2]: # the runs' chatter. unittest's runners hold on to the original sys.stderr, so redirect the descriptors
+        os.dup2(devnull, fd)
+    overhead = 0.0
+    calls = 0
+    startCpu = sum(os.times()[0:2])
+    start = time.time()
+    nextPoll = start
+    try:
+        while time.time() - start < seconds:
+            before = time.time()
+            controller.onUpdateTrigger(0)
+            if before >= nextPoll:
+                controller.onPollingTick(0)
+                nextPoll += 1
+            overhead += time.time() - before
+            calls += 1
+            time.sleep(.1)
+        elapsed = time.time() - start
+        cpu = sum(os.times()[0:2]) - startCpu
+        if controller.deviceMonitor:
+            controller.deviceMonitor.stop()
+        fleet.stop()
+        for thread in controller.testThreads.values(): # the runs in progress fail once their devices are gone
+            if thread:
+                thread.join()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, original in zip([1, 2], saved):
+            os.dup2(original, fd)
+            os.close(original)
+        os.close(devnull)
+    tested = finished.get('ChipHardwareTest', [0, 0])
+    flashed = finished.get('Flasher', [0, 0])
+    print "%5d %10d/%-5d %10d/%-5d %12.0f %14.2f %14.3f %10.1f" % (ports, flashed[0], flashed[1], tested[0], tested[1],
+        sum(tested) * 3600 / elapsed, overhead * 1000 / calls, overhead / elapsed * 100, cpu / elapsed * 100)
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else .02
+    fleets = [int(ports) for ports in sys.argv[3:]] or [7, 49, 200]
+    logging.basicConfig(level=logging.WARNING)
+    print "%d seconds per fleet, flash and hwtest at %.3f of real time" % (seconds, speed)
+    print "%5s %16s %16s %12s %14s %14s %10s" % ("ports", "flash pass/fail", "hwtest pass/fail", "boards/hour", "ms per update", "overhead %", "cpu %")
+    for ports in fleets:
+        _benchmark(ports, seconds, speed)
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,100 @@
+'''
+Load test: ports sending state changes at a fixed rate, through an HTTP self-POST per change
+(what WebFlasher used to do) and through the SocketBridge. Flask isn't needed for either
+usage: python -m benchmarks.socketBridgeBenchmark [ports] [seconds]
+'''
+import BaseHTTPServer
+import json
+import os
+import sys
+import threading
+import time
+import urllib2
+from socketBridge import SocketBridge, EMIT_INTERVAL
+
+class _Emitter(object):
+    '''
+    Stands in for SocketIO: records when each port's change reached emit
+    '''
+    def __init__(self):
+        self.latencies = []
+        self.messages = 0
+
+    def emit(self, event, changes, broadcast=False):
+        now = time.time()
+        json.dumps(changes) # socketio encodes the message once
+        self.messages += 1
+        for change in changes:
+            if 'sentAt' in change:
+                self.latencies.append(now - change['sentAt'])
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def start_background_task(self, target):
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+
+def _legacyServer(emitter):
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_POST(self):
+            info = json.loads(self.rfile.read(int(self.headers['content-length'])))
+            emitter.emit("stateChange", [info], broadcast=True)
+            self.send_response(200)
+            self.send_header('content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write('""')
+
+        def log_message(self, *args):
+            pass
+
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+def _loadTest(ports, rate, seconds, bridged):
+    emitter = _Emitter()
+    if bridged:
+        bridge = SocketBridge(emitter)
+        bridge.start()
+        send = bridge.put
+    else:
+        server = _legacyServer(emitter)
+        url = 'http://127.0.0.1:%d/stateChange' % server.server_address[1]
+        send = lambda info: urllib2.urlopen(urllib2.Request(url, json.dumps(info), {'content-type': 'application/json'})).read()
+
+    period = 1.0 / (ports * rate)
+    blocked = 0
+    startCpu = sum(os.times()[0:2])
+    start = time.time()
+    count = 0
+    while time.time() - start < seconds: # the controller thread, sending one port's change at a time
+        now = time.time()
+        info = {'uid': str(count % ports), 'progress': (count // ports) % 100, 'label': 'Stage ' + str(count % 7), 'sentAt': now}
+        send(info)
+        blocked += time.time() - now
+        count += 1
+        wait = start + count * period - time.time()
+        if wait > 0:
+            time.sleep(wait)
+    time.sleep(EMIT_INTERVAL * 2) # let the last frame go out
+    cpu = sum(os.times()[0:2]) - startCpu
+    if not bridged:
+        server.shutdown()
+    latencies = sorted(emitter.latencies) or [0]
+    return count, emitter.messages, blocked / count * 1000, latencies[len(latencies) / 2] * 1000, latencies[int(len(latencies) * .99)] * 1000, cpu
+
+def main():
+    ports = int(sys.argv[1]) if len(sys.argv) > 1 else 49
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print "%d ports x 1 Hz for %d seconds" % (ports, seconds)
+    print "%-8s %8s %9s %17s %12s %12s %12s" % ("path", "updates", "messages", "blocked ms/update", "p50 ms", "p99 ms", "cpu seconds")
+    for bridged in [False, True]:
+        result = _loadTest(ports, 1, seconds, bridged)
+        print "%-8s %8d %9d %17.3f %12.1f %12.1f %12.2f" % (("bridge" if bridged else "post",) + result)
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,58 @@
+'''
+Runs of a suite of 7 decorated tests that do nothing, as TestingThread makes them, through unittest.TextTestRunner
+and through StepRunner. One thread, then 49 threads at once like a full station. TextTestRunner's output goes to /dev/null.
+The runner column leaves out making and decorating the suite, which both need
+usage: python -m benchmarks.stepRunnerBenchmark [runs]
+'''
+import os
+import sys
+import threading
+import time
+import unittest
+from observable_test import *
+from stepRunner import StepRunner
+
+class _BenchmarkSuite(unittest.TestCase):
+    @label("fel")
+    @progress(10)
+    @errorNumber(201)
+    def test_0_fel(self):
+        pass
+
+for _stage in range(6):
+    def _test(self):
+        pass
+    setattr(_BenchmarkSuite, "test_Stage%d" % _stage, mutex("fel")(progress(5)(label("stage %d" % _stage)(_test))))
+
+def _runs(runner, runs, threads):
+    def onState(stateInfo):
+        stateInfo['testCase'].step.mutex
+    def work():
+        for i in range(runs):
+            suite = TestPlan.forSuite(_BenchmarkSuite).makeSuite()
+            for test in suite:
+                decorateTest(test, stateInfoObservers=[onState], progressObservers=[], attributes={}, returnValues={})
+            if runner:
+                runner().run(suite)
+    workers = [threading.Thread(target=work) for i in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.time() - start) / (runs * threads)
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    devnull = open(os.devnull, 'w')
+    print "%-24s %8s %12s %14s" % ("runner", "threads", "us per run", "runner us")
+    for threads in [1, 49]:
+        preparation = _runs(None, runs / threads, threads) # making and decorating the suite, the same for both
+        print "%-24s %8d %12.0f" % ("(suite preparation)", threads, preparation * 1e6)
+        seconds = _runs(lambda: unittest.TextTestRunner(stream=devnull, verbosity=1, failfast=True), runs / threads, threads)
+        print "%-24s %8d %12.0f %14.0f" % ("unittest.TextTestRunner", threads, seconds * 1e6, (seconds - preparation) * 1e6)
+        seconds = _runs(StepRunner, runs / threads, threads)
+        print "%-24s %8d %12.0f %14.0f" % ("StepRunner", threads, seconds * 1e6, (seconds - preparation) * 1e6)
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,64 @@
+'''
+Micro benchmark: a multi megabyte hwtest transcript, fed in 100 byte reads, searched
+the way scanfor did (whole transcript every read) and with the StreamMatcher
+usage: python -m benchmarks.streamMatcherBenchmark [recorded transcript]
+'''
+import re
+import sys
+import time
+from streamMatcher import StreamMatcher
+
+HWTEST_LINES = '''# Turn on wlan0...OK
+# Turn on wlan1...OK
+# Hardware list...OK
+# I2C bus 0...OK
+# Doing 10s stress test...OK
+stress: info: [1030] dispatching hogs: 1 cpu, 1 io, 1 vm, 0 hdd
+ubi0: attaching mtd4, 63 bad PEBs reserved, 2 PEBs reserved for bad PEB handling, bitflips corrected 12
+'''
+END = '# Checking bit flips on NAND... 0 49.9 1.64012\n# Checking bad blocks on NAND... 52 4\n### ALL TESTS PASSED ###\n'
+END_REGEX = r'.*### [^#]+ ###.*' # what scanfor was given
+STREAM_END_REGEX = r'### [^#]+ ###.*' # same end, without the leading .* which makes every search try each start position on the line
+
+def _legacyScan(transcript, readSize):
+    data = ''
+    for position in xrange(0, len(transcript), readSize):
+        data += transcript[position:position + readSize]
+        match = re.search(END_REGEX, data)
+        if match:
+            return match.end()
+
+def _streamScan(transcript, readSize, pattern):
+    matcher = StreamMatcher(limit=len(transcript) + 1)
+    matcher.setPatterns([pattern])
+    for position in xrange(0, len(transcript), readSize):
+        matcher.feed(transcript[position:position + readSize])
+        found = matcher.search()
+        if found:
+            return len(found[3])
+
+def main():
+    if len(sys.argv) > 1:
+        recorded = open(sys.argv[1]).read()
+        transcripts = [recorded]
+    else:
+        transcripts = [HWTEST_LINES * (size / len(HWTEST_LINES)) + END for size in [1 << 16, 1 << 18, 1 << 20, 1 << 22]]
+    print "%12s %14s %14s %14s" % ("bytes", "legacy seconds", "stream seconds", "without .*")
+    for transcript in transcripts:
+        results = []
+        if len(transcript) < 1 << 19: # the legacy scan is quadratic, so skip it on the big ones
+            start = time.time()
+            legacyLength = _legacyScan(transcript, 100)
+            results.append("%14.3f" % (time.time() - start))
+        else:
+            legacyLength = None
+            results.append("%14s" % "skipped")
+        for pattern in [END_REGEX, STREAM_END_REGEX]:
+            start = time.time()
+            length = _streamScan(transcript, 100, pattern)
+            results.append("%14.3f" % (time.time() - start))
+            assert legacyLength in [None, length]
+        print "%12d %s" % (len(transcript), " ".join(results))
+
+if __name__ == "__main__":
+    exit(main())
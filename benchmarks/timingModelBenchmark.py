@@ -0,0 +1,32 @@
+'''
+Learned timeouts against the fixed ones, on simulated stage durations.
+The learned ones start from the console app's 400 x 2.3 until enough stages passed.
+Counts the stages a timeout would have killed although they were only slow. A stuck stage holds its port for the whole timeout
+usage: python -m benchmarks.timingModelBenchmark [stages]
+'''
+import random
+import sys
+from timingModel import TimingModel
+
+def main():
+    stages = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    generator = random.Random(1)
+    print "%-28s %10s %16s" % ("host", "timeout", "false timeouts")
+    for host, mean, spread in [("fast host", 150, 15), ("typical host", 300, 30), ("slow host", 600, 60)]:
+        model = TimingModel()
+        durations = [max(1, generator.gauss(mean, spread)) for i in range(stages)]
+        for fixed in [400, 400 * 2.3, 400 * 4]: # the kivy, console and web apps' multipliers
+            falseTimeouts = len([seconds for seconds in durations if seconds > fixed])
+            print "%-28s %10.0f %16d" % (host + " fixed x%.1f" % (fixed / 400), fixed, falseTimeouts)
+        falseTimeouts = 0
+        timeout = None
+        for seconds in durations:
+            timeout = model.timeout("Flasher", "test_Stage5", "1", 400 * 2.3)
+            if seconds > timeout: # killed, so not learned from
+                falseTimeouts += 1
+                continue
+            model.record("Flasher", "test_Stage5", "1", seconds, True)
+        print "%-28s %10.0f %16d" % (host + " learned", timeout, falseTimeouts)
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,3 +1,3 @@
 from controller import Controller
-from scheduler import call_repeatedly
+from scheduler import call_repeatedly, Scheduler
 from runState import RunState
\ No newline at end of file
@@ -3,18 +3,20 @@
 from unittest import TestCase, TextTestRunner, TestLoader
 from observable_test import *
 from commandRunner import CommandRunner
+from progress import Progress
 from deviceDescriptor import DeviceDescriptor
 from config import *
 import os
 import re
 import time
-import io
-import serial
+from serialHub import SerialHub, promptRegex
+from future import TimeoutError
 from ui_strings import *
 
 LOGIN = 'root'
 PASSWORD = 'chip'
 ALL_TESTS_PASSED_REGEX = re.compile(r'.*### ALL TESTS PASSED ###.*')
+TESTS_DONE_REGEX = re.compile(r'### [^#]+ ###.*') # the line hwtest ends with. No leading .*, which would make each search try every start position
 
 dummy = DeviceDescriptor.makeDummy()
 
@@ -39,6 +41,7 @@ errorCodeMap = {
     "Checking bad blocks on NAND": 313
 }
 ERROR_REGEX = re.compile("\# (.*)\.\.\.ERROR")
+HWTEST_TIMEOUT_ERROR = 314 # hwtest printed nothing for HWTEST_SUBTEST_TIMEOUT seconds
 
 # A regex to search for the checking text followed by 3 decimal numbers
 BITFLIP_REGEX = re.compile(
@@ -48,6 +51,46 @@ BITFLIP_REGEX = re.compile(
 BAD_BLOCK_REGEX = re.compile(
     "\# Checking bad blocks on NAND\.\.\.\s(\d+)\s(\d+)")
 
+# One finished subtest: "# <test>...<result>" up to the end of the line
+SUBTEST_REGEX = re.compile(r'# ([^\r\n#]+?)\.\.\.([^\r\n]*)\r?\n')
+
+class HwtestParser(object):
+    '''
+    Follows hwtest's "# <test>...<result>" lines as they arrive, instead of parsing the whole transcript after the final banner.
+    Each line advances the progress by one subtest of errorCodeMap and is passed to the subtest observers.
+    The first ERROR result, or a line whose check fails, sets the error code so the caller can stop the run right away.
+    '''
+    def __init__(self, progressObservers=None, subtestObservers=None, checks=None):
+        '''
+        :param progressObservers: called with the fraction of subtests finished
+        :param subtestObservers: called with (name, result) for each subtest line
+        :param checks: dictionary of subtest name -> function(line) returning False if the values on the line are out of threshold
+        '''
+        self.progress = Progress(progressObservers or [], finish=float(len(errorCodeMap)), interval=None)
+        self.subtestObservers = subtestObservers or []
+        self.checks = checks or {}
+        self.seen = set()
+        self.errorCode = 0
+        self.failedTest = None
+
+    def onLine(self, match):
+        '''
+        :param match: a SUBTEST_REGEX match
+        :return the error code of the subtest, 0 if it passed
+        '''
+        name = match.group(1).strip()
+        result = match.group(2)
+        if name in errorCodeMap and not name in self.seen:
+            self.seen.add(name)
+            self.progress.setProgress(len(self.seen))
+        [observer(name, result) for observer in self.subtestObservers]
+        check = self.checks.get(name)
+        failed = result.strip().startswith("ERROR") or (check and not check(match.group(0)))
+        if failed and not self.errorCode:
+            self.errorCode = errorCodeMap.get(name, 300) # 300 is a default which should't happen
+            self.failedTest = name
+        return self.errorCode if failed else 0
+
 class ChipHardwareTest(TestCase):
     '''
     This will wait for CHIP to boot up, log in, and then run 'hwtest' on it
@@ -64,76 +107,49 @@ class ChipHardwareTest(TestCase):
                 return text, code
         return "", 0
 
-    def answer_prompt(self,sio, prompt_to_wait_for, answer_to_write, send_cr=True):
-        #------------------------------------------------------------------
-        sio.flush()
-        prompt_found = False
-        data = ''
-
-        d = 'something'
-        while not len(d) == 0:
-            d = sio.read(2000);
-            data += d
-            print '-' * 50
-            print ' %d bytes read' % (len(data))
-            print '-' * 50
+    def answer_prompt(self, stream, prompt_to_wait_for, answer_to_write, send_cr=True):
+        '''
+        Wait for a prompt at the end of the output and answer it.
+        The prompt has to be the last thing received, so the same text earlier on, e.g. in boot messages, is ignored
+        :param stream: SerialStream of the CHIP
+        :param send_cr: keep sending new lines every second until the prompt shows, to get the console to print it again
+        '''
+        stream.expect(promptRegex(prompt_to_wait_for), answer=answer_to_write, nudge='\n' if send_cr else None).result()
+        print '-' * 50
+        print ' detected [%s] ' % prompt_to_wait_for
+        print '-' * 50
 
+    def scanfor(self, stream, regexp_to_scan_for, answer_to_write):
+        '''
+        Wait for a regex to show up in the output and answer it
+        :return everything received up to the end of the match
+        '''
+        match, data = stream.expect(regexp_to_scan_for, answer=answer_to_write).result()
         print data
-
-        while not prompt_found:
-            d = sio.read(100);
-            data += d
-            print '-' * 50
-            print ' %d bytes read' % (len(data))
-            print '-' * 50
-            if(data[:-1].endswith(prompt_to_wait_for)):
-                sio.write(unicode(answer_to_write + '\n'))
-                print '-' * 50
-                print ' detected [%s] ' % prompt_to_wait_for
-                print '-' * 50
-                prompt_found = True
-            else:
-                if send_cr:
-                    sio.write(unicode('\n'))
-            sio.flush()
-
-
-    def scanfor(self,sio, regexp_to_scan_for, answer_to_write):
-        prompt_found = False
-        data = ''
-        while not prompt_found:
-            data += sio.read(100);
-            print '-' * 50
-            print ' %d bytes read' % (len(data))
-            print '-' * 50
-            print data
-            if re.search(regexp_to_scan_for, data):
-                print '-' * 50
-                print ' detected [%s] ' % regexp_to_scan_for
-                print '-' * 50
-                sio.write(unicode(answer_to_write + '\n'))
-                prompt_found = True
-            sio.flush()
+        print '-' * 50
+        print ' detected [%s] ' % getattr(regexp_to_scan_for, 'pattern', regexp_to_scan_for)
+        print '-' * 50
         return data
 
 
     def hwtest(self,serial_port):
         print 'reading from %s:' % serial_port
 
-        ser = serial.Serial(serial_port, 115200, timeout=1);
-        sio = io.TextIOWrapper(io.BufferedRWPair(ser, ser))
-
-        #login
-
-        self.answer_prompt(sio, 'login:', 'root')
-        self.answer_prompt(sio, 'Password:', 'chip', False)
-        self.answer_prompt(sio, '#', HW_ADDR_CMD+ ' && hwtest') #easiest to chain together commands
+        stream = SerialHub.get().open(serial_port, 115200) # read by the hub's thread along with every other CHIP
+        try:
+            #login
+            self.answer_prompt(stream, 'login:', LOGIN)
+            self.answer_prompt(stream, 'Password:', PASSWORD, False)
+            self.answer_prompt(stream, '#', HW_ADDR_CMD+ ' && hwtest') #easiest to chain together commands
 
-#         self.answer_prompt(sio, '#', 'hwtest')
-        d = self.scanfor(sio, r'.*### [^#]+ ###.*', 'poweroff')
-        ser.close()
+            d, errorCode = self.followHwtest(stream)
+        finally:
+            stream.close()
 
         self.hwAddr(d)
+        if errorCode != 0:
+            print "---> TESTS FAILED"
+            return errorCode, d
 
         missingText, missingCode = self.checkForMissingTests(d)
         if missingCode != 0:
@@ -164,6 +180,46 @@ class ChipHardwareTest(TestCase):
         print "---> TESTS FAILED"
         return errorCode, d
 
+    def followHwtest(self, stream):
+        '''
+        Read hwtest's output one subtest line at a time. When a subtest fails, or no line shows up within HWTEST_SUBTEST_TIMEOUT,
+        stop hwtest and power the board off without waiting for the remaining subtests, so the port is free right away
+        :return (everything received, error code of the first failed subtest, HWTEST_TIMEOUT_ERROR, or 0 if hwtest got to its final banner)
+        '''
+        parser = HwtestParser(self.progressObservers, checks={"Checking bit flips on NAND": self.bitFlipTest,
+                                                              "Checking bad blocks on NAND": self.badBlockTest})
+        transcript = []
+        while True:
+            try:
+                match, text = stream.expect([TESTS_DONE_REGEX, SUBTEST_REGEX], timeout=HWTEST_SUBTEST_TIMEOUT).result()
+            except TimeoutError:
+                self._output("---> hwtest printed nothing for " + str(HWTEST_SUBTEST_TIMEOUT) + " seconds, stopping it\n")
+                self._stopHwtest(stream)
+                return ''.join(transcript), HWTEST_TIMEOUT_ERROR
+            transcript.append(text)
+            self._output(text)
+            if match.re is TESTS_DONE_REGEX:
+                stream.write('poweroff\n')
+                return ''.join(transcript), 0
+            errorCode = parser.onLine(match)
+            if errorCode != 0:
+                self._output("---> " + parser.failedTest + " failed, stopping hwtest\n")
+                self._stopHwtest(stream)
+                return ''.join(transcript), errorCode
+
+    def _output(self, text):
+        [observer(text) for observer in self.outputObservers]
+
+    def _stopHwtest(self, stream):
+        '''
+        Ctrl-C, then power off once the shell is back
+        '''
+        stream.write('\x03')
+        try:
+            stream.expect(promptRegex('#'), timeout=HWTEST_ABORT_TIMEOUT, answer='poweroff', nudge='\n').result()
+        except Exception, e:
+            self._output("Could not power off after stopping hwtest: " + str(e) + "\n")
+
     def hwAddr(self,searchStr):
         match = HW_ADDR_REGEX.search(searchStr)
         if not match:  # this should not happen
@@ -213,7 +269,10 @@ class ChipHardwareTest(TestCase):
 
 
     def setUp(self):
-        self.progressObservers = []
+        if not hasattr(self, "progressObservers"): # decorateTest provides these when run from a TestingThread
+            self.progressObservers = []
+        if not hasattr(self, "outputObservers"):
+            self.outputObservers = []
 #         self.returnValues['uncorrectableBitflips'] = -1
 #         self.returnValues['correctableBitflips'] = 0
 #         self.returnValues['stdDevCorrectableBitflips'] = 0
@@ -252,7 +311,8 @@ class ChipHardwareTest(TestCase):
         result, details = self.hwtest(self.deviceDescriptor.serial)
         if not hasattr(self, "output"):
             self.output = ""
-        self.output += details
+        if not self.outputObservers: #otherwise it was already streamed
+            self.output += details
         if result != 0:
             self.errorCode = result  # store it away for later use
         self.assertEqual(0, result)
@@ -275,16 +335,20 @@ class ChipHardwareTest(TestCase):
         return cls.CUSTOM_COLUMNS
 
     @staticmethod
-    def getStatsQueries(where):
-        table = ChipHardwareTest.statsTableName()
+    def getStatsQueries(window):
+        '''
+        :param window: a StatsWindow to compute the stats over
+        '''
+        rollup = ChipHardwareTest.statsTableName() + "_rollup"
+        where = window.where('hour')
         return [
-            "select count(*) as 'total', sum(1-result) as 'failed', sum(result) as 'passed' from {0} where {1}".format(table,where),
-            "select avg(elapsedTime) as 'averageTime' from {0} where result=1 AND {1}".format(table,where),
-            "select avg(uncorrectableBitflips) from {0} where uncorrectableBitflips != -1 AND {1}".format(table,where),
-            "select avg(correctableBitflips) from {0} where correctableBitflips != -1 AND {1}".format(table,where),
-            "select avg(badBlocks) from {0} where badBlocks != -1 AND {1}".format(table,where),
-            "select avg(bbtBlocks) from {0} where bbtBlocks != -1 AND {1}".format(table,where),
-            "select error as errors_key, count(error) as errors_val from {0} where error != 0 and {1} group by error order by error".format(table,where)
+            "select ifnull(sum(total),0) as 'total', sum(total-passed) as 'failed', sum(passed) as 'passed' from {0} where {1}".format(rollup,where),
+            "select sum(passedElapsedTime)*1.0/sum(passed) as 'averageTime' from {0} where {1}".format(rollup,where),
+            "select sum(uncorrectableBitflips_sum)/sum(uncorrectableBitflips_n) as 'avg(uncorrectableBitflips)' from {0} where {1}".format(rollup,where),
+            "select sum(correctableBitflips_sum)/sum(correctableBitflips_n) as 'avg(correctableBitflips)' from {0} where {1}".format(rollup,where),
+            "select sum(badBlocks_sum)/sum(badBlocks_n) as 'avg(badBlocks)' from {0} where {1}".format(rollup,where),
+            "select sum(bbtBlocks_sum)/sum(bbtBlocks_n) as 'avg(bbtBlocks)' from {0} where {1}".format(rollup,where),
+            "select error as errors_key, sum(count) as errors_val from {0}_errors where {1} group by error order by error".format(rollup,where)
         ]
 def main():
     tl = TestLoader()
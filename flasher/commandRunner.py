@@ -1,13 +1,70 @@
 # -*- coding: utf-8 -*-
-import subprocess
 import os
-import signal
+import re
 from os import path
-# from kivy.clock import Clock
-from scheduler import call_repeatedly
-from threading import Timer
 from progress import Progress
-	
+from processSupervisor import ProcessSupervisor
+
+# fastboot progress, e.g. "sending sparse 'UBI' 1/4 (262140 KB)..." followed by "OKAY [ 25.123s]"
+FASTBOOT_SENDING_REGEX = re.compile(r"sending (?:sparse )?'([^']+)'(?: (\d+)/(\d+))? \((\d+) KB\)")
+FASTBOOT_WRITING_REGEX = re.compile(r"writing '([^']+)'(?: (\d+)/(\d+))?")
+FASTBOOT_OKAY_REGEX = re.compile(r"OKAY \[\s*([0-9.]+)s\]")
+# sunxi-fel -p progress bar, e.g. " 42% [=====               ]   2048 kB,  512.3 kB/s"
+FEL_PROGRESS_REGEX = re.compile(r"(\d+)% \[[= ]*\]\s+(\d+) kB")
+LINE_REGEX = re.compile(r"[^\r\n]*(?:\r\n|[\r\n]|$)") # a line ends in a new line, or in a carriage return when a progress bar redraws
+
+class ProgressParser:
+	'''
+	Turns progress markers in chip-flash output into a progress value between 0 and 1.
+	It also keeps track of the upload throughput reported by fastboot
+	'''
+	def __init__(self):
+		self.parts = 1 # number of sparse chunks fastboot will send
+		self.stepsDone = 0 # each chunk is sent, then written
+		self.bytesSent = 0
+		self.sendSeconds = 0.0
+		self.pendingBytes = 0 # size of the chunk currently being sent
+		self.felFraction = None
+
+	def feed(self, line):
+		'''
+		:param line: one line of output
+		:return the new progress, or None if the line has no progress information
+		'''
+		match = FASTBOOT_SENDING_REGEX.search(line)
+		if match:
+			if match.group(3):
+				self.parts = int(match.group(3))
+			self.pendingBytes = int(match.group(4)) * 1024
+			return self.getProgress()
+		match = FASTBOOT_WRITING_REGEX.search(line)
+		if match:
+			return self.getProgress()
+		match = FASTBOOT_OKAY_REGEX.search(line)
+		if match:
+			if self.pendingBytes:
+				self.bytesSent += self.pendingBytes
+				self.sendSeconds += float(match.group(1))
+				self.pendingBytes = 0
+			self.stepsDone += 1
+			return self.getProgress()
+		match = FEL_PROGRESS_REGEX.search(line)
+		if match:
+			self.felFraction = int(match.group(1)) / 100.0
+			return self.felFraction
+		return None
+
+	def getProgress(self):
+		return min(1.0, self.stepsDone / (2.0 * self.parts))
+
+	def getThroughput(self):
+		'''
+		:return bytes per second uploaded by fastboot, or None if nothing was sent
+		'''
+		if not self.sendSeconds:
+			return None
+		return self.bytesSent / self.sendSeconds
+
 class CommandRunner:
 	'''
 	This class executes a shell command and returns a return code
@@ -20,52 +77,49 @@ class CommandRunner:
 		:param expectedTime: How long the subprocess should take. Used for updating progress 
 		'''
 		self.log = log
-		self.progress=Progress(progressObservers)
+		self.progress=Progress(progressObservers or [], interval=None) #progress is driven by the output
 		self.expectedTime = expectedTime
 
-	def call_and_return(self, cmd, timeout=1, expectedTime=60):
+	def call_and_stream(self, cmd, timeout=1, outputObservers = None, stallTimeout = None):
 		'''
-		Spawn a subprocess and return the return code
-		This maybe could be simplified by using pexpect.run()
+		Spawn a subprocess and return its output and return code, reading stdout and stderr as they are written.
+		Every complete line is passed to the output observers, and progress markers are turned into progress updates
 		:param cmd: Command to run. Can be array
-		:param timeout: timeout of the process. Is this working?
-		:param expectedTime: How long we think it should take
+		:param timeout: seconds before the process group is killed
+		:param outputObservers: called with each line of output, including the new line
+		:param stallTimeout: seconds without any output before the process is considered stuck and killed
 		'''
-		self.expectedTime = expectedTime
-		self.progress.finish =expectedTime
-		
 		log = self.log
-		log.info('ENTER: call_and_return()')
+		log.info('ENTER: call_and_stream()')
 		working_dir=path.dirname( path.dirname( path.realpath( __file__ ) ) )
 		my_env = os.environ.copy()
 		my_env["BUILDROOT_OUTPUT_DIR"] = working_dir+"/flasher/tools/.firmware/"
-		print working_dir + "/flasher/tools"
+		self.parser = ProgressParser()
+		self.lastRedraw = None # progress shown by the last progress bar line passed on
 
-		proc = subprocess.Popen( cmd, cwd=working_dir+"/flasher/tools", shell=False, preexec_fn=os.setsid, env=my_env, stdout=subprocess.PIPE )
+		future = ProcessSupervisor.get().spawn( cmd, cwd=working_dir+"/flasher/tools", env=my_env, timeout=timeout, stallTimeout=stallTimeout,
+				lineObserver=lambda line: self._onLine(line, outputObservers) )
+		out, returncode = future.result() #all the reading and killing happens on the supervisor's thread
+		if returncode < 0:
+			log.info('Killed: timed out or stalled')
+		log.info('error code='+str(returncode))
+		log.info('LEAVE: call_and_stream()')
+		return out, returncode
 
-		timer = Timer( timeout, os.killpg, [ proc.pid, signal.SIGTERM ] ) #timeout will signal process to kill
-		returncode = None
-				
-		try:
-			timer.start()
-			cancelSchedule = call_repeatedly(1,self.progress.addProgress.__get__(self.progress, Progress),1.0/expectedTime)
-# 			Clock.schedule_interval(self.progress.addProgress.__get__(self.progress, Progress), 1.0/expectedTime ) # callback for bound method
-			out ,err = proc.communicate()
-			#currently, the output is only updated at the end of the process. An alternative would be to
-			# do like here: http://stackoverflow.com/questions/2804543/read-subprocess-stdout-line-by-line
-			# There should be an observer passed in (like progress observer) which should be notified after
-			# every line and update the GUI
-			proc.wait()
-			returncode = proc.returncode
-		finally:
-			timer.cancel()
-			cancelSchedule()
-# 			Clock.unschedule(self.progress.addProgress)
-			log.info('error code='+str(proc.returncode))
-			log.info('LEAVE: call_and_return()')
-			if proc.returncode < 0:
-				log.info('Timeout occurred!')
-			
-			if proc.poll():
-				log.error("Process " + str(proc.pid) + " is still running!")
-			return out, returncode
+	def _onLine(self, text, outputObservers):
+		'''
+		:param text: output up to a line end. Split again in case it holds several lines, e.g. progress bar redraws
+		'''
+		for line in LINE_REGEX.findall(text):
+			if not line:
+				continue
+			value = self.parser.feed(line)
+			if value is not None:
+				self.progress.setProgress(value * self.progress.finish)
+			if line.endswith('\r'): # a progress bar redrawing. Pass it on as a line when it shows new progress
+				if value is None or value == self.lastRedraw:
+					continue
+				self.lastRedraw = value
+				line = line[:-1] + '\n'
+			if outputObservers:
+				[observer(line) for observer in outputObservers]
@@ -12,9 +12,56 @@ DONE_WAIT_BEFORE_DISCONNECT = 2 #This only works on flashing, not hw test. Also,
 
 GRAY_OUT_ON_DISCONNECT = False
 
+# How device plug/unplug is detected: "udev" (netlink events, needs pyudev), "inotify" (watch /dev),
+# "auto" (udev if available, else inotify) or "poll" (check every port once a second)
+DEVICE_MONITOR = "auto"
+
+#number of seconds chip-flash may go without printing anything before the stage is considered stalled and killed
+FLASH_STALL_TIMEOUT = 150
+
+#how the UBI image is uploaded in the last flashing stage: "chip-flash" runs chip-flash, and so fastboot, for each port.
+#"fastboot" uploads it from this process with the fastboot module (needs pyusb), every port reading the same memory mapped image.
+#The image is the one file matching FASTBOOT_IMAGE_PATTERN, relative to flasher/tools where the stages run
+FLASH_ENGINE = "chip-flash"
+FASTBOOT_IMAGE_PATTERN = ".firmware/images/*.ubi.sparse"
+FASTBOOT_PARTITION = "UBI"
+
+#number of ports allowed to hold a @mutex at the same time, by mutex name. Mutexes not listed here allow one port
+MUTEX_PERMITS = {}
+
+#number of ports allowed to run a @bandwidth stage (the UBI upload) at the same time on each usb hub, and below each root hub.
+#None for no limit. Controller.getUsbMetrics shows the upload rates to tune them with
+USB_HUB_LIMIT = None
+USB_ROOT_HUB_LIMIT = None
+
+#stage timeouts and progress estimates learned from the durations of the last TIMING_WINDOW stages that passed, per stage and per port.
+#The timeout is the TIMING_TIMEOUT_PERCENTILE of the durations times TIMING_TIMEOUT_MARGIN, and at least TIMING_MIN_TIMEOUT seconds.
+#Until TIMING_MIN_SAMPLES stages passed, the timeouts and @progress values of the suites are used
+TIMING_WINDOW = 200
+TIMING_MIN_SAMPLES = 20
+TIMING_TIMEOUT_PERCENTILE = 99
+TIMING_TIMEOUT_MARGIN = 1.5
+TIMING_MIN_TIMEOUT = 10
+
+#failed runs whose exit code the suite lists as retryable (Flasher.retryableErrors) are run again, up to RETRY_MAX_ATTEMPTS times in all,
+#from the latest @resumable test for the state the CHIP is in. RETRY_BACKOFF seconds before the first retry, doubling up to RETRY_MAX_BACKOFF
+RETRY_MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 2
+RETRY_MAX_BACKOFF = 30
+
+#number of pending GUI updates above which progress-only updates are dropped
+UPDATE_QUEUE_CAPACITY = 1000
+
 #database of logs. It will be prefixed by the hostname_
 LOG_DB = 'log.db'
 
+#finished runs are written in one transaction per batch: when the batch is full, or this many seconds after its first row
+LOG_DB_BATCH_SIZE = 50
+LOG_DB_BATCH_SECONDS = 1
+
+#hours of the day (0-23) at which a shift starts, for the shift stats
+SHIFT_START_HOURS = [6, 14, 22]
+
 #number of seconds to wait for a serial connection in hwtest
 FIND_SERIAL_TIME = 45
 
@@ -44,4 +91,7 @@ MAX_STD_DEV_CORRECTABLE_BITFLIPS = 10
 
 MAX_BAD_BLOCKS = 100 #max allowed bad blocks in chip hardware test
 #MIN_BBT_BLOCKS = 3 # the minimum number of blocks needed for the bad block tables (bbt)
-MIN_BBT_BLOCKS = 0 #Temporarily setting to 0 because something seems wrong with the test
\ No newline at end of file
+MIN_BBT_BLOCKS = 0 #Temporarily setting to 0 because something seems wrong with the test
+
+HWTEST_ABORT_TIMEOUT = 10 # seconds to wait for the shell prompt after stopping a failed hwtest, to power the board off
+HWTEST_SUBTEST_TIMEOUT = 120 # seconds to wait for the next hwtest subtest line or its final banner before giving up on the board
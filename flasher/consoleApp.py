@@ -3,7 +3,7 @@
 from deviceDescriptor import DeviceDescriptor
 from ui_strings import *
 from controller import Controller
-from scheduler import call_repeatedly
+from scheduler import call_repeatedly, Scheduler
 from logging import log
 import logging
 import sys
@@ -59,7 +59,8 @@ class ConsoleView():
 		info.stateLabel: Text label for the state, such as RUNNING_TEXT
 		info.label: The label for the test case that is being run
 		info.progress: number value for progress bar
-		info.output: The output for the test case
+		info.output: Replaces the output for the port
+		info.outputDelta: Text appended to the output for the port
 		info.prompt: Any prompt to show
 		'''
 		uid = info['uid']
@@ -67,7 +68,7 @@ class ConsoleView():
 		stateLabel = info.get('stateLabel')
 		label = info.get('label')
 		progress = info.get('progress')
-		output = info.get('output')
+		outputDelta = info.get('outputDelta')
 		prompt = info.get('prompt')
 		print info
 			
@@ -80,6 +81,7 @@ if __name__ == '__main__':
 	app = ConsoleApp("Flasher")
 	try:
 		app.run()
+		Scheduler.get().wait() #the work happens on the scheduler's thread
 	except (KeyboardInterrupt, SystemExit):
 		app.stop()
     
\ No newline at end of file
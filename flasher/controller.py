@@ -2,17 +2,27 @@
 
 from os import path
 from deviceDescriptor import DeviceDescriptor
+from deviceMonitor import DeviceMonitor
+from deviceStateMachine import DeviceStateMachine
+from databaseLogger import StatsWindow
 from runState import RunState
 
 import subprocess
-import unittest
 from collections import OrderedDict
 from flasher import Flasher
 from chipHardwareTest import ChipHardwareTest
 from ui_strings import *
 from config import *
 from testingThread import TestingThread,TestResult
-from Queue import Queue
+from observable_test import TestPlan
+from mutexRegistry import MutexRegistry
+from usbTopology import UsbTopology, AdmissionScheduler
+from timingModel import TimingModel
+from retryPolicy import RetryPolicy
+from imageCache import ImageCache
+from Queue import Empty
+from collections import deque
+import threading
 import time
 import sys
 from sets import Set
@@ -27,20 +37,27 @@ from sets import Set
 
 get_class = lambda x: globals()[x]
 
+IMAGE_NAME = "rootfs.ubi" # the image whose hash is recorded with every flash
+
 class Controller():
     '''
     The main application for a GUI-based, parallel test suite runner
     '''
-    def __init__( self, log = None, testSuiteName=None ):
+    def __init__( self, log = None, testSuiteName=None, rulesFile=UDEV_RULES_FILE, devRoot='/dev' ):
+        '''
+        :param rulesFile: udev rules which name the fel, fastboot and serial nodes of each port
+        :param devRoot: directory holding those nodes. The simulator uses a temporary one
+        '''
         cwd = path.dirname( path.dirname( path.realpath( __file__ ) ) )
         self.log = log
         self.testSuiteName = testSuiteName
         self.testThreads = {}
         self.runStates = {}
         self.stateInfo = OrderedDict() # keep track of last known state info
-        self.deviceDescriptors, self.hubs = DeviceDescriptor.readRules(UDEV_RULES_FILE, SORT_DEVICES, SORT_HUBS)
-        self.deviceStates = {} # keep track of the last know state of each device. Used when polling for unplug/replugs
-        self.mutexes = {}
+        self.deviceDescriptors, self.hubs = DeviceDescriptor.readRules(rulesFile, SORT_DEVICES, SORT_HUBS, devRoot)
+        self.deviceStateMachine = None # keeps track of the last known state of each device and decides when to trigger it
+        self.mutexes = MutexRegistry(MUTEX_PERMITS) # the @mutex locks shared by every run
+        self.admission = AdmissionScheduler(UsbTopology(self.deviceDescriptors), USB_HUB_LIMIT, USB_ROOT_HUB_LIMIT) # when @bandwidth stages may run
         self.count = 0 #number of CHIPS passed thorugh
         self.autoStartOnDeviceDetection = AUTO_START_ON_DEVICE_DETECTION #This should be command line argument
         # Below is for managing the GUI via an update queue. Kivy requires thread sync on GUI updates
@@ -48,8 +65,15 @@ class Controller():
         self.updateQueue = UpdateQueue(self._triggerUpdate.__get__(self,Controller)) # A thread-safe queue for managing GUI updates in order
         self.updateQueueListeners = [] #listeners get called when something is added to queue
         self.stateListeners = []
-        self.timeoutMultiplier = 1.0 #increase on slow flashing machines
+        self.timeoutMultiplier = 1.0 #increase on slow flashing machines. Only used until the timing model has learned the stages' durations
+        self.timingModel = TimingModel() # stage durations of this host, for timeouts and progress estimates
+        self.retryPolicy = RetryPolicy() # which failed runs resume from a @resumable stage instead of failing
+        self.imageCache = ImageCache(path.join(cwd, "flasher/tools/.firmware/images")) # hashes of the images, computed in the background
         self.batchUpdates = False #whether to batch updates or send changes immediatly
+        self.deviceMonitor = None #when present, device changes are pushed to us instead of polling every port
+        self.deviceEventQueue = UpdateQueue(self._triggerUpdate.__get__(self,Controller)) # uids reported by the monitor thread, processed on the main thread
+        for suiteName in set(self.deviceStateToTestSuite.values() + filter(None, [testSuiteName])):
+            TestPlan.forSuite(get_class(suiteName)) # compiled now, so no run pays for it
 
     def configure( self ):
         '''
@@ -59,15 +83,26 @@ class Controller():
         self.rev = 0
         self.hostname = ""
         self.build_string = ""
-        currentTime = time.time()
 
         for key, deviceDescriptor in self.deviceDescriptors.iteritems():
             self.runStates[key] = RunState(key) #make a new object to store the state info
             self.stateInfo[key] = {'uid':key} #each one is a dictionary
-            self.deviceStates[key] = (DeviceDescriptor.DEVICE_NULL, currentTime)
 
-    def getStatsQueries(self,suiteName,where=None):
-        return get_class(suiteName).getStatsQueries(where)
+        self.deviceStateMachine = DeviceStateMachine(self.deviceDescriptors.keys(),
+                                                     lambda uid: self.deviceDescriptors[uid].getDeviceState(),
+                                                     lambda uid: self.runStates[uid].isDone(),
+                                                     self._onTriggerDevice)
+        self.imageCache.start()
+        self.deviceMonitor = DeviceMonitor.create(DEVICE_MONITOR, self.deviceDescriptors.values(), lambda uid: self.deviceEventQueue.put({'uid': uid}))
+        if self.deviceMonitor: # the monitor only reports changes, so take an initial look at every port
+            for uid in self.deviceDescriptors.keys():
+                self.deviceEventQueue.put({'uid': uid})
+
+    def getStatsQueries(self,suiteName,window=None):
+        '''
+        :param window: StatsWindow to compute the stats over. Defaults to today
+        '''
+        return get_class(suiteName).getStatsQueries(window or StatsWindow.today())
 
 
     def addStateListener(self,listener):
@@ -79,9 +114,11 @@ class Controller():
 
     def onPollingTick(self,dt):
         '''
-        Respond to a timer by polling for device changes
+        Respond to a timer by polling for device changes.
+        When a device monitor is running, only ports whose debounce deadline has passed are looked at
         :param dt:
         '''
+        self._processDeviceEvents()
         self._checkAndTriggerDeviceChanges(dt)
 
     def onMainButton(self, button):
@@ -121,16 +158,19 @@ class Controller():
         return name + ": Host: " + self.hostname + " | Revision: " + self.rev[0:10] + " | Firmware Build: " + self.build_string
 
     def getFileInfo(self):
-        cwd = path.dirname( path.dirname( path.realpath( __file__ ) ) )
-        try:
-            cmd = "sha1sum " + cwd + "/flasher/tools/.firmware/images/rootfs.ubi | cut -d' ' -f1"
-            self.imageInfo = subprocess.Popen( [cmd],cwd=cwd, stdout=subprocess.PIPE,shell=True ).communicate()[0].strip("\n")
-        except Exception,e:
-            self.imageInfo = "unknown"
-            print e
+        '''
+        Size, date and SHA-1 of each image. Never waits for the hashes, the ones still being computed show as such
+        '''
+        return self.imageCache.listing()
 
-        cmd = "ls -l " + cwd + "/flasher/tools/.firmware/images | cut -d' ' -f5-"
-        return subprocess.Popen( [cmd], cwd=cwd, stdout=subprocess.PIPE , shell=True).communicate()[0]
+    def getImageInfo(self):
+        '''
+        SHA-1 of the image as it is now. Waits for it if the image is new or changed and hasn't been hashed yet
+        '''
+        entry = self.imageCache.get(IMAGE_NAME)
+        if not entry:
+            return "unknown"
+        return entry['sha1']
 
     def addUpdateQueueListener(self,listener):
         '''
@@ -143,20 +183,68 @@ class Controller():
         '''
         This method is called by Kivy's Clock object before the next frame when self.kivyUpdateTrigger() has been called
         '''
+        self._processDeviceEvents()
         updated = Set()
-        while not self.updateQueue.empty(): #process everything in the queue
-            info = self.updateQueue.get()
+        for info in self.updateQueue.drain(): #process everything in the queue
             updated.add(self._processStateInfo(info))
 
         if self.batchUpdates: #this is the case where instead of updating immediately, we optimize but collecting all changes and sending at once
             for uid in updated:
                 for listener in self.stateListeners:
-                    info = self.stateInfo[uid].copy()
-
-                    if hasattr(info, 'output'):
-                        info.output = None #dont send output since its potentially big to send all the time
+                    info = self.stateInfo[uid].copy() #output is not kept in stateInfo since its potentially big to send all the time
                     listener(info)
 
+    def getOutput(self, uid):
+        '''
+        The full output of the current or last run on a port. The text is only joined when asked for
+        :param uid:
+        '''
+        return self.runStates[uid].output.getvalue()
+
+    def getDeviceStateMetrics(self):
+        '''
+        Text describing how long ports spend in each device state, e.g. how long FEL to fastboot takes
+        '''
+        return self.deviceStateMachine.formatMetrics()
+
+    def getMutexMetrics(self):
+        '''
+        Text describing how long ports wait for and hold each @mutex, e.g. what serializing FEL on "fel" costs
+        '''
+        return self.mutexes.formatMetrics()
+
+    def loadTimingHistory(self, databaseLogger):
+        '''
+        Learn the stage durations from the log database, and keep writing them there
+        :param databaseLogger: DatabaseLogger of this host
+        '''
+        self.timingModel.attach(databaseLogger)
+
+    def logRetries(self, databaseLogger):
+        '''
+        Write every failed attempt of a run to the log database
+        :param databaseLogger: DatabaseLogger of this host
+        '''
+        self.retryPolicy.attach(databaseLogger)
+
+    def getRetryMetrics(self):
+        '''
+        Text describing how many failures of each exit code were retried, and how many of those recovered
+        '''
+        return self.retryPolicy.formatMetrics()
+
+    def getTimingMetrics(self):
+        '''
+        Text describing the expected duration and learned timeout of each stage
+        '''
+        return self.timingModel.formatMetrics()
+
+    def getUsbMetrics(self):
+        '''
+        Text describing how long ports wait for room on their hubs and the upload rate of each hub and port
+        '''
+        return self.admission.formatMetrics()
+
     def setTimeoutMultiplier(self, timeoutMultiplier):
         '''
         Setter for timeoutMultiplier which is used to increase timeouts when working on a slow device
@@ -169,52 +257,24 @@ class Controller():
     def _checkAndTriggerDeviceChanges(self, dt):
         '''
         This is a Kivy.Clock callback that will see if any devices have been plugged or unplugged.
-        If so, it will start or stop their runs by triggering an event on them
+        If so, it will start or stop their runs by triggering an event on them.
+        Without a device monitor every port is polled. With one, only the expired debounce deadlines are handled
         :param dt:
         '''
+        currentTime = time.time()
+        if not self.deviceMonitor:
+            for uid, deviceDescriptor in self.deviceDescriptors.iteritems():
+                self.deviceStateMachine.onDeviceState(uid, deviceDescriptor.getDeviceState(), currentTime)
+        self.deviceStateMachine.expireDeadlines(currentTime)
+
+    def _processDeviceEvents(self):
         '''
-        Go through the device descriptors and see if any state changed
+        Handle the uids queued up by the device monitor thread
         '''
         currentTime = time.time()
-
-        for uid, deviceDescriptor in self.deviceDescriptors.iteritems():
-            currentState = deviceDescriptor.getDeviceState()
-            lastKnownState, when = self.deviceStates[uid]
-            runState = self.runStates[uid]
-            elapsedTime = currentTime - when #see how long its been since we
-            if lastKnownState != currentState: #if the state is different since last time
-                print "state : lastKnown: " + str(lastKnownState) + " current " + str(currentState) + " elapsed " + str(elapsedTime)
-                if currentState == DeviceDescriptor.DEVICE_FASTBOOT:
-                    self.deviceStates[uid] = (currentState, currentTime) #just update the time. don't trigger
-                elif currentState == DeviceDescriptor.DEVICE_DISCONNECTED:
-                    if lastKnownState == DeviceDescriptor.DEVICE_WAITING_FOR_FASTBOOT:
-                        if elapsedTime < AUTO_START_WAIT_BEFORE_DISCONNECT: # wait for possible transition.
-                            self.deviceStates[uid] = (DeviceDescriptor.DEVICE_WAITING_FOR_FASTBOOT, currentTime)
-                            continue
-                        else: # a disconnect
-                            self.deviceStates[uid] = (currentState, currentTime)
-                            self._onTriggerDevice(uid,currentState) #disconnect
-                    elif lastKnownState == DeviceDescriptor.DEVICE_FEL: #if went from fel to nothing, probably transitioning to fastboot
-                        self.deviceStates[uid] = (DeviceDescriptor.DEVICE_WAITING_FOR_FASTBOOT, currentTime)
-                        continue # don't update state info
-                    elif runState.isDone():
-                        if GRAY_OUT_ON_DISCONNECT:
-                            if elapsedTime < DONE_WAIT_BEFORE_DISCONNECT: # wait for possible transition.
-                                continue
-                        else:
-                            self.deviceStates[uid] = (currentState, currentTime)
-                            continue #dont trigger
-                    elif lastKnownState == DeviceDescriptor.DEVICE_SERIAL:
-                        self.deviceStates[uid] = (currentState, currentTime)
-                        continue #dont trigger
-
-                    self.deviceStates[uid] = (currentState, currentTime)
-                    self._onTriggerDevice(uid,currentState) #disconnect
-                else: #for FEL and serial gadget
-                    self.deviceStates[uid] = (currentState, currentTime)
-                    self._onTriggerDevice(uid,currentState)
-            else:
-                self.deviceStates[uid] = (currentState, currentTime)
+        for event in self.deviceEventQueue.drain():
+            uid = event['uid']
+            self.deviceStateMachine.onDeviceState(uid, self.deviceDescriptors[uid].getDeviceState(), currentTime)
 
 
 
@@ -226,17 +286,13 @@ class Controller():
         :param deviceState If given, it will determine what suite to run automatically.
                When runing
         '''
-        tl = unittest.TestLoader()
         if self.testSuiteName:
             suiteName = self.testSuiteName
         else:
 #         if deviceState:
             suiteName = self.deviceStateToTestSuite[deviceState]
 
-        suiteClass = get_class(suiteName)
-        suite = tl.loadTestsFromTestCase(suiteClass)
-        suite.suiteClass = suiteClass
-        return suite
+        return TestPlan.forSuite(get_class(suiteName)).makeSuite()
 
     def _getActiveThread(self,uid):
         '''
@@ -299,7 +355,7 @@ class Controller():
         testResult = TestResult()
         self.count += 1 #processing another one!
 
-        testThread = TestingThread(self.log, suite, deviceDescriptor, self.count, self.mutexes, self.updateQueue, testResult, self.timeoutMultiplier, self.imageInfo) #reesult will get written to testResult
+        testThread = TestingThread(self.log, suite, deviceDescriptor, self.count, self.mutexes, self.updateQueue, testResult, self.timeoutMultiplier, self.getImageInfo, self.admission, self.timingModel, self.retryPolicy, self.deviceMonitor) #reesult will get written to testResult
         self.testThreads[uid] = testThread
         testThread.start() #start the thread, which will call runTestSuite
 
@@ -312,6 +368,8 @@ class Controller():
         # maybe the state value, if present, should be updated here immediately? Currently the main thread will do it
         self.updateQueue.put(info)
 
+    OUTPUT_KEYS = Set(['output', 'outputDelta', 'outputSeq'])
+
     def _processStateInfo(self, info):
         '''
         update the run state and notify any listeners
@@ -320,24 +378,27 @@ class Controller():
         info.stateLabel: Text label for the state, such as RUNNING_TEXT
         info.label: The label for the test case that is being run
         info.progress: number value for progress bar
-        info.output: The output for the test case
+        info.output: Replaces the output for the port
+        info.outputDelta: Text to append to the output for the port
+        info.outputSeq: sequence number of the last chunk of output in outputDelta
         info.prompt: Any prompt to show
 
         @return the uid of the info
         '''
         uid = info['uid']
-        self.stateInfo[uid].update(info) #merge in latest state info
+        self.stateInfo[uid].update((key, value) for key, value in info.iteritems() if not key in self.OUTPUT_KEYS) #merge in latest state info
 #         print self.stateInfo[uid]
         state = info.get('state')
-        output = info.get('output')
 
         runState = self.runStates[uid]
 
         if state:
             runState.state = state
 
-        if output:
-            runState.output = output
+        if 'output' in info:
+            runState.output.reset(info['output'])
+        if info.get('outputDelta'):
+            runState.output.append(info['outputDelta'])
         if not self.batchUpdates: #update immediately
             for listener in self.stateListeners:
                 listener(info)
@@ -354,33 +415,111 @@ class Controller():
 
 
 
-class UpdateQueue(Queue):
+class UpdateQueue(object):
     '''
     Modifed from comment here: http://stackoverflow.com/questions/22031262/altering-a-kivy-property-from-another-thread
-    A Multithread safe class that calls a callback whenever an item is added
-    to the queue. Instead of having to poll or wait, you could wait to get
-    notified of additions.
+    A Multithread safe queue of state info dictionaries that calls a callback when something is added,
+    so instead of having to poll or wait, you could wait to get notified of additions.
+
+    Pending updates for the same uid are merged, so a burst of progress ticks costs one entry.
+    An update is only merged into the last pending one for its uid if it does not change a value that one already carries,
+    so every state and label change is still delivered, in order. Only the progress keeps just its latest value,
+    output deltas are concatenated, and a replacement of the output (the output key) discards pending deltas.
+    When the queue holds maxsize entries, updates which only carry progress are dropped.
+    The callback is called once, and not again until the consumer has emptied the queue, so at most once per frame.
     '''
 
+    LATEST_WINS = Set(['progress', 'output', 'outputDelta', 'outputSeq']) # keys for which only the latest value matters. The output ones are merged in _merge
+    PROGRESS_ONLY = Set(['uid', 'runId', 'progress'])
+
     notify_func = None
     parent = None
 
-    def __init__(self, notify_func, **kwargs):
+    def __init__(self, notify_func, maxsize=UPDATE_QUEUE_CAPACITY):
         '''
         :param notify_func:The function to call when adding to the queue
+        :param maxsize: number of pending entries above which progress-only updates are dropped
         '''
-        Queue.__init__(self, **kwargs)
         self.notify_func = notify_func
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.entries = deque()
+        self.tails = {} # uid -> its most recent pending entry, which later updates may be merged into
+        self.notified = False
+        self.dropped = 0 # progress updates dropped because the queue was full
+
     def put(self, info):
         '''
-        Adds a dictionary the queue and calls the callback function.
+        Adds a dictionary the queue and calls the callback function if it hasn't been called since the queue was last emptied
         '''
-        Queue.put(self, info, False)
-        self.notify_func()
+        with self.lock:
+            uid = info.get('uid')
+            tail = self.tails.get(uid)
+            if tail is not None and self._canMerge(tail, info):
+                self._merge(tail, info)
+            elif len(self.entries) >= self.maxsize and Set(info.keys()) <= self.PROGRESS_ONLY:
+                self.dropped += 1
+                return
+            else:
+                entry = dict(info)
+                self.entries.append(entry)
+                self.tails[uid] = entry
+            notify = not self.notified
+            self.notified = True
+        if notify:
+            self.notify_func()
 
     def get(self):
         '''
         Returns the next items in the queue, if non-empty, otherwise a
         :py:attr:`Queue.Empty` exception is raised.
         '''
-        return Queue.get(self, False)
+        with self.lock:
+            if not self.entries:
+                self.notified = False
+                raise Empty()
+            return self._popleft()
+
+    def drain(self):
+        '''
+        Remove and return everything in the queue, in order
+        '''
+        with self.lock:
+            entries = [self._popleft() for i in range(len(self.entries))]
+            self.notified = False
+            return entries
+
+    def empty(self):
+        with self.lock:
+            return not self.entries
+
+    def qsize(self):
+        with self.lock:
+            return len(self.entries)
+
+    def _popleft(self):
+        entry = self.entries.popleft()
+        uid = entry.get('uid')
+        if self.tails.get(uid) is entry: # nothing can be merged into an entry once it is handed out
+            del self.tails[uid]
+        return entry
+
+    def _merge(self, tail, info):
+        delta = info.get('outputDelta')
+        if 'output' in info: # a replacement makes earlier deltas irrelevant
+            tail.pop('outputDelta', None)
+        elif delta and 'output' in tail:
+            info = dict(info)
+            tail['output'] = tail['output'] + info.pop('outputDelta')
+        elif delta and 'outputDelta' in tail:
+            info = dict(info)
+            tail['outputDelta'] = tail['outputDelta'] + info.pop('outputDelta')
+        tail.update(info)
+
+    def _canMerge(self, tail, info):
+        for key, value in info.iteritems():
+            if key in self.LATEST_WINS:
+                continue
+            if key in tail and tail[key] != value:
+                return False
+        return True
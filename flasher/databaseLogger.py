@@ -1,18 +1,134 @@
+import logging
 import sqlite3 as sql
 import sys
+import threading
 import time
 import socket
 
 from subprocess import Popen
 from collections import OrderedDict
+from Queue import Queue, Empty
 # from flasher import Flasher
 from config import *
 from runState import RunState
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from datetime import time as timeOfDay
 
 get_class = lambda x: globals()[x]
+log = logging.getLogger("global") # LogManager's global log, once it is set up
+
+REBUILD_ROLLUPS = "rebuild rollups" # queued to ask the writer thread to recompute the rollups
+ROLLUP_SECONDS = 3600 # the rollups have one row per runName, port and hour
+LOCAL_OFFSET = -time.timezone # seconds east of UTC of local standard time. Rollup hours start on local hours, like the today and shift windows
+NOT_MEASURED = -1 # value of a numeric column when the test didn't measure it. Left out of the rollup averages
+
+class StatsWindow(object):
+    '''
+    A range of finish times, and optionally a run name, to compute stats over.
+    The where clause only compares the indexed epoch and runName columns with constants, so SQLite seeks instead of scanning the table
+    '''
+    def __init__(self, title, start=None, end=None, runName=None):
+        '''
+        :param title: description of the window, for display
+        :param start: first epoch second included
+        :param end: first epoch second not included
+        :param runName: only include this RUN_NAME
+        '''
+        self.title = title
+        self.start = start
+        self.end = end
+        self.runName = runName
+
+    def where(self, timeColumn='epoch'):
+        '''
+        :param timeColumn: column to compare with the window. 'hour' for the rollup tables
+        '''
+        clauses = []
+        if self.start is not None:
+            clauses.append("%s >= %d" % (timeColumn, self.start))
+        if self.end is not None:
+            clauses.append("%s < %d" % (timeColumn, self.end))
+        if self.runName is not None:
+            clauses.append("runName = '%s'" % self.runName.replace("'", "''"))
+        if not clauses:
+            return " 1 "
+        return " " + " AND ".join(clauses) + " "
+
+    @staticmethod
+    def today(now=None):
+        day = date.fromtimestamp(now or time.time())
+        return StatsWindow("today", _epoch(day), _epoch(day + timedelta(days=1)))
+
+    @staticmethod
+    def lastHours(hours, now=None):
+        '''
+        Starts at the beginning of an hour, so it can be answered from the hourly rollups
+        '''
+        start = int(now or time.time()) - int(hours * 3600)
+        return StatsWindow("last " + str(hours) + " hours", _rollupHour(start))
+
+    @staticmethod
+    def shift(now=None):
+        '''
+        The current shift. Shifts start at the hours in SHIFT_START_HOURS
+        '''
+        now = now or time.time()
+        day = date.fromtimestamp(now)
+        starts = sorted(_epoch(day + timedelta(days=offset), hour) for offset in [-1, 0, 1] for hour in SHIFT_START_HOURS)
+        start = max(start for start in starts if start <= now)
+        end = min(end for end in starts if end > start)
+        return StatsWindow("this shift", start, end)
+
+    @staticmethod
+    def run(runName=RUN_NAME):
+        return StatsWindow("run " + runName, runName=runName)
+
+class StageTimes():
+    '''
+    The table of stage durations written for the TimingModel. One row per stage run, with the common columns
+    '''
+    @staticmethod
+    def statsTableName():
+        return "stage_time"
+
+    @staticmethod
+    def statsTableColumns():
+        return [['suite', 'TEXT', ''], ['stage', 'TEXT', ''], ['seconds', 'REAL', NOT_MEASURED]]
+
+class RetryAttempts():
+    '''
+    The table of failed attempts written for the RetryPolicy. One row per failed attempt of a run, with the common columns
+    '''
+    @staticmethod
+    def statsTableName():
+        return "retry_attempt"
+
+    @staticmethod
+    def statsTableColumns():
+        return [['suite', 'TEXT', ''], ['stage', 'TEXT', ''], ['attempt', 'INTEGER', 0], ['resumeStage', 'TEXT', '']]
+
+UNROLLED_TABLES = set([StageTimes.statsTableName(), RetryAttempts.statsTableName()]) # written for the TimingModel and RetryPolicy, which no stats query sums
+
+def _epoch(day, hour=0):
+    return int(time.mktime(datetime.combine(day, timeOfDay(hour)).timetuple()))
+
+def _rollupHour(epoch):
+    '''
+    :return the start of the rollup row an epoch second falls in
+    '''
+    return epoch - (epoch + LOCAL_OFFSET) % ROLLUP_SECONDS
+
+def _rollupHourSql(column):
+    return '({0} - ({0} + {1}) % {2})'.format(column, LOCAL_OFFSET, ROLLUP_SECONDS)
 
 class DatabaseLogger():
+    '''
+    Writes a row for every finished run to a table per test suite.
+    Rows are handed to a writer thread, which owns its own connection and commits them in batches,
+    so the thread reporting the result (normally the GUI) never waits on the disk.
+    Next to each suite's table, <table>_rollup and <table>_rollup_errors hold per runName, port and local hour totals.
+    They are updated in the same transaction as the rows, so stats only have to sum a few rollup rows.
+    '''
     COMMON_COLUMNS = [
         ['chipId','TEXT'], #id of the CHIP from a barcode/QR code on the chip itself
         ['timestamp', 'TIMESTAMP'],   #time when test finished
@@ -21,16 +137,25 @@ class DatabaseLogger():
         ['elapsedTime', 'INTEGER'], #how long it took in seconds
         ['port', 'TEXT'], #the name (number) of the port
         ['computer', 'TEXT'], #hostname
-        ['runName','TEXT'] #RUN_NAME in the config file
+        ['runName','TEXT'], #RUN_NAME in the config file
+        ['epoch', 'INTEGER'] #timestamp as seconds since 1970, indexed for range queries
     ]
+    INDEXES = [['epoch'], ['result', 'epoch'], ['error', 'epoch'], ['runName', 'epoch']]
 
-    TODAY = " strftime('%Y-%m-%d', timestamp) == strftime('%Y-%m-%d', datetime('now','localtime')) "
+    def today(self):
+        return StatsWindow.today()
 
     def computeAndFormatStats(self,queries):
         return self.formatStats(self.computeStats(queries))
 
     def computeStats(self,queries):
+        '''
+        Called from the UI thread, so it never waits for the writer
+        :return the stats, empty while existing tables are still being migrated since the queries need the epoch column
+        '''
         dict = OrderedDict()
+        if not self.migrated.is_set():
+            return dict
         try:
             for query in queries:
                 self.con.row_factory = sql.Row
@@ -54,8 +179,8 @@ class DatabaseLogger():
                             dict[keyField][value] = valFieldValue
                         elif not '_val' in field:
                             dict[row.keys()[i]] = row[i]
-        except Exception,e:
-            print e
+        except Exception:
+            log.exception("Could not compute stats")
         return dict
 
     def formatStats(self,stats,level=0):
@@ -71,6 +196,8 @@ class DatabaseLogger():
         return formatted
 
     def _fileName(self):
+        if self.fileName:
+            return self.fileName
         return self.hostName + "_" + LOG_DB
 
     def launchSqlitebrowser(self):
@@ -80,40 +207,70 @@ class DatabaseLogger():
             print e
 
     def __init__( self, **kwargs ):
-        self.con = None
+        '''
+        :param fileName: database file to use instead of hostname_LOG_DB
+        :param batchSize: max rows per transaction
+        :param batchSeconds: max seconds a row waits for its batch to fill
+        '''
+        self.con = None # used for reading stats. Writes go through the writer thread
         self.hostName = socket.gethostname()
+        self.fileName = kwargs.get('fileName')
+        self.batchSize = kwargs.get('batchSize', LOG_DB_BATCH_SIZE)
+        self.batchSeconds = kwargs.get('batchSeconds', LOG_DB_BATCH_SECONDS)
+        self.queue = Queue()
+        self.writer = None
+        self.tables = {} # statsTableName -> INSERT statement. Only touched by the writer thread
+        self.migrated = threading.Event() # set once the writer has brought existing tables up to date
         if 'LOG_DB' in globals():
             try:
                 self.con = sql.connect(self._fileName(),detect_types=sql.PARSE_DECLTYPES)
+                self.con.execute('PRAGMA journal_mode=WAL') # readers don't block the writer, and a commit is one append to the log
             except Exception,e:
                 print e
-
-    def __del__(self):
+        if not self.con:
+            self.migrated.set()
         if self.con:
-            self.con.close()
+            self.writer = threading.Thread(target=self._runWriter, name="DatabaseLogger")
+            self.writer.daemon = True
+            self.writer.start()
 
-    def _formattedColumns(self,suiteClass):
-        cols = list(self.COMMON_COLUMNS) #copy common ones
-        if hasattr(suiteClass,'statsTableColumns'):
-            cols.extend(suiteClass.statsTableColumns())
+    def __del__(self):
+        self.close()
 
-        formattedColumns = ', '.join(item[0] + ' ' + item[1] for item in cols) #make a comma separated string of space-separated fields
-        return formattedColumns
+    def rebuildRollups(self):
+        '''
+        Recompute every rollup table from the raw rows, for example after rows were edited or deleted by hand.
+        Blocks until done
+        '''
+        if self.writer:
+            self.queue.put(REBUILD_ROLLUPS)
+            self.flush()
 
-    def _createTableIfNeeded(self,suiteClass):
-        create = 'create table if not exists {0} ({1})'.format(suiteClass.statsTableName(), self._formattedColumns(suiteClass))
-        try:
-            self.con.execute(create)
-            self.con.commit()
-        except Exception,e:
-            print e
+    def flush(self):
+        '''
+        Block until every row handed over so far is committed
+        '''
+        if self.writer:
+            self.queue.join()
 
+    def close(self):
+        '''
+        Write out the pending rows, stop the writer thread and close the database. Call on shutdown
+        '''
+        if self.writer:
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
+        if self.con:
+            self.con.close()
+            self.con = None
 
     def onUpdateStateInfo(self, info):
         '''
         Observer callback from main thread. See Controller for details on params
+        Only builds the row. It is written by the writer thread
         '''
-        if not self.con: #no database connection, so ignore
+        if not self.writer: #no database connection, so ignore
             return
         state = info.get('state')
         if not state in [RunState.PASS_STATE, RunState.FAIL_STATE]: #skip non ending states
@@ -122,48 +279,261 @@ class DatabaseLogger():
         if not suiteClass or not hasattr(suiteClass,'statsTableName'): #ignore if this test doesnt have a db table
             return
 
-        uid = info['uid']
-        state = info.get('state')
-        errorNumber = info.get('errorNumber')
         returnValues = info.get('returnValues')
-        elapsedTime = info.get('elapsedTime')
-        chipId = info.get('chipId')
-        self._createTableIfNeeded(suiteClass)
-        fields = []
-        for field in self.COMMON_COLUMNS:
-            fields.append(field[0])
-        values = ["'" + str(chipId) + "'", #chipId
-                  "'" + str(datetime.fromtimestamp(time.time())) + "'", #timestamp
-                  '1' if state == RunState.PASS_STATE else '0', #result
-                  str(errorNumber), #error
-                  str(elapsedTime), #elapsed
-                  "'" + str(uid) + "'", #port
-                  "'" + self.hostName + "'", #computer
-                  "'" + RUN_NAME + "'"
+        now = time.time()
+        values = [str(info.get('chipId')), #chipId
+                  datetime.fromtimestamp(now), #timestamp
+                  1 if state == RunState.PASS_STATE else 0, #result
+                  info.get('errorNumber'), #error
+                  info.get('elapsedTime'), #elapsed
+                  str(info['uid']), #port
+                  self.hostName, #computer
+                  RUN_NAME,
+                  int(now) #epoch
                 ]
-        #now add in any fields and values from the dictionary for the specific test
+        #now add in any values from the dictionary for the specific test
         if hasattr(suiteClass,'statsTableColumns'):
             for col in suiteClass.statsTableColumns():
-                fieldName = col[0]
-                fields.append(fieldName)
-                value = returnValues.get(fieldName)
+                value = returnValues.get(col[0])
                 if value is None:
                     value = col[2] #use default
-                if col[1] == "TEXT":
-                    value = "'" + value + "'"
-                values.append(str(value)) #look up the field in the dictionary
+                values.append(value)
+        self.queue.put((suiteClass, values))
+
+    def logStageTime(self, suite, stage, port, seconds, passed):
+        '''
+        Write the duration of one stage, for the TimingModel to read back on the next start
+        :param suite: name of the suite class
+        :param stage: name of the test method
+        '''
+        if not self.writer:
+            return
+        now = time.time()
+        self.queue.put((StageTimes, [None, datetime.fromtimestamp(now), 1 if passed else 0, 0, int(seconds), str(port), self.hostName, RUN_NAME, int(now),
+                                     suite, stage, seconds]))
 
-#         print fields
-#         print values
+    def logRetryAttempt(self, suite, stage, port, attempt, exitCode, resumeStage, seconds):
+        '''
+        Write a failed attempt of a run
+        :param stage: name of the test method that failed
+        :param attempt: 1 for the first one
+        :param exitCode: stored in the error column
+        :param resumeStage: the test the next attempt starts from, "" if the run gave up
+        '''
+        if not self.writer:
+            return
+        now = time.time()
+        self.queue.put((RetryAttempts, [None, datetime.fromtimestamp(now), 0, exitCode, int(seconds), str(port), self.hostName, RUN_NAME, int(now),
+                                        suite, stage, attempt, resumeStage]))
 
-        query = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(suiteClass.statsTableName(),','.join(fields),','.join(values))
-        print "Writing to database:\n"
-        print query
+    def loadStageTimes(self, limit):
+        '''
+        :param limit: number of rows to read at most
+        :return (port, suite, stage, seconds) of the latest stages that passed on this host, newest first
+        '''
+        if not self.con:
+            return []
+        self.migrated.wait()
         try:
-            self.con.execute(query)
-            self.con.commit()
-        except Exception, e:
-            print e
+            return self.con.execute('SELECT port, suite, stage, seconds FROM {0} WHERE computer=? AND result=1 ORDER BY epoch DESC LIMIT ?'.format(
+                StageTimes.statsTableName()), (self.hostName, limit)).fetchall()
+        except sql.OperationalError: # no stage has been written yet
+            return []
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _columns(self,suiteClass):
+        cols = list(self.COMMON_COLUMNS) #copy common ones
+        if hasattr(suiteClass,'statsTableColumns'):
+            cols.extend(suiteClass.statsTableColumns())
+        return cols
+
+    def _formattedColumns(self,suiteClass):
+        return ', '.join(item[0] + ' ' + item[1] for item in self._columns(suiteClass)) #make a comma separated string of space-separated fields
+
+    def _insertStatement(self, con, suiteClass):
+        '''
+        Create the table the first time a suite is seen, and build its statements once.
+        The same text is used for every row, so sqlite3's statement cache keeps them prepared
+        '''
+        tableName = suiteClass.statsTableName()
+        if not tableName in self.tables:
+            con.execute('create table if not exists {0} ({1})'.format(tableName, self._formattedColumns(suiteClass)))
+            self._migrateTable(con, tableName)
+            fields = [col[0] for col in self._columns(suiteClass)]
+            self.tables[tableName] = ('INSERT INTO {0} ({1}) VALUES ({2})'.format(tableName, ','.join(fields), ','.join('?' * len(fields))),
+                                      fields, None if tableName in UNROLLED_TABLES else self._rollupStatements(con, tableName))
+        return self.tables[tableName]
+
+    def _measures(self, con, tableName):
+        '''
+        :return the numeric columns particular to a suite, which get a sum and a count in the rollup
+        '''
+        common = [col[0] for col in self.COMMON_COLUMNS]
+        return [row[1] for row in con.execute('PRAGMA table_info({0})'.format(tableName)) if not row[1] in common and row[2] in ['INTEGER', 'REAL']]
+
+    def _createRollups(self, con, tableName):
+        '''
+        :return True if the rollup tables didn't exist yet
+        '''
+        created = not con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (tableName + '_rollup',)).fetchone()
+        measures = ''.join(', {0}_sum REAL DEFAULT 0, {0}_n INTEGER DEFAULT 0'.format(measure) for measure in self._measures(con, tableName))
+        con.execute('CREATE TABLE IF NOT EXISTS {0}_rollup (runName TEXT, port TEXT, hour INTEGER, total INTEGER DEFAULT 0, passed INTEGER DEFAULT 0, '
+                    'passedElapsedTime INTEGER DEFAULT 0{1}, PRIMARY KEY (runName, port, hour))'.format(tableName, measures))
+        con.execute('CREATE TABLE IF NOT EXISTS {0}_rollup_errors (runName TEXT, port TEXT, hour INTEGER, error INTEGER, count INTEGER DEFAULT 0, '
+                    'PRIMARY KEY (runName, port, hour, error))'.format(tableName))
+        con.execute('CREATE INDEX IF NOT EXISTS {0}_rollup_hour ON {0}_rollup (hour)'.format(tableName))
+        con.execute('CREATE INDEX IF NOT EXISTS {0}_rollup_errors_hour ON {0}_rollup_errors (hour)'.format(tableName))
+        return created
+
+    def _rollupStatements(self, con, tableName):
+        '''
+        Statements to add one row to the rollups: make sure the group exists, then add to it
+        '''
+        measures = self._measures(con, tableName)
+        key = ' WHERE runName=? AND port=? AND hour=?'
+        return {'measures': measures,
+                'insert': 'INSERT OR IGNORE INTO {0}_rollup (runName, port, hour) VALUES (?,?,?)'.format(tableName),
+                'update': 'UPDATE {0}_rollup SET total=total+1, passed=passed+?, passedElapsedTime=passedElapsedTime+?{1}'.format(
+                    tableName, ''.join(', {0}_sum={0}_sum+?, {0}_n={0}_n+?'.format(measure) for measure in measures)) + key,
+                'insertError': 'INSERT OR IGNORE INTO {0}_rollup_errors (runName, port, hour, error) VALUES (?,?,?,?)'.format(tableName),
+                'updateError': 'UPDATE {0}_rollup_errors SET count=count+1'.format(tableName) + key + ' AND error=?'}
+
+    def _rollUp(self, con, statements, row):
+        '''
+        Add one row to the rollups
+        :param row: dictionary of column name to value
+        '''
+        key = (row['runName'], row['port'], _rollupHour(row['epoch']))
+        passed = 1 if row['result'] else 0
+        values = [passed, (row['elapsedTime'] or 0) * passed]
+        for measure in statements['measures']:
+            value = row.get(measure)
+            measured = value is not None and value != NOT_MEASURED
+            values.extend([value if measured else 0, 1 if measured else 0])
+        con.execute(statements['insert'], key)
+        con.execute(statements['update'], values + list(key))
+        if row['error']:
+            con.execute(statements['insertError'], key + (row['error'],))
+            con.execute(statements['updateError'], key + (row['error'],))
+
+    def _rebuildRollup(self, con, tableName):
+        '''
+        Recompute the rollups of a table from its rows. Expects to run inside a transaction
+        '''
+        log.info("Rebuilding rollups of %s", tableName)
+        measures = self._measures(con, tableName)
+        group = " FROM {0} WHERE epoch IS NOT NULL GROUP BY runName, port, hour".format(tableName)
+        hour = _rollupHourSql('epoch') + ' AS hour'
+        con.execute('DELETE FROM {0}_rollup'.format(tableName))
+        con.execute('DELETE FROM {0}_rollup_errors'.format(tableName))
+        con.execute('INSERT INTO {0}_rollup (runName, port, hour, total, passed, passedElapsedTime{1}) '
+                    'SELECT runName, port, {2}, count(*), sum(result=1), total(CASE WHEN result=1 THEN elapsedTime ELSE 0 END){3}'.format(
+                        tableName, ''.join(', {0}_sum, {0}_n'.format(measure) for measure in measures), hour,
+                        ''.join(', total(CASE WHEN {0} != {1} THEN {0} ELSE 0 END), sum({0} IS NOT NULL AND {0} != {1})'.format(measure, NOT_MEASURED)
+                                for measure in measures)) + group)
+        con.execute('INSERT INTO {0}_rollup_errors (runName, port, hour, error, count) SELECT runName, port, {1}, error, count(*)'.format(tableName, hour)
+                    + group.replace('WHERE', 'WHERE error != 0 AND') + ', error')
+
+    def _migrateTable(self, con, tableName):
+        '''
+        Bring a table written by an older version up to date: add the epoch column and fill it in from the timestamps,
+        create the indexes, and create and fill the rollup tables of a suite's table.
+        Rollups of the tables no stats read are dropped, and rollups with hours that don't start on a local hour are rebuilt
+        '''
+        columns = [row[1] for row in con.execute('PRAGMA table_info({0})'.format(tableName))]
+        if not 'timestamp' in columns or not 'runName' in columns: # not one of ours
+            return
+        with con:
+            if not 'epoch' in columns:
+                log.info("Adding epoch column to %s", tableName)
+                con.execute('ALTER TABLE {0} ADD COLUMN epoch INTEGER'.format(tableName))
+                con.execute("UPDATE {0} SET epoch = CAST(strftime('%s', timestamp, 'utc') AS INTEGER)".format(tableName)) # timestamps are local time
+            for index in self.INDEXES:
+                con.execute('CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({2})'.format(tableName, '_'.join(index), ','.join(index)))
+            if tableName in UNROLLED_TABLES:
+                con.execute('DROP TABLE IF EXISTS {0}_rollup'.format(tableName))
+                con.execute('DROP TABLE IF EXISTS {0}_rollup_errors'.format(tableName))
+            elif self._createRollups(con, tableName) or con.execute('SELECT 1 FROM {0}_rollup WHERE hour != {1} LIMIT 1'.format(
+                    tableName, _rollupHourSql('hour'))).fetchone():
+                self._rebuildRollup(con, tableName)
+
+    def _migrate(self, con):
+        try:
+            for row in con.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
+                self._migrateTable(con, row[0])
+        except Exception:
+            log.exception("Could not migrate the database")
+        self.migrated.set()
+
+    def _runWriter(self):
+        con = sql.connect(self._fileName(), detect_types=sql.PARSE_DECLTYPES)
+        con.execute('PRAGMA synchronous=NORMAL') # with WAL, a power cut can lose the last batch but not corrupt the database
+        self._migrate(con)
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            deadline = time.time() + self.batchSeconds
+            while batch[-1] is not None and len(batch) < self.batchSize:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except Empty:
+                    break
+            if batch[-1] is None: # close() was called
+                stopping = True
+            self._write(con, [row for row in batch if row is not None])
+            for row in batch:
+                self.queue.task_done()
+        con.close()
+
+    def _write(self, con, batch):
+        '''
+        Commit a batch. If that fails, the tables are checked again, since one may have been dropped or altered by hand, and the batch is tried once more
+        '''
+        if not batch:
+            return
+        try:
+            self._writeBatch(con, batch)
+            return
+        except Exception:
+            log.warning("Could not write %d rows to the database, trying again", len(batch), exc_info=True)
+            self.tables = {}
+        try:
+            self._writeBatch(con, batch)
+        except Exception:
+            log.exception("Could not write %d rows to the database, dropping them", len(batch))
+            self.tables = {}
+
+    def _writeBatch(self, con, batch):
+        with con: # one transaction for the whole batch, rows and rollups together
+            for item in batch:
+                if item is REBUILD_ROLLUPS:
+                    for row in con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '%\\_rollup' ESCAPE '\\'").fetchall():
+                        self._rebuildRollup(con, row[0][:-len('_rollup')])
+                    continue
+                suiteClass, values = item
+                insert, fields, rollupStatements = self._insertStatement(con, suiteClass)
+                con.execute(insert, values)
+                if rollupStatements:
+                    self._rollUp(con, rollupStatements, dict(zip(fields, values)))
+
+def _rebuild(fileName):
+    logger = DatabaseLogger(fileName=fileName)
+    logger.rebuildRollups()
+    logger.close()
 
+def main():
+    '''
+    Recompute the rollups of a database, by default this host's
+    '''
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        return _rebuild(sys.argv[2] if len(sys.argv) > 2 else None)
+    print "usage: databaseLogger.py rebuild [file]"
 
+if __name__ == "__main__":
+    exit(main())
 
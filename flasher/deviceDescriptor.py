@@ -52,7 +52,7 @@ class DeviceDescriptor:
     
     
     @staticmethod
-    def readRules(rulesFilePath, sortDevices = True, sortHubs = True):
+    def readRules(rulesFilePath, sortDevices = True, sortHubs = True, devRoot = '/dev'):
         '''
         Parse a udev file and construct a map of descriptors which map fel, fastboot, and serial to a physical port
         The symlink should have format: chip_[id]_[hub]_[fel | fastboot | serial]
@@ -64,6 +64,7 @@ class DeviceDescriptor:
         If sortDevices is true, then the dictionary will be sorted by id, numerically. If it is not numeric, it will not work
         If sort hubs is true, then it will sort the hubs alphabetically
         :param rulesFilePath:
+        :param devRoot: directory the symlinks are created in. Something else than /dev is only useful for the simulator
         '''
         descriptorMap = OrderedDict() #preserve order from udev file
         hubs = []
@@ -86,7 +87,7 @@ class DeviceDescriptor:
                     else:
                         descriptor = DeviceDescriptor(uid,hub,kernel,vendor,product,type)
                         descriptorMap[uid] = descriptor
-                    device = '/dev/' + symlink  
+                    device = devRoot + '/' + symlink
                     
                     # currently using vid_pid to determine type. The "type" field could be used instead  
                     if vendor == '1f3a' and product == 'efe8':
@@ -0,0 +1,220 @@
+import abc
+import logging
+import os
+import select
+import struct
+import threading
+import time
+import ctypes
+import ctypes.util
+from os import path
+
+try:
+    import pyudev # optional. Used to receive netlink events straight from udev
+except ImportError:
+    pyudev = None
+
+# inotify constants from <sys/inotify.h>
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_ATTRIB = 0x00000004
+INOTIFY_EVENT_FORMAT = 'iIII' # wd, mask, cookie, len. Followed by len bytes of name
+INOTIFY_EVENT_SIZE = struct.calcsize(INOTIFY_EVENT_FORMAT)
+log = logging.getLogger("global") # LogManager's global log, once it is set up
+
+class DeviceMonitor(object):
+    '''
+    Watches for device nodes (the fel, fastboot and serial symlinks from the udev rules) appearing and disappearing.
+    Instead of the Controller polling every port every second, a monitor calls its callback with the uid
+    of the port whose nodes changed. The Controller then re-evaluates only that port.
+    Subclasses supply the actual event source, and select on it together with wakeRead so stop can end their thread.
+    '''
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, deviceDescriptors, callback):
+        '''
+        :param deviceDescriptors: iterable of DeviceDescriptor objects to watch
+        :param callback: called with the uid of a device whenever one of its nodes changes. Called from the monitor's thread
+        '''
+        self.callback = callback
+        self.nodes = {} # maps the path of a device node to the uid of its descriptor
+        for deviceDescriptor in deviceDescriptors:
+            for node in [deviceDescriptor.fel, deviceDescriptor.fastboot, deviceDescriptor.serial]:
+                if node:
+                    self.nodes[node] = deviceDescriptor.uid
+        self.kernels = dict((deviceDescriptor.kernel, deviceDescriptor.uid) for deviceDescriptor in deviceDescriptors)
+        self.thread = None
+        self.stopped = False
+        self.condition = threading.Condition() # notified after every event, for waitFor
+        self.wakeRead, self.wakeWrite = os.pipe() # written to by stop, to wake the thread up
+
+    @staticmethod
+    def create(kind, deviceDescriptors, callback):
+        '''
+        Factory for monitors.
+        :param kind: "udev", "inotify", "poll" or "auto". "auto" will use udev if pyudev is available, else inotify
+        :return a started monitor, or None if devices should be polled
+        '''
+        monitor = None
+        try:
+            if kind in ["udev", "auto"] and pyudev:
+                monitor = UdevDeviceMonitor(deviceDescriptors, callback)
+            elif kind in ["inotify", "auto"]:
+                monitor = InotifyDeviceMonitor(deviceDescriptors, callback)
+        except Exception:
+            log.exception("Could not create device monitor, falling back to polling")
+            return None
+        if monitor:
+            monitor.start()
+        return monitor
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True # don't keep the app alive
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Wake the thread up, wait for it to end, and close the descriptors it was reading. Does nothing the second time
+        '''
+        if self.stopped:
+            return
+        self.stopped = True
+        with self.condition:
+            self.condition.notifyAll()
+        os.write(self.wakeWrite, 'x')
+        if self.thread:
+            self.thread.join()
+        self._close()
+
+    def waitFor(self, condition, timeout):
+        '''
+        Block until condition is true, checking it again after each device event instead of polling.
+        Can be called from any thread but the monitor's
+        :param condition: function returning whether the device is in the state waited for, e.g. deviceDescriptor.isFastBoot
+        :param timeout: seconds
+        :return whether it became true. Once the monitor is stopped, whether it is true now
+        '''
+        deadline = time.time() + timeout
+        with self.condition:
+            while not condition():
+                remaining = deadline - time.time()
+                if remaining <= 0 or self.stopped:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def _notify(self, uid):
+        if uid is not None and not self.stopped:
+            self.callback(uid)
+        with self.condition:
+            self.condition.notifyAll()
+
+    @abc.abstractmethod
+    def _run(self):
+        '''
+        The monitor thread: wait for events and _notify the uid of each until stopped
+        '''
+
+    def _close(self):
+        for fd in [self.wakeRead, self.wakeWrite]:
+            os.close(fd)
+
+
+class UdevDeviceMonitor(DeviceMonitor):
+    '''
+    Receives udev events over netlink. Events arrive after udev has run its rules, so the symlinks already exist (or are gone)
+    '''
+    def __init__(self, deviceDescriptors, callback):
+        DeviceMonitor.__init__(self, deviceDescriptors, callback)
+        self.context = pyudev.Context()
+        self.monitor = pyudev.Monitor.from_netlink(self.context)
+        self.monitor.filter_by('usb')
+        self.monitor.filter_by('tty')
+
+    def _uidForDevice(self, device):
+        '''
+        Match the event's sysfs path against the KERNELS value from the rules file, e.g. 1-1.2
+        '''
+        for link in device.get('DEVLINKS', '').split():
+            if link in self.nodes:
+                return self.nodes[link]
+        for part in device.device_path.split('/'):
+            if part in self.kernels:
+                return self.kernels[part]
+        return None
+
+    def _run(self):
+        self.monitor.start()
+        while not self.stopped:
+            readable, writable, failed = select.select([self.monitor, self.wakeRead], [], [])
+            if self.stopped or not self.monitor in readable:
+                break
+            device = self.monitor.poll(timeout=0) # one is ready, so this doesn't block
+            if device and device.action in ['add', 'remove', 'change', 'bind', 'unbind']:
+                self._notify(self._uidForDevice(device))
+
+
+class InotifyDeviceMonitor(DeviceMonitor):
+    '''
+    Fallback for systems without pyudev. Watches the directories holding the device symlinks (normally /dev)
+    for entries being created or removed.
+    '''
+    def __init__(self, deviceDescriptors, callback):
+        DeviceMonitor.__init__(self, deviceDescriptors, callback)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        self.watches = {} # watch descriptor -> directory
+        for directory in set(path.dirname(node) for node in self.nodes):
+            wd = self.libc.inotify_add_watch(self.fd, directory, IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ATTRIB)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed for " + directory)
+            self.watches[wd] = directory
+
+    def _close(self):
+        os.close(self.fd)
+        DeviceMonitor._close(self)
+
+    def _run(self):
+        while not self.stopped:
+            readable, writable, failed = select.select([self.fd, self.wakeRead], [], [])
+            if self.stopped or not self.fd in readable:
+                break
+            try:
+                buf = os.read(self.fd, 4096)
+            except OSError:
+                break
+            offset = 0
+            while offset + INOTIFY_EVENT_SIZE <= len(buf):
+                wd, mask, cookie, length = struct.unpack_from(INOTIFY_EVENT_FORMAT, buf, offset)
+                offset += INOTIFY_EVENT_SIZE
+                name = buf[offset:offset + length].rstrip('\0')
+                offset += length
+                directory = self.watches.get(wd)
+                if directory and name:
+                    self._notify(self.nodes.get(path.join(directory, name)))
+
+
+class FakeDeviceMonitor(DeviceMonitor):
+    '''
+    An event source for testing without hardware. The device nodes are plain files (normally in a temp directory)
+    which are created and removed by plug and unplug, with the event delivered synchronously
+    '''
+    def start(self):
+        pass
+
+    def _run(self):
+        pass # events are delivered by plug and unplug
+
+    def plug(self, node):
+        open(node, 'a').close()
+        self._notify(self.nodes.get(node))
+
+    def unplug(self, node):
+        if path.exists(node):
+            os.remove(node)
+        self._notify(self.nodes.get(node))
@@ -0,0 +1,167 @@
+import heapq
+import itertools
+import logging
+from collections import OrderedDict
+from deviceDescriptor import DeviceDescriptor
+from metrics import Histogram
+from config import AUTO_START_WAIT_BEFORE_DISCONNECT, DONE_WAIT_BEFORE_DISCONNECT, GRAY_OUT_ON_DISCONNECT
+
+log = logging.getLogger("global") # LogManager's global log, once it is set up
+
+# Actions of the transition table
+NONE = 0 # nothing changed
+COMMIT = 1 # remember the new state, but don't trigger the device
+TRIGGER = 2 # remember the new state and trigger the device (start a run or handle a disconnect)
+WAIT_FOR_FASTBOOT = 3 # FEL went away. Probably on its way to fastboot, so wait before calling it a disconnect
+HOLD = 4 # keep the last state for a while in case the device comes back
+
+DEVICE_STATES = [DeviceDescriptor.DEVICE_NULL, DeviceDescriptor.DEVICE_DISCONNECTED, DeviceDescriptor.DEVICE_FEL,
+                 DeviceDescriptor.DEVICE_FASTBOOT, DeviceDescriptor.DEVICE_SERIAL, DeviceDescriptor.DEVICE_WAITING_FOR_FASTBOOT]
+STATE_NAMES = {DeviceDescriptor.DEVICE_NULL: "null", DeviceDescriptor.DEVICE_DISCONNECTED: "disconnected",
+               DeviceDescriptor.DEVICE_FEL: "fel", DeviceDescriptor.DEVICE_FASTBOOT: "fastboot",
+               DeviceDescriptor.DEVICE_SERIAL: "serial", DeviceDescriptor.DEVICE_WAITING_FOR_FASTBOOT: "waiting for fastboot"}
+
+def _rule(lastKnownState, currentState, isDone, expired):
+    '''
+    The debounce rules, evaluated once per combination when the table is compiled
+    :param lastKnownState: state the port was last settled in
+    :param currentState: state the device nodes show now
+    :param isDone: whether the port's run is in a PASS or FAIL state
+    :param expired: whether the port's deadline has passed
+    '''
+    if lastKnownState == currentState:
+        return NONE
+    if currentState == DeviceDescriptor.DEVICE_FASTBOOT:
+        return COMMIT # just update the time. don't trigger
+    if currentState == DeviceDescriptor.DEVICE_DISCONNECTED:
+        if lastKnownState == DeviceDescriptor.DEVICE_WAITING_FOR_FASTBOOT:
+            return TRIGGER if expired else NONE # still inside the wait for fastboot
+        if lastKnownState == DeviceDescriptor.DEVICE_FEL: # if went from fel to nothing, probably transitioning to fastboot
+            return WAIT_FOR_FASTBOOT
+        if isDone:
+            if GRAY_OUT_ON_DISCONNECT:
+                return TRIGGER if expired else HOLD
+            return COMMIT # dont trigger
+        if lastKnownState == DeviceDescriptor.DEVICE_SERIAL:
+            return COMMIT # dont trigger
+        return TRIGGER # disconnect
+    return TRIGGER # for FEL and serial gadget
+
+def _compile():
+    table = {}
+    for lastKnownState in DEVICE_STATES:
+        for currentState in DEVICE_STATES:
+            for isDone in [False, True]:
+                for expired in [False, True]:
+                    table[(lastKnownState, currentState, isDone, expired)] = _rule(lastKnownState, currentState, isDone, expired)
+    return table
+
+TRANSITIONS = _compile()
+DEADLINES = {WAIT_FOR_FASTBOOT: AUTO_START_WAIT_BEFORE_DISCONNECT, HOLD: DONE_WAIT_BEFORE_DISCONNECT} # seconds, for actions that arm one
+
+
+class DeviceStateMachine(object):
+    '''
+    Tracks the settled state of every port and decides, from the compiled transition table,
+    when a change of the device nodes should trigger the port.
+    Work is only done when a device event arrives or when a port's deadline passes. Deadlines come from a single heap.
+    The time spent in each state, and on each transition, is recorded so the wait constants in config can be tuned.
+    '''
+    def __init__(self, uids, getDeviceState, isDone, trigger):
+        '''
+        :param uids: ports to track
+        :param getDeviceState: function(uid) returning the current DeviceDescriptor.DEVICE_* state of a port
+        :param isDone: function(uid) returning whether the port's run has finished
+        :param trigger: function(uid, deviceState) called when the port should be triggered
+        '''
+        self.getDeviceState = getDeviceState
+        self.isDone = isDone
+        self.trigger = trigger
+        self.states = {} # uid -> (settled state, time it was entered)
+        self.deadlines = {} # uid -> time its deadline passes
+        self.heap = [] # (time, sequence, uid). Entries that no longer match self.deadlines are skipped
+        self.sequence = itertools.count()
+        self.dwell = OrderedDict((state, Histogram()) for state in DEVICE_STATES) # time spent in each state
+        self.transitions = {} # (from, to) -> Histogram of the time spent in "from" before going to "to"
+        for uid in uids:
+            self.states[uid] = (DeviceDescriptor.DEVICE_NULL, None)
+
+    def onDeviceState(self, uid, currentState, now):
+        '''
+        Feed the current state of a port's device nodes, normally after a device event
+        '''
+        deadline = self.deadlines.get(uid)
+        self._apply(uid, currentState, now, deadline is not None and now >= deadline)
+
+    def expireDeadlines(self, now):
+        '''
+        Re-evaluate the ports whose deadline has passed
+        '''
+        while self.heap and self.heap[0][0] <= now:
+            when, sequence, uid = heapq.heappop(self.heap)
+            if self.deadlines.get(uid) != when: # cancelled or re-armed since
+                continue
+            self._apply(uid, self.getDeviceState(uid), now, True)
+
+    def hasDeadlines(self):
+        return bool(self.deadlines)
+
+    def getState(self, uid):
+        return self.states[uid][0]
+
+    def formatMetrics(self):
+        '''
+        :return text describing how long ports spend in each state and transition
+        '''
+        lines = ["Time in state (seconds):"]
+        for state, histogram in self.dwell.iteritems():
+            if histogram.count:
+                lines.append("   " + STATE_NAMES[state] + ": " + histogram.format())
+        lines.append("Transitions (seconds before the change):")
+        for (fromState, toState), histogram in sorted(self.transitions.iteritems()):
+            lines.append("   " + STATE_NAMES[fromState] + " -> " + STATE_NAMES[toState] + ": " + histogram.format())
+        return "\n".join(lines) + "\n"
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _apply(self, uid, currentState, now, expired):
+        lastKnownState, enteredAt = self.states[uid]
+        action = TRANSITIONS[(lastKnownState, currentState, self.isDone(uid), expired)]
+        if action == NONE:
+            if lastKnownState == currentState:
+                self._cancelDeadline(uid) # came back before the deadline
+            return
+        log.debug("port %s: %s -> %s, action %d", uid, STATE_NAMES[lastKnownState], STATE_NAMES[currentState], action)
+        if action == HOLD:
+            self._armDeadline(uid, now + DEADLINES[HOLD])
+            return
+        if action == WAIT_FOR_FASTBOOT:
+            self._cancelDeadline(uid)
+            self._enter(uid, DeviceDescriptor.DEVICE_WAITING_FOR_FASTBOOT, now)
+            self._armDeadline(uid, now + DEADLINES[WAIT_FOR_FASTBOOT])
+            return
+        self._cancelDeadline(uid)
+        self._enter(uid, currentState, now)
+        if action == TRIGGER:
+            self.trigger(uid, currentState)
+
+    def _enter(self, uid, state, now):
+        lastKnownState, enteredAt = self.states[uid]
+        if enteredAt is not None:
+            elapsed = now - enteredAt
+            self.dwell[lastKnownState].add(elapsed)
+            key = (lastKnownState, state)
+            if not key in self.transitions:
+                self.transitions[key] = Histogram()
+            self.transitions[key].add(elapsed)
+        self.states[uid] = (state, now)
+
+    def _armDeadline(self, uid, when):
+        if uid in self.deadlines: # keep the first deadline, the wait started then
+            return
+        self.deadlines[uid] = when
+        heapq.heappush(self.heap, (when, next(self.sequence), uid))
+
+    def _cancelDeadline(self, uid):
+        self.deadlines.pop(uid, None)
@@ -0,0 +1,202 @@
+import Queue
+import os
+import pty
+import subprocess
+import threading
+import time
+import tty
+
+LOGIN = 'root'
+PASSWORD = 'chip'
+PROMPT = 'root@chip:~# '
+LOGIN_PROMPT = '\r\nchip login: '
+BOOT_MESSAGES = '[    0.000000] Booting Linux on physical CPU 0x0\r\n[    3.140000] random: nonblocking pool is initialized\r\n'
+
+# Console states
+UBOOT = 0
+BOOTING = 1
+LOGIN_STATE = 2
+PASSWORD_STATE = 3
+SHELL = 4
+OFF = 5
+
+class FakeChip(object):
+    '''
+    A CHIP's serial console on a pty, for benchmarks and trying code without hardware.
+    Behaves like the serial gadget: a login prompt, a password prompt and a shell, each printed again when a blank line is sent.
+    Shell commands are answered from the commands dictionary, or run with /bin/sh. Lines of only echo, true and false are run in process.
+    poweroff closes the console, like the gadget going away.
+    '''
+    def __init__(self, bootTime=0, uboot=False, badLogins=0, commands=None, commandTime=0, latency=0, onPowerOff=None):
+        '''
+        :param bootTime: seconds between the start (or a u-boot reset) and the login prompt
+        :param uboot: start at the u-boot prompt, which needs a reset
+        :param badLogins: number of correct passwords rejected anyway, as when the first login races the boot
+        :param commands: dictionary of command -> output, or function(command) returning the output.
+        The output can also be an iterable of pieces, written as they are produced, like a long running command
+        :param commandTime: seconds each shell command takes
+        :param latency: seconds before anything written reaches the other end, like the round trip of the USB serial gadget
+        :param onPowerOff: called when poweroff or reboot is run
+        '''
+        self.bootTime = bootTime
+        self.badLogins = badLogins
+        self.commands = commands or {}
+        self.commandTime = commandTime
+        self.latency = latency
+        self.onPowerOff = onPowerOff
+        self.delayed = Queue.Queue() # (time due, text) when there is latency
+        self.lock = threading.Lock()
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        self.state = UBOOT if uboot else BOOTING
+        self.received = [] # every line received, for checks
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="FakeChip " + self.path)
+        self.thread.daemon = True
+        self.thread.start()
+        if self.latency:
+            writer = threading.Thread(target=self._runWriter, name="FakeChip writer " + self.path)
+            writer.daemon = True
+            writer.start()
+        return self
+
+    def close(self):
+        '''
+        Close the pty. Safe to call more than once, the descriptors are only closed the first time, before their numbers get reused
+        '''
+        with self.lock:
+            self.state = OFF
+            fds = [fd for fd in [self.master, self.slave] if fd is not None]
+            self.master = self.slave = None
+        for fd in fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _write(self, text):
+        if self.latency:
+            self.delayed.put((time.time() + self.latency, text))
+            return
+        self._writeNow(text)
+
+    def _runWriter(self):
+        while self.state != OFF:
+            due, text = self.delayed.get()
+            wait = due - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self._writeNow(text)
+
+    def _writeNow(self, text):
+        try:
+            os.write(self.master, text)
+        except (OSError, TypeError): # closed
+            self.state = OFF
+
+    def _readLine(self):
+        '''
+        :return the next line or Ctrl-C, None when the console is closed
+        '''
+        line = ''
+        while True:
+            try:
+                char = os.read(self.master, 1)
+            except (OSError, TypeError): # closed
+                return None
+            if not char:
+                return None
+            if char == '\x03':
+                return char
+            if char in '\r\n':
+                return line
+            line += char
+
+    def _boot(self):
+        if self.bootTime:
+            time.sleep(self.bootTime)
+        self._write(BOOT_MESSAGES + LOGIN_PROMPT)
+        self.state = LOGIN_STATE
+
+    def _run(self):
+        if self.state == UBOOT:
+            self._write('=> ')
+        else:
+            self._boot()
+        while self.state != OFF:
+            line = self._readLine()
+            if line is None:
+                break
+            self.received.append(line)
+            if self.state == UBOOT:
+                if line == 'reset':
+                    self._write('reset\r\nresetting ...\r\n')
+                    self._boot()
+                else:
+                    self._write(line + '\r\n=> ')
+            elif self.state == LOGIN_STATE:
+                if line == LOGIN:
+                    self._write(line + '\r\nPassword: ')
+                    self.state = PASSWORD_STATE
+                else:
+                    self._write(line + LOGIN_PROMPT)
+            elif self.state == PASSWORD_STATE:
+                if line == PASSWORD and self.badLogins <= 0:
+                    self._write('\r\nLast login: never\r\n' + PROMPT)
+                    self.state = SHELL
+                else:
+                    self.badLogins -= 1
+                    self._write('\r\nLogin incorrect\r\n' + LOGIN_PROMPT)
+                    self.state = LOGIN_STATE
+            elif self.state == SHELL:
+                self._command(line)
+        self.close()
+
+    def _command(self, line):
+        if line == '\x03':
+            self._write('^C\r\n' + PROMPT)
+            return
+        self._write(line + '\r\n')
+        if line.strip() in ['poweroff', 'reboot']:
+            self.close()
+            if self.onPowerOff:
+                self.onPowerOff()
+            return
+        if self.commandTime:
+            time.sleep(self.commandTime)
+        if callable(self.commands):
+            output = self.commands(line)
+        elif line in self.commands:
+            output = self.commands[line]
+        elif line.strip():
+            output = self._builtins(line)
+        else:
+            output = ''
+        if isinstance(output, basestring):
+            output = [output]
+        for piece in output:
+            self._write(piece.replace('\r\n', '\n').replace('\n', '\r\n'))
+        self._write(PROMPT)
+
+    def _builtins(self, line):
+        '''
+        Run a line of "; " separated echo, true and false commands without starting a shell. Anything else goes to /bin/sh
+        '''
+        output = ''
+        status = 0
+        for command in line.split('; '):
+            if command in ['true', 'false']:
+                status = 0 if command == 'true' else 1
+            elif command.startswith('echo ') and not any(char in command for char in '\'"|<>&`\\'):
+                output += command[5:].replace('$?', str(status)) + '\n'
+                status = 0
+            else:
+                return subprocess.Popen(['/bin/sh', '-c', line], stdout=subprocess.PIPE, stderr=subprocess.STDOUT).communicate()[0]
+        return output
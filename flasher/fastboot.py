@@ -0,0 +1,393 @@
+import abc
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+try:
+    import usb.core # optional. pyusb, to talk to the device with libusb
+    import usb.util
+except ImportError:
+    usb = None
+USB_ERRORS = (usb.core.USBError,) if usb else () # what a failed transfer raises. Nothing can fail that way without pyusb
+
+COMMAND_TIMEOUT = 10 # seconds for a command's answer
+DOWNLOAD_CHUNK = 1 << 20 # bytes per bulk write
+DEFAULT_MAX_DOWNLOAD = 1 << 26 # used when the device doesn't tell its max-download-size
+FASTBOOT_CLASS = (0xff, 0x42, 0x03) # interface class, subclass and protocol of fastboot
+
+SPARSE_MAGIC = 0xed26ff3a
+SPARSE_HEADER = struct.Struct('<IHHHHIIII') # magic, major, minor, file header size, chunk header size, block size, blocks, chunks, checksum
+CHUNK_HEADER = struct.Struct('<HHII') # type, reserved, blocks, bytes including the header
+CHUNK_RAW = 0xcac1
+CHUNK_FILL = 0xcac2
+CHUNK_DONT_CARE = 0xcac3
+CHUNK_CRC32 = 0xcac4
+RAW_BLOCK_SIZE = 4096 # block size used to send a plain image as a sparse one
+
+class FastbootError(Exception):
+    pass
+
+
+class Transport(object):
+    '''
+    How the client reaches a device. Implementations move bytes, the protocol is in FastbootClient
+    '''
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def write(self, data, timeout):
+        '''
+        :param data: a buffer, e.g. a slice of the mapped image. Not copied by the caller
+        '''
+
+    @abc.abstractmethod
+    def read(self, size, timeout):
+        '''
+        :return one packet of at most size bytes
+        '''
+
+    def close(self):
+        pass
+
+
+class UsbTransport(Transport):
+    '''
+    A fastboot device over libusb, found from its udev symlink (e.g. /dev/chip-1-1-fastboot -> /dev/bus/usb/001/012)
+    '''
+    def __init__(self, devicePath):
+        if not usb:
+            raise FastbootError("pyusb is not installed")
+        busPath, address = os.path.split(os.path.realpath(devicePath))
+        self.device = usb.core.find(bus=int(os.path.basename(busPath)), address=int(address))
+        if self.device is None:
+            raise FastbootError("No usb device at " + devicePath)
+        interface = usb.util.find_descriptor(self.device.get_active_configuration(),
+            custom_match=lambda interface: (interface.bInterfaceClass, interface.bInterfaceSubClass, interface.bInterfaceProtocol) == FASTBOOT_CLASS)
+        if interface is None:
+            raise FastbootError("No fastboot interface on " + devicePath)
+        self.interface = interface.bInterfaceNumber
+        usb.util.claim_interface(self.device, self.interface)
+        direction = lambda endpoint: usb.util.endpoint_direction(endpoint.bEndpointAddress)
+        self.outEndpoint = usb.util.find_descriptor(interface, custom_match=lambda endpoint: direction(endpoint) == usb.util.ENDPOINT_OUT)
+        self.inEndpoint = usb.util.find_descriptor(interface, custom_match=lambda endpoint: direction(endpoint) == usb.util.ENDPOINT_IN)
+
+    def write(self, data, timeout):
+        self.outEndpoint.write(data, int(timeout * 1000))
+
+    def read(self, size, timeout):
+        return self.inEndpoint.read(size, int(timeout * 1000)).tostring()
+
+    def close(self):
+        usb.util.release_interface(self.device, self.interface)
+        usb.util.dispose_resources(self.device)
+
+
+class FakeDevice(Transport):
+    '''
+    A fastboot device in memory, for tests and benchmarks. Flashed partitions are rebuilt (sparse images unsparsed)
+    when keep is set, otherwise the bytes received are only counted and checksummed, which reads them like a usb transfer would
+    '''
+    def __init__(self, maxDownload=DEFAULT_MAX_DOWNLOAD, rate=None, keep=False):
+        '''
+        :param maxDownload: the max-download-size it reports
+        :param rate: bytes per second it accepts, None for as fast as possible
+        :param keep: keep what is flashed in self.partitions
+        '''
+        self.maxDownload = maxDownload
+        self.rate = rate
+        self.keep = keep
+        self.answers = []
+        self.expected = 0 # bytes of the download in progress still to come
+        self.download = None
+        self.received = 0
+        self.checksum = 0 # crc32 of all the data received
+        self.partitions = {} # name -> bytearray
+        self.continued = False
+
+    def write(self, data, timeout):
+        if self.rate:
+            time.sleep(len(data) / float(self.rate))
+        if self.expected:
+            if len(data) > self.expected:
+                raise FastbootError("Device got more data than announced")
+            self.expected -= len(data)
+            self.received += len(data)
+            self.checksum = zlib.crc32(data, self.checksum)
+            if self.keep:
+                self.download += data
+            if not self.expected:
+                self.answers.append("OKAY")
+            return
+        self._command(str(data))
+
+    def read(self, size, timeout):
+        if not self.answers:
+            raise FastbootError("Device has nothing to say")
+        return self.answers.pop(0)[:size]
+
+    def _command(self, command):
+        if command == "getvar:max-download-size":
+            self.answers.append("OKAY0x%08x" % self.maxDownload)
+        elif command.startswith("download:"):
+            size = int(command[len("download:"):], 16)
+            if size > self.maxDownload:
+                self.answers.append("FAILdata too large")
+                return
+            self.expected = size
+            self.download = bytearray() if self.keep else None
+            self.answers.append("DATA%08x" % size)
+        elif command.startswith("flash:"):
+            if self.keep:
+                self._apply(command[len("flash:"):], self.download)
+            self.answers.append("INFOwriting")
+            self.answers.append("OKAY")
+        elif command in ["continue", "reboot"]:
+            self.continued = True
+            self.answers.append("OKAY")
+        else:
+            self.answers.append("FAILunknown command")
+
+    def _apply(self, name, data):
+        partition = self.partitions.setdefault(name, bytearray())
+        if len(data) < SPARSE_HEADER.size or SPARSE_HEADER.unpack_from(buffer(data))[0] != SPARSE_MAGIC:
+            partition[:] = data
+            return
+        for offset, chunkType, blocks, blockSize, payload in _sparseChunks(buffer(data)):
+            start = offset * blockSize
+            if len(partition) < start + blocks * blockSize:
+                partition.extend('\0' * (start + blocks * blockSize - len(partition)))
+            if chunkType == CHUNK_RAW:
+                partition[start:start + len(payload)] = payload
+            elif chunkType == CHUNK_FILL:
+                partition[start:start + blocks * blockSize] = payload * (blocks * blockSize / 4)
+
+
+class SharedImage(object):
+    '''
+    An image mapped read-only once, whatever number of ports flash it. Every upload reads slices (buffer objects, which share memory) of the same pages,
+    so the image is in memory once, in the page cache, instead of once per fastboot process
+    '''
+    _images = {} # (path, size, mtime, inode) -> SharedImage
+    _lock = threading.Lock()
+
+    @staticmethod
+    def open(imagePath):
+        '''
+        :return the shared mapping of the image as it is now. Call close when done with it
+        '''
+        stat = os.stat(imagePath)
+        key = (imagePath, stat.st_size, stat.st_mtime, stat.st_ino)
+        with SharedImage._lock:
+            image = SharedImage._images.get(key)
+            if not image:
+                image = SharedImage._images[key] = SharedImage(key)
+            image.users += 1
+            return image
+
+    def __init__(self, key):
+        self.key = key
+        self.users = 0
+        with open(key[0], 'rb') as imageFile:
+            self.map = mmap.mmap(imageFile.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = buffer(self.map)
+
+    def close(self):
+        with SharedImage._lock:
+            self.users -= 1
+            if self.users:
+                return
+            del SharedImage._images[self.key]
+        self.data = None
+        self.map.close()
+
+
+class FastbootClient(object):
+    '''
+    The fastboot protocol: commands of up to 64 bytes, answered by OKAY, FAIL, DATA or INFO and a payload
+    '''
+    def __init__(self, transport, onOutput=None, onProgress=None):
+        '''
+        :param onOutput: function(line) called with fastboot style lines, e.g. "sending sparse 'UBI' 1/4 (N KB)...OKAY [  1.234s]\n",
+                         that a TransferRateParser understands
+        :param onProgress: function(fraction) called as the image is sent
+        '''
+        self.transport = transport
+        self.onOutput = onOutput or (lambda text: None)
+        self.onProgress = onProgress or (lambda fraction: None)
+        self.info = [] # INFO messages of the last command
+
+    def command(self, command, timeout=COMMAND_TIMEOUT):
+        '''
+        :return the payload of the OKAY (or DATA) answer
+        :raise FastbootError on FAIL
+        '''
+        self.transport.write(command, timeout)
+        return self._answer(timeout)
+
+    def getvar(self, name):
+        return self.command("getvar:" + name)
+
+    def maxDownloadSize(self):
+        try:
+            return int(self.getvar("max-download-size"), 16)
+        except (FastbootError, ValueError):
+            return DEFAULT_MAX_DOWNLOAD
+
+    def download(self, pieces, size, deadline, progress):
+        '''
+        Send buffers the device stores until the next flash
+        :param pieces: buffers, sent as they are
+        :param size: their total length
+        :param progress: function(bytes sent) called after each write
+        '''
+        self.command("download:%08x" % size)
+        for piece in pieces:
+            for start in range(0, len(piece), DOWNLOAD_CHUNK):
+                self.transport.write(view(piece, start, start + DOWNLOAD_CHUNK), self._remaining(deadline))
+                progress(min(len(piece) - start, DOWNLOAD_CHUNK))
+        return self._answer(self._remaining(deadline))
+
+    def flash(self, partition, image, timeout):
+        '''
+        Write an image to a partition, in several downloads if it is larger than the device's max-download-size.
+        Sparse images are split into sparse images that each fit
+        :param image: buffer holding the image, e.g. SharedImage.data
+        :param timeout: seconds for the whole image
+        '''
+        deadline = time.time() + timeout
+        downloads = list(splitImage(image, self.maxDownloadSize()))
+        total = sum(size for pieces, size in downloads)
+        sent = [0]
+        def progress(count):
+            sent[0] += count
+            self.onProgress(float(sent[0]) / total)
+        sparse = " sparse" if len(downloads) > 1 or isSparse(image) else ""
+        for index, (pieces, size) in enumerate(downloads):
+            part = " %d/%d" % (index + 1, len(downloads)) if len(downloads) > 1 else ""
+            start = time.time()
+            self.download(pieces, size, deadline, progress)
+            self.onOutput("sending%s '%s'%s (%d KB)...OKAY [%7.3fs]\n" % (sparse, partition, part, size / 1024, time.time() - start))
+            start = time.time()
+            self.command("flash:" + partition, self._remaining(deadline))
+            self.onOutput("writing '%s'%s...OKAY [%7.3fs]\n" % (partition, part, time.time() - start))
+
+    def resume(self):
+        '''
+        Leave fastboot and let the device boot
+        '''
+        self.command("continue")
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _remaining(self, deadline):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise FastbootError("Timed out")
+        return remaining
+
+    def _answer(self, timeout):
+        self.info = []
+        deadline = time.time() + timeout
+        while True:
+            answer = self.transport.read(64, self._remaining(deadline))
+            kind, payload = answer[:4], answer[4:]
+            if kind == "INFO":
+                self.info.append(payload)
+                self.onOutput("(bootloader) " + payload + "\n")
+            elif kind in ["OKAY", "DATA"]:
+                return payload
+            elif kind == "FAIL":
+                raise FastbootError("FAILED (remote: " + payload + ")")
+            else:
+                raise FastbootError("Unexpected answer: " + repr(answer))
+
+
+def view(data, start, end=None):
+    '''
+    A slice of a buffer that shares its memory, where slicing a buffer or a string would copy it
+    '''
+    end = len(data) if end is None else min(end, len(data))
+    return buffer(data, start, max(0, end - start))
+
+def isSparse(image):
+    return len(image) >= SPARSE_HEADER.size and SPARSE_HEADER.unpack_from(image)[0] == SPARSE_MAGIC
+
+def _sparseChunks(image):
+    '''
+    :return (first block, type, blocks, block size, payload buffer) of each chunk of a sparse image
+    '''
+    magic, major, minor, fileHeaderSize, chunkHeaderSize, blockSize, totalBlocks, totalChunks, checksum = SPARSE_HEADER.unpack_from(image)
+    offset = fileHeaderSize
+    block = 0
+    for i in range(totalChunks):
+        chunkType, reserved, blocks, totalSize = CHUNK_HEADER.unpack_from(image, offset)
+        yield block, chunkType, blocks, blockSize, view(image, offset + chunkHeaderSize, offset + totalSize)
+        offset += totalSize
+        block += blocks
+
+def splitImage(image, maxSize):
+    '''
+    Cut an image into downloads of at most maxSize bytes, without copying its data.
+    A sparse image becomes several sparse images, each starting with a don't care chunk up to its first block,
+    like fastboot's resparse, and a raw chunk too large for one download is cut at a block boundary.
+    A plain image too large for one download is sent the same way, as raw chunks of RAW_BLOCK_SIZE blocks
+    :param image: buffer of the image
+    :return (list of buffers, total size) for each download
+    '''
+    if isSparse(image):
+        blockSize, totalBlocks = SPARSE_HEADER.unpack_from(image)[5:7]
+        chunks = _sparseChunks(image)
+    elif len(image) <= maxSize:
+        yield [image], len(image)
+        return
+    elif len(image) % RAW_BLOCK_SIZE == 0: # sent as a sparse image of raw chunks
+        blockSize, totalBlocks = RAW_BLOCK_SIZE, len(image) / RAW_BLOCK_SIZE
+        chunks = [(0, CHUNK_RAW, totalBlocks, blockSize, image)]
+    else:
+        raise FastbootError("Image of %d bytes is larger than the device's %d, isn't sparse and isn't made of %d byte blocks" % (
+            len(image), maxSize, RAW_BLOCK_SIZE))
+    budget = maxSize - SPARSE_HEADER.size - 2 * CHUNK_HEADER.size # room for the two don't care chunks around the data
+    rawBlocks = (budget - CHUNK_HEADER.size) / blockSize # most blocks of a raw chunk in one download
+    if rawBlocks < 1:
+        raise FastbootError("max-download-size %d is too small for %d byte blocks" % (maxSize, blockSize))
+    pending = [] # (header, payload) of the next download
+    pendingSize = 0
+    firstBlock = 0
+    for block, chunkType, blocks, blockSize, payload in chunks:
+        while blocks:
+            count = min(blocks, rawBlocks) if chunkType == CHUNK_RAW else blocks
+            data = view(payload, 0, count * blockSize) if chunkType == CHUNK_RAW else payload
+            size = CHUNK_HEADER.size + len(data)
+            if pending and pendingSize + size > budget:
+                yield _sparseDownload(pending, firstBlock, block, totalBlocks, blockSize)
+                pending = []
+                pendingSize = 0
+            if not pending:
+                firstBlock = block
+            pending.append((CHUNK_HEADER.pack(chunkType, 0, count, size), data))
+            pendingSize += size
+            block += count
+            blocks -= count
+            if chunkType == CHUNK_RAW:
+                payload = view(payload, count * blockSize)
+    if pending:
+        yield _sparseDownload(pending, firstBlock, totalBlocks, totalBlocks, blockSize)
+
+def _sparseDownload(chunks, firstBlock, endBlock, totalBlocks, blockSize):
+    pieces = []
+    count = len(chunks)
+    if firstBlock:
+        pieces.append(CHUNK_HEADER.pack(CHUNK_DONT_CARE, 0, firstBlock, CHUNK_HEADER.size))
+        count += 1
+    for header, payload in chunks:
+        pieces.append(header)
+        pieces.append(payload)
+    if endBlock < totalBlocks:
+        pieces.append(CHUNK_HEADER.pack(CHUNK_DONT_CARE, 0, totalBlocks - endBlock, CHUNK_HEADER.size))
+        count += 1
+    pieces.insert(0, SPARSE_HEADER.pack(SPARSE_MAGIC, 1, 0, SPARSE_HEADER.size, CHUNK_HEADER.size, blockSize, totalBlocks, count, 0))
+    return pieces, sum(len(piece) for piece in pieces)
+
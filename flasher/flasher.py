@@ -3,13 +3,19 @@ from unittest import TestCase, TextTestRunner, TestLoader
 import logging
 import sys
 import os.path
+import glob
 import random #for mocking
 from ui_strings import *
 from observable_test import *
 from commandRunner import CommandRunner
+from deviceDescriptor import DeviceDescriptor
+from config import FLASH_STALL_TIMEOUT, FLASH_ENGINE, FASTBOOT_IMAGE_PATTERN, FASTBOOT_PARTITION
+from usbTopology import TransferRateParser
+from fastboot import FastbootClient, FastbootError, SharedImage, UsbTransport, USB_ERRORS
 
 # logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 MOCK = False #For testing GUI without real things plugged in
+CHIP_FLASH = "./chip-flash" #run from flasher/tools. The simulator points this at its fake
 class Flasher(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -28,15 +34,30 @@ class Flasher(TestCase):
         135: "Bad U-boot."
     }
 
+    retryableErrors = [132, 133, 134] # err_codes worth another attempt without replugging, from a @resumable stage. The others mean bad hardware or setup
+
 
     def setUp(self):
-        self.progressObservers = []
+        if not hasattr(self, "progressObservers"): # decorateTest provides these when run from a TestingThread
+            self.progressObservers = []
+        if not hasattr(self, "outputObservers"):
+            self.outputObservers = []
         self.log = self.attributes['log']
+        self.admission = None
+        self.deviceMonitor = None
+        self.uid = None
+        self.exitCode = None # err_codes key of a failed stage, for the RetryPolicy
         try:
             self.felPort = self.attributes['deviceDescriptor'].fel
-            self.returnValues['image'] = self.attributes['imageInfo'] #computed by controller on startup
+            self.fastbootPort = self.attributes['deviceDescriptor'].fastboot
+            imageInfo = self.attributes['imageInfo'] #a function when run by the controller, so the hash is of the image as it is now
+            self.returnValues['image'] = imageInfo() if callable(imageInfo) else imageInfo
+            self.uid = self.attributes['deviceDescriptor'].uid
+            self.admission = self.attributes.get('admission') #records the upload rates
+            self.deviceMonitor = self.attributes.get('deviceMonitor') #tells when the fastboot device appears
         except: # run from regular unit test
             self.felPort = "/dev/ttyACM0"
+            self.fastbootPort = None
 
     def findFelDevice(self):
         if MOCK:
@@ -51,31 +72,105 @@ class Flasher(TestCase):
                 self.fail("Mock Failure")
             return
 
+    def _outputObservers(self):
+        outputObservers = list(self.outputObservers)
+        if self.admission:
+            outputObservers.append(TransferRateParser(lambda bytes, seconds: self.admission.recordTransfer(self.uid, bytes, seconds)).onLine)
+        return outputObservers
+
+    def _fail(self, errcode):
+        if not hasattr(self,"output"):
+            self.output = ""
+        if not errcode in self.err_codes:
+            errcode = -1
+        self.exitCode = errcode
+        self.output += "\nFlashing failed: " + self.err_codes[ errcode ] + "\n"
+        raise Exception( "Flashing failed: ", self.err_codes[ errcode ] )
+
+    def _doFastbootStage(self,timeout=400):
+        '''
+        The UBI upload of stage 5 done in this process instead of by chip-flash: wait for the port's fastboot device, flash the image, and let it boot.
+        Every port maps the same image, so it is in memory once however many ports upload it
+        '''
+        if MOCK:
+            return self._doFlashStageMock(5,timeout)
+        learnedTimeout = getattr(self, 'learnedTimeout', None)
+        timeout = learnedTimeout or timeout * self.timeoutMultiplier
+        deadline = time.time() + timeout
+        if not hasattr(self,"output"):
+            self.output = ""
+        outputObservers = self._outputObservers()
+        def onOutput(line):
+            if not self.outputObservers: #otherwise it is streamed
+                self.output += line
+            [observer(line) for observer in outputObservers]
+        def onProgress(fraction):
+            [observer(fraction) for observer in self.progressObservers]
+        images = glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'tools', FASTBOOT_IMAGE_PATTERN))
+        if len(images) != 1:
+            onOutput("Expected one image matching " + FASTBOOT_IMAGE_PATTERN + ", found " + str(images) + "\n")
+            self._fail(130)
+        if not self._waitForFastboot(deadline):
+            onOutput("No fastboot device found: " + str(self.fastbootPort) + "\n")
+            self._fail(132)
+        image = SharedImage.open(images[0])
+        transport = None
+        try:
+            transport = UsbTransport(self.fastbootPort)
+            client = FastbootClient(transport, onOutput=onOutput, onProgress=onProgress)
+            client.flash(FASTBOOT_PARTITION, image.data, max(1, deadline - time.time()))
+            client.resume()
+        except USB_ERRORS, e: # before IOError, which USBError derives from
+            onOutput(str(e) + "\n")
+            self._fail(134)
+        except (FastbootError, IOError), e:
+            onOutput(str(e) + "\n")
+            self._fail(133)
+        finally:
+            if transport:
+                transport.close()
+            image.close()
+
+    def _waitForFastboot(self, deadline):
+        '''
+        Wait for the port's fastboot device node, woken up by the device monitor, or polling for it when there is none
+        :return whether it appeared before the deadline
+        '''
+        found = lambda: bool(self.fastbootPort) and os.path.exists(self.fastbootPort)
+        if self.deviceMonitor:
+            return self.deviceMonitor.waitFor(found, deadline - time.time())
+        while not found():
+            if time.time() > deadline:
+                return False
+            time.sleep(.5)
+        return True
+
     def _doFlashStage(self,stage,timeout=400):
         if MOCK:
             return self._doFlashStageMock(stage,timeout)
-        timeout = timeout * self.timeoutMultiplier
+        learnedTimeout = getattr(self, 'learnedTimeout', None) # from the durations of the previous runs, when TestingThread has enough of them
+        timeout = learnedTimeout or timeout * self.timeoutMultiplier
 
         print "_doFlashStage timeout " + str(timeout)
         commandRunner = CommandRunner(self.log,progressObservers = self.progressObservers)
-        args = ["./chip-flash","-u", ".firmware", "--stage",str(stage)]
+        args = [CHIP_FLASH,"-u", ".firmware", "--stage",str(stage)]
         if self.felPort:
             args.extend(["--chip-path", self.felPort])
         print self.felPort
         print args
-        out, errcode = commandRunner.call_and_return(cmd=args, timeout=timeout)
+        outputObservers = self._outputObservers()
+        out, errcode = commandRunner.call_and_stream(cmd=args, timeout=timeout, outputObservers=outputObservers, stallTimeout=FLASH_STALL_TIMEOUT * self.timeoutMultiplier)
         if not hasattr(self,"output"):
             self.output = ""
-        self.output += out
+        if not self.outputObservers: #otherwise it was already streamed
+            self.output += out
         if errcode != 0:
-            if not errcode in self.err_codes:
-                errcode = -1
-            self.output += "\nFlashing failed: " + self.err_codes[ errcode ] + "\n"
-            raise Exception( "Flashing failed: ", self.err_codes[ errcode ] )
+            self._fail(errcode)
 
 
     @label(UI_WAITING_FOR_DEVICE)
     @progress(10)
+    @resumable(DeviceDescriptor.DEVICE_FEL)
     @failMessage(FAIL_201_TEXT)
     @errorNumber(201)
     def test_0_fel(self):
@@ -126,10 +221,15 @@ class Flasher(TestCase):
 
     @label(UI_UPLOAD_UBI)
     @progress(345)
+    @bandwidth("upload")
+    @resumable(DeviceDescriptor.DEVICE_FASTBOOT)
     @failMessage(FAIL_203_TEXT)
     @errorNumber(203)
     def test_Stage5(self):
-        self._doFlashStage(5, timeout = 400)
+        if FLASH_ENGINE == "fastboot":
+            self._doFastbootStage(timeout = 400)
+        else:
+            self._doFlashStage(5, timeout = 400)
 
 #     def statsTableColumns(self):
 #         return []
@@ -147,12 +247,16 @@ class Flasher(TestCase):
         return cls.CUSTOM_COLUMNS
 
     @staticmethod
-    def getStatsQueries(where):
-        table = Flasher.statsTableName()
+    def getStatsQueries(window):
+        '''
+        :param window: a StatsWindow to compute the stats over
+        '''
+        rollup = Flasher.statsTableName() + "_rollup"
+        where = window.where('hour')
         return [
-            "select count(*) as 'total', sum(1-result) as 'failed', sum(result) as 'passed' from {0} where {1}".format(table,where),
-            "select avg(elapsedTime) as 'averageTime' from {0} where result=1 AND {1}".format(table,where),
-            "select error as errors_key, count(error) as errors_val from {0} where error != 0 and {1} group by error order by error".format(table,where)
+            "select ifnull(sum(total),0) as 'total', sum(total-passed) as 'failed', sum(passed) as 'passed' from {0} where {1}".format(rollup,where),
+            "select sum(passedElapsedTime)*1.0/sum(passed) as 'averageTime' from {0} where {1}".format(rollup,where),
+            "select error as errors_key, sum(count) as errors_val from {0}_errors where {1} group by error order by error".format(rollup,where)
         ]
 
 
@@ -0,0 +1,56 @@
+import threading
+
+class TimeoutError(Exception):
+    pass
+
+class Future(object):
+    '''
+    A minimal future. The result is set once, from any thread, and waited on from others.
+    Callbacks added with addDoneCallback are called with the future once it is done
+    '''
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        '''
+        Wait for the result
+        :param timeout: seconds to wait. None waits forever
+        :return the result, or raises the exception that was set
+        '''
+        if not self._event.wait(timeout):
+            raise TimeoutError()
+        if self._exception:
+            raise self._exception
+        return self._result
+
+    def setResult(self, result):
+        self._result = result
+        self._finish()
+
+    def setException(self, exception):
+        self._exception = exception
+        self._finish()
+
+    def addDoneCallback(self, callback):
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self):
+        with self._lock:
+            if self.done():
+                return
+            self._event.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            callback(self)
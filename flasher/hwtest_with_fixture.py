@@ -65,12 +65,13 @@ class FactoryHardwareTest(TestCase):
     @timeout(5)
 
     def test_002_wlan(self):
-        for x in range(3):
+        results = self.ser.send_many(["sudo ip link set wlan0 up"] * 3) # the three tries and their exit statuses in one round trip
+        if results is None:
+            raise Exception( "WLAN failed." )
+        for x, (output, code) in enumerate(results):
             print( "Activating WLAN" + str(x) + "...")
-            self.ser.send("sudo ip link set wlan0 up")
-            code = self.ser.send("echo $?")
             print "code is :" + str(code)
-            if code == "0":
+            if code == 0:
                 print( "PASSED" )
             else:
                 print "code is: " + str(code)
@@ -171,21 +172,24 @@ class FactoryHardwareTest(TestCase):
         GPIO = 408
         while GPIO < 415:
             print( "Testing XIO pin " + str(GPIO) + "..." ),
-            self.ser.send( "echo " + str( GPIO ) + " > /sys/class/gpio/export")
-            self.ser.send( "echo " + str( GPIO+1 ) + " > /sys/class/gpio/export")
-            self.ser.send( "echo \"out\" > /sys/class/gpio/gpio" + str(GPIO) + "/direction" )
-            self.ser.send( "echo 1 > /sys/class/gpio/gpio" + str(GPIO) + "/active_low")
-            self.ser.send( "echo 1 > /sys/class/gpio/gpio" + str(GPIO) + "/value")
-            self.ser.send( "echo \"in\" > /sys/class/gpio/gpio" + str(GPIO+1) + "/direction")
-            self.ser.send( "echo 1 > /sys/class/gpio/gpio" + str(GPIO+1) + "/active_low")
-            result = self.ser.send( "cat /sys/class/gpio/gpio" + str(GPIO+1) + "/value")
-            if result == "1":
+            readPin = "cat /sys/class/gpio/gpio" + str(GPIO+1) + "/value"
+            commands = [
+                "echo " + str( GPIO ) + " > /sys/class/gpio/export",
+                "echo " + str( GPIO+1 ) + " > /sys/class/gpio/export",
+                "echo \"out\" > /sys/class/gpio/gpio" + str(GPIO) + "/direction",
+                "echo 1 > /sys/class/gpio/gpio" + str(GPIO) + "/active_low",
+                "echo 1 > /sys/class/gpio/gpio" + str(GPIO) + "/value",
+                "echo \"in\" > /sys/class/gpio/gpio" + str(GPIO+1) + "/direction",
+                "echo 1 > /sys/class/gpio/gpio" + str(GPIO+1) + "/active_low",
+                readPin,
+                "echo " + str(GPIO) + " > /sys/class/gpio/unexport",
+                "echo " + str(GPIO+1) + " > /sys/class/gpio/unexport" ]
+            results = self.ser.send_many(commands) # one write for the whole pair
+            if results and results[commands.index(readPin)][0] == "1":
                 print( "PASSED" )
             else:
                 raise Exception( "XIO failed." )
 
-            self.ser.send( "echo " + str(GPIO) + " > /sys/class/gpio/unexport" )
-            self.ser.send( "echo " + str(GPIO+1) + " > /sys/class/gpio/unexport" )
             GPIO+=2
 
     @label("Stress testing...\n chinese")
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+CHUNK_SIZE = 1 << 20 # bytes read at a time while hashing
+log = logging.getLogger("global") # LogManager's global log, once it is set up
+
+def hashFile(filePath):
+    '''
+    SHA-1 and SHA-256 of a file, in one pass of chunked reads so memory stays flat on a multi-hundred-MB UBI
+    :return (sha1, sha256) hex digests
+    '''
+    sha1 = hashlib.sha1()
+    sha256 = hashlib.sha256()
+    with open(filePath, 'rb') as image:
+        for chunk in iter(lambda: image.read(CHUNK_SIZE), ''):
+            sha1.update(chunk)
+            sha256.update(chunk)
+    return sha1.hexdigest(), sha256.hexdigest()
+
+def fileKey(filePath):
+    '''
+    What identifies a version of a file without reading it. A rebuilt image gets a new size, mtime or inode
+    :return [size, mtime, inode], None if the file is gone
+    '''
+    try:
+        stat = os.stat(filePath)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime, stat.st_ino]
+
+
+class ImageCache(object):
+    '''
+    The hashes of the firmware images, kept in a manifest next to them so unchanged images aren't hashed again on the next launch.
+    A background thread hashes the files that are new or changed. get blocks until the hash of the file as it is now is known,
+    so a run never records the hash of a previous version of the image
+    '''
+    def __init__(self, directory, manifestPath=None):
+        '''
+        :param directory: the images directory, tools/.firmware/images
+        :param manifestPath: where the manifest is stored. Defaults to .manifest.json in the directory
+        '''
+        self.directory = directory
+        self.manifestPath = manifestPath or os.path.join(directory, ".manifest.json")
+        self.lock = threading.Lock()
+        self.hashing = {} # file name -> Event set when its hash is done
+        self.entries = {} # file name -> {'key': fileKey, 'sha1': ..., 'sha256': ...}
+        self.listeners = [] # called with the file name when a hash is ready, from the hashing thread
+        self.thread = None
+        self._readManifest()
+
+    def addListener(self, listener):
+        self.listeners.append(listener)
+
+    def start(self):
+        '''
+        Hash the new and changed images in the background
+        '''
+        self.thread = threading.Thread(target=self._hashAll, name="ImageCache")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def get(self, name):
+        '''
+        The hashes of an image as it is now, computed first if the file changed since it was last hashed
+        :param name: file name in the images directory
+        :return {'key': [size, mtime, inode], 'sha1': ..., 'sha256': ...}, None if the file doesn't exist
+        '''
+        while True:
+            filePath = os.path.join(self.directory, name)
+            key = fileKey(filePath)
+            if key is None:
+                return None
+            with self.lock:
+                entry = self.entries.get(name)
+                if entry and entry['key'] == key:
+                    return entry
+                event = self.hashing.get(name)
+                if not event: # hash it on this thread
+                    event = self.hashing[name] = threading.Event()
+                    mine = True
+                else: # the background thread is on it
+                    mine = False
+            if mine:
+                if not self._hash(name, event):
+                    return None
+            else:
+                event.wait() # then check again, the file may have changed while it was hashed
+
+    def peek(self, name):
+        '''
+        :return the hashes of an image if they are known for the file as it is now, else None. Never blocks
+        '''
+        key = fileKey(os.path.join(self.directory, name))
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry and entry['key'] == key:
+            return entry
+        return None
+
+    def listing(self):
+        '''
+        :return a line per image with its size, modification time, name and SHA-1, or "hashing..." if it isn't known yet
+        '''
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if not name.startswith('.'))
+        except OSError, e:
+            return str(e)
+        lines = []
+        for name in names:
+            key = fileKey(os.path.join(self.directory, name))
+            if key is None:
+                continue
+            entry = self.peek(name)
+            lines.append("%d %s %s %s" % (key[0], time.strftime('%b %d %H:%M', time.localtime(key[1])), name, entry['sha1'] if entry else "hashing..."))
+        return "\n".join(lines) + "\n"
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _readManifest(self):
+        try:
+            with open(self.manifestPath) as manifest:
+                self.entries = json.load(manifest)
+        except (IOError, ValueError):
+            self.entries = {}
+
+    def _writeManifest(self):
+        with self.lock:
+            text = json.dumps(self.entries, indent=4, sort_keys=True)
+        temporaryPath = self.manifestPath + ".tmp"
+        try:
+            with open(temporaryPath, 'w') as manifest:
+                manifest.write(text)
+            os.rename(temporaryPath, self.manifestPath) # readers see the old manifest or the new one, never half of one
+        except (IOError, OSError):
+            log.exception("Could not write the image manifest %s", self.manifestPath)
+
+    def _hash(self, name, event):
+        '''
+        Hash a file and store the result under the key it had before it was read, so a change during the read is seen next time
+        :return whether it could be read
+        '''
+        filePath = os.path.join(self.directory, name)
+        hashed = False
+        try:
+            key = fileKey(filePath)
+            sha1, sha256 = hashFile(filePath)
+            with self.lock:
+                self.entries[name] = {'key': key, 'sha1': sha1, 'sha256': sha256}
+            hashed = True
+        except (IOError, OSError):
+            log.exception("Could not hash %s", filePath)
+        finally:
+            with self.lock:
+                del self.hashing[name]
+            event.set()
+        self._writeManifest()
+        for listener in self.listeners:
+            listener(name)
+        return hashed
+
+    def _hashAll(self):
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if not name.startswith('.'))
+        except OSError:
+            log.exception("Could not list the images in %s", self.directory)
+            return
+        for name in names:
+            if os.path.isfile(os.path.join(self.directory, name)) and not self.peek(name):
+                with self.lock:
+                    if name in self.hashing:
+                        continue
+                    event = self.hashing[name] = threading.Event()
+                self._hash(name, event)
+
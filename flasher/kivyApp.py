@@ -33,7 +33,7 @@ from runState import RunState
 from config import *
 from ui_strings import *
 from controller import Controller
-from databaseLogger import DatabaseLogger
+from databaseLogger import DatabaseLogger, StatsWindow
 
 OSX_FONT = "/Library/Fonts/Arial Unicode.ttf"
 UBUNTU_FONT = "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf"
@@ -62,13 +62,15 @@ class KivyApp(App):
         Clock.schedule_interval(self._onPollingTick.__get__(self, KivyApp), 1)
         self.databaseLogger = DatabaseLogger()
         self.view = KivyView(deviceDescriptors=self.controller.deviceDescriptors,
-                             hubs=self.controller.hubs, fileInfo=self.controller.getFileInfo(),databaseLogger = self.databaseLogger)
+                             hubs=self.controller.hubs, fileInfo=self.controller.getFileInfo,databaseLogger = self.databaseLogger)
         # observe button events if GUI
         self.view.addMainButtonListener(
             self._onMainButton.__get__(self, KivyApp))
         self.view.controller = self.controller
         self.controller.addStateListener(lambda info: self.view.onUpdateStateInfo(info))
         self.controller.addStateListener(lambda info: self.databaseLogger.onUpdateStateInfo(info))
+        self.controller.loadTimingHistory(self.databaseLogger)
+        self.controller.logRetries(self.databaseLogger)
         self.title = self.controller.getTitle()
         return self.view
 
@@ -78,7 +80,7 @@ class KivyApp(App):
         '''
     #         PersistentData.write()
     #         LogManager.close_all_logs()
-        pass
+        self.databaseLogger.close() # write out the runs that finished in the last batch
 
     def _onUpdateTrigger(self, x):
         self.controller.onUpdateTrigger(x)
@@ -106,7 +108,7 @@ class KivyView(BoxLayout):
         super(KivyView, self).__init__(**kwargs)
         self.deviceDescriptors = kwargs['deviceDescriptors']
         self.hubs = kwargs['hubs']
-        self.fileInfo = kwargs['fileInfo']
+        self.fileInfo = kwargs['fileInfo'] # function returning the text, the hashes fill in once computed
         self.databaseLogger = kwargs['databaseLogger']
         self.widgetsMap = {}
         # the uid of of what's being shown in the output (detail) view to the
@@ -239,7 +241,8 @@ class KivyView(BoxLayout):
     info.stateLabel: Text label for the state, such as RUNNING_TEXT
     info.label: The label for the test case that is being run
     info.progress: number value for progress bar
-    info.output: The output for the test case
+    info.output: Replaces the output for the port
+    info.outputDelta: Text appended to the output for the port
     info.prompt: Any prompt to show
     '''
         uid = info['uid']
@@ -247,7 +250,7 @@ class KivyView(BoxLayout):
         stateLabel = info.get('stateLabel')
         label = info.get('label')
         progress = info.get('progress')
-        output = info.get('output')
+        outputDelta = info.get('outputDelta')
         prompt = info.get('prompt')
 
         widgets = self.widgetsMap[uid]
@@ -267,10 +270,12 @@ class KivyView(BoxLayout):
         if prompt:
             widgets.label.text = prompt
 
-        if output:
-            widgets.output = output
-            # if the output detail is showing this output, it will be updated
-            self._onShowOutput(None, uid)
+        # only the port shown in the output detail view needs its text. The others are joined when clicked on
+        if self.outputDetailUid == uid:
+            if 'output' in info:
+                self.output.text = info['output']
+            elif outputDelta:
+                self.output.text += outputDelta
 
 
 ##########################################################################
@@ -302,7 +307,7 @@ class KivyView(BoxLayout):
         title = "Port: " + str(uid)
         color = widgets.label.color  # use same color as state
         self._setOutputDetailTitle(title, color)
-        self.output.text = widgets.output
+        self.output.text = self.controller.getOutput(uid)
 
     def _setOutputDetailTitle(self, title, color=None):
         '''
@@ -314,13 +319,15 @@ class KivyView(BoxLayout):
             self.outputTitle.color = color
 
     def _stats(self,suiteName):
-        queries = self.controller.getStatsQueries(suiteName,self.databaseLogger.TODAY)
-        formatted = self.databaseLogger.computeAndFormatStats(queries)
-        popup = Popup(title=suiteName + ' stats for today',content=Label(text=formatted),size_hint=(None, None), size=(600, 600))
+        stats = OrderedDict()
+        for window in [self.databaseLogger.today(), StatsWindow.shift(), StatsWindow.run()]:
+            stats[window.title] = self.databaseLogger.computeStats(self.controller.getStatsQueries(suiteName,window))
+        formatted = self.databaseLogger.formatStats(stats)
+        popup = Popup(title=suiteName + ' stats',content=Label(text=formatted),size_hint=(None, None), size=(600, 600))
         popup.open()
 
     def _fileInfo(self):
-        popup = Popup(title='File Info',content=Label(text=self.fileInfo),size_hint=(None, None), size=(600, 600))
+        popup = Popup(title='File Info',content=Label(text=self.fileInfo()),size_hint=(None, None), size=(600, 600))
         popup.open()
 
     def _powerOff(self):
@@ -350,7 +357,6 @@ class Widgets:
         self.stateLabel = None
         self.label = None
         self.progress = None
-        self.output = ""  # This is actually the output text for the widget
 
     def setColor(self, color):
         '''
@@ -0,0 +1,60 @@
+import bisect
+import threading
+
+DEFAULT_BOUNDS = [.1, .25, .5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600] # seconds
+
+class Histogram(object):
+    '''
+    A thread-safe histogram of durations (or any positive values) in fixed buckets.
+    Keeps the count, sum, min and max as well, so the mean is exact and percentiles are bucket estimates.
+    '''
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        '''
+        :param bounds: upper bounds of the buckets, ascending. Values above the last bound go in an overflow bucket
+        '''
+        self.lock = threading.Lock()
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def percentile(self, p):
+        '''
+        :param p: between 0 and 100
+        :return the upper bound of the bucket holding the p-th percentile, or the max for the overflow bucket
+        '''
+        with self.lock:
+            if not self.count:
+                return None
+            rank = p / 100.0 * self.count
+            seen = 0
+            for i, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    if i < len(self.bounds):
+                        return min(self.bounds[i], self.max)
+                    return self.max
+            return self.max
+
+    def format(self):
+        if not self.count:
+            return "no samples"
+        return "n=%d mean=%.2f min=%.2f p50<=%.2f p90<=%.2f p99<=%.2f max=%.2f" % (
+            self.count, self.mean(), self.min, self.percentile(50), self.percentile(90), self.percentile(99), self.max)
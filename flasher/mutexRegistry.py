@@ -0,0 +1,124 @@
+import collections
+import threading
+import time
+from metrics import Histogram
+
+DEFAULT_PERMITS = 1
+
+
+class FairLock(object):
+    '''
+    A lock, or with more than one permit a semaphore, granted in the order it was asked for.
+    A release hands the permit straight to the longest waiting owner, so no port can overtake another and only that one wakes up.
+    Records how long owners wait for it and how long they hold it, overall and per owner
+    '''
+    def __init__(self, name, permits=DEFAULT_PERMITS):
+        '''
+        :param name: the name used with @mutex
+        :param permits: how many owners may hold it at the same time
+        '''
+        self.name = name
+        self.permits = permits
+        self.available = permits
+        self.lock = threading.Lock()
+        self.waiters = collections.deque() # (owner, event) in the order they asked
+        self.holders = {} # owner -> time it got a permit
+        self.waitTime = Histogram()
+        self.holdTime = Histogram()
+        self.ownerWaitTime = {} # owner -> Histogram
+        self.ownerHoldTime = {} # owner -> Histogram
+
+    def acquire(self, owner):
+        '''
+        Wait, if necessary, until a permit is free and take it
+        :param owner: who takes it, e.g. the port's uid. An owner holds at most one permit of a lock
+        '''
+        start = time.time()
+        with self.lock:
+            if self.available > 0 and not self.waiters:
+                self.available -= 1
+                event = None
+            else:
+                event = threading.Event()
+                self.waiters.append((owner, event))
+        if event:
+            event.wait()
+        now = time.time()
+        with self.lock:
+            self.holders[owner] = now
+            self._record(self.ownerWaitTime, owner, now - start)
+        self.waitTime.add(now - start)
+
+    def release(self, owner):
+        '''
+        Give the permit back, to the next waiter if there is one
+        '''
+        now = time.time()
+        with self.lock:
+            acquired = self.holders.pop(owner)
+            self._record(self.ownerHoldTime, owner, now - acquired)
+            if self.waiters:
+                nextOwner, event = self.waiters.popleft()
+                event.set()
+            else:
+                self.available += 1
+        self.holdTime.add(now - acquired)
+
+    def waiting(self):
+        return len(self.waiters)
+
+    def formatMetrics(self):
+        '''
+        :return text describing how long owners waited for and held this lock, in total and for each owner
+        '''
+        lines = ["%s: %d permit(s), %d holding, %d waiting, %.1f seconds waited in total" % (
+            self.name, self.permits, len(self.holders), len(self.waiters), self.waitTime.total)]
+        lines.append("   wait: " + self.waitTime.format())
+        lines.append("   hold: " + self.holdTime.format())
+        with self.lock:
+            owners = sorted(self.ownerWaitTime.keys())
+        for owner in owners:
+            lines.append("   " + str(owner) + " wait: " + self.ownerWaitTime[owner].format())
+            if owner in self.ownerHoldTime:
+                lines.append("   " + str(owner) + " hold: " + self.ownerHoldTime[owner].format())
+        return "\n".join(lines) + "\n"
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _record(self, histograms, owner, value):
+        '''
+        Call with the lock held
+        '''
+        if not owner in histograms:
+            histograms[owner] = Histogram()
+        histograms[owner].add(value)
+
+
+class MutexRegistry(object):
+    '''
+    The locks named by @mutex, shared by every TestingThread. Each is made the first time it is asked for
+    '''
+    def __init__(self, permits=None):
+        '''
+        :param permits: dictionary of mutex name -> number of owners allowed to hold it at once. Others get DEFAULT_PERMITS
+        '''
+        self.permits = permits or {}
+        self.lock = threading.Lock()
+        self.locks = {} # name -> FairLock
+
+    def get(self, name):
+        with self.lock:
+            if not name in self.locks:
+                self.locks[name] = FairLock(name, self.permits.get(name, DEFAULT_PERMITS))
+            return self.locks[name]
+
+    def formatMetrics(self):
+        '''
+        :return text describing the wait and hold times of every lock made so far
+        '''
+        with self.lock:
+            locks = [self.locks[name] for name in sorted(self.locks.keys())]
+        if not locks:
+            return "No mutex used yet\n"
+        return "".join(lock.formatMetrics() for lock in locks)
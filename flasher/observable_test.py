@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from functools import wraps
+import threading
 import time
+import unittest
 
 def observeTest(func):
     '''
@@ -9,11 +11,12 @@ def observeTest(func):
     to call observers both before and after the run function is called.
     Observers are called with a dict containing information about the test itself:
     when: ["before" | "after"]
+    passed: after the test, whether it passed
     method: The name of the python function used in the test
     label: A more descriptive label for this test, perhaps to show in a GUI
     testCase: The object for which the method is a member.
 
-    Additionally, decorator attributes are copied into the instance method
+    The decorator attributes are read from the TestStep of the test, compiled once per suite class
 
     :param func: The test function to get decorated
     '''
@@ -21,25 +24,18 @@ def observeTest(func):
     def wrapper(*args, **kwargs):
         instance = func.im_self  # the test case object
         methodName = instance._testMethodName  # the name of the bound testing func
-
-        '''
-        Now copy over  decorator-populated attrubtes from the unbound func to the instance method.
-        Basically, the issue is that Python 2.7 decorators (e.g. @myDecorator) are executed before any instances are instantiated
-        As a result, the instance methods (bound to their object) do not have the unbound version's attributes
-        '''
-        unboundFunc = instance.__class__.__dict__[methodName]  # get the unbound function with this name to copy its decoratored values
-        if not hasattr(instance, "_attributes"):  # if no existing attributes map
-            instance._attributes = {}  # make a new one
-        if hasattr(unboundFunc,"_attributes"):     #if the func has attributes
-            instance._attributes.update(unboundFunc._attributes)  # this will copy attributes from the unbound func into the bound method's attributes
-        if 'label' in instance._attributes:
-            label = instance._attributes['label']  # use the label that was set in the @label
+        step = stepForTest(instance)
+        if step.label is not None:
+            label = step.label  # use the label that was set in the @label
         else:
             label = methodName  # in case not found, use the method's name for the label
 
         # Populate the stateInfo for observer callbacks
         stateInfo = {"when":"before", "method":methodName, "label": label, "testCase": instance }
 
+        result = args[0] if args else kwargs.get('result') # the unittest result the test reports to
+        problems = lambda: len(result.errors) + len(result.failures) if result is not None else 0
+        problemsBefore = problems()
         start = time.time()  # let's keep track of execution time
         [observer(stateInfo) for observer in instance.stateInfoObservers]  # tell observers test is about to run
         try:
@@ -49,6 +45,7 @@ def observeTest(func):
         finally:
             end = time.time()
             stateInfo['executionTime'] = end - start  # is stateInfo the right place for this?
+            stateInfo['passed'] = problems() == problemsBefore
             stateInfo['when'] = "after"  # The test is over, so
             [observer(stateInfo) for observer in instance.stateInfoObservers]  # notify test done
         return r
@@ -142,6 +139,26 @@ def mutex(name):
     return method_call
 
 
+def bandwidth(name):
+    '''
+    @bandwidth decorator
+    :param name: the kind of traffic, e.g. "upload". The test waits for room on its usb hubs before running
+    '''
+    def method_call(method):
+        return _addAttribute(method, "bandwidth", name)
+    return method_call
+
+
+def resumable(*deviceStates):
+    '''
+    @resumable decorator
+    :param deviceStates: DeviceDescriptor states (e.g. DEVICE_FASTBOOT) in which a failed run may start again from this test
+    '''
+    def method_call(method):
+        return _addAttribute(method, "resumable", deviceStates)
+    return method_call
+
+
 def timeout(seconds):
     '''
     @timeout decorator
@@ -151,35 +168,102 @@ def timeout(seconds):
         return _addAttribute(method, "timeout", seconds)
     return method_call
 
-def decorateTest(test, stateInfoObservers=None, progressObservers=None, attributes = None, returnValues = None):
+def decorateTest(test, stateInfoObservers=None, progressObservers=None, attributes = None, returnValues = None, outputObservers = None):
     '''
     Decorate a test to use the observeTest decorator above, passing along observers
     :param test:
     :param stateInfoObservers:
-    :param progressObservers:
+    :param progressObservers: called with measured progress (0 to 1) if the test can report it
+    :param outputObservers: called with output text as the test produces it
     '''
     test.run = observeTest(test.run) # apply the decorator
     test.stateInfoObservers = []
     test.stateInfoObservers.extend(stateInfoObservers)
     test.progressObservers = []
     test.progressObservers.extend(progressObservers)
+    test.outputObservers = []
+    if outputObservers:
+        test.outputObservers.extend(outputObservers)
     test.attributes = attributes
     test.returnValues = returnValues
+    test.step = stepForTest(test)
+
+
+class TestStep(object):
+    '''
+    The decorator attributes of one test method, read once when its suite's TestPlan is compiled.
+    Immutable: every run of the suite shares it, so setting or deleting an attribute raises AttributeError
+    '''
+    __slots__ = ['method', 'label', 'progress', 'timeout', 'mutex', 'bandwidth', 'failMessage', 'errorNumber',
+                 'promptBefore', 'promptAfter', 'requiresFixture', 'resumable']
+
+    def __init__(self, method, attributes):
+        '''
+        :param method: name of the test method
+        :param attributes: the _attributes the decorators above left on the function
+        '''
+        object.__setattr__(self, 'method', method)
+        for name in self.__slots__[1:]:
+            object.__setattr__(self, name, attributes.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TestStep is immutable, can't set " + name)
+
+    def __delattr__(self, name):
+        raise AttributeError("TestStep is immutable, can't delete " + name)
 
 
-def _decoratedAttribute(test, name):
+class TestPlan(object):
     '''
-    Helper function for methods below to extract an attribute of a test's method
+    What is known about a suite class before running it: its test methods in the order unittest runs them,
+    a TestStep for each, and the sum of their @progress. Compiled on first use and shared by every run of the suite,
+    so neither loading a suite nor looking up a decorator does any reflection
+    '''
+    __slots__ = ['suiteClass', 'methods', 'steps', 'totalProgressSeconds']
+    _plans = {} # suite class -> TestPlan
+    _lock = threading.Lock()
+
+    @staticmethod
+    def forSuite(suiteClass):
+        '''
+        :param suiteClass: a unittest.TestCase subclass
+        :return its TestPlan
+        '''
+        plan = TestPlan._plans.get(suiteClass)
+        if plan is None:
+            with TestPlan._lock:
+                plan = TestPlan._plans.get(suiteClass)
+                if plan is None:
+                    plan = TestPlan._plans[suiteClass] = TestPlan(suiteClass)
+        return plan
+
+    def __init__(self, suiteClass):
+        self.suiteClass = suiteClass
+        self.methods = tuple(unittest.TestLoader().getTestCaseNames(suiteClass))
+        self.steps = {} # method name -> TestStep
+        for method in self.methods:
+            function = getattr(suiteClass, method).im_func # inherited tests have their decorators too
+            self.steps[method] = TestStep(method, getattr(function, '_attributes', {}))
+        self.totalProgressSeconds = sum(self.steps[method].progress or 0 for method in self.methods)
+
+    def makeSuite(self):
+        '''
+        :return a new unittest suite of the plan's tests, with suiteClass set
+        '''
+        suite = unittest.TestSuite(self.suiteClass(method) for method in self.methods)
+        suite.suiteClass = self.suiteClass
+        return suite
+
+
+def stepForTest(test):
+    '''
+    Get the TestStep of a test, which holds all of its decorator values
     :param test:
-    :param name:
     '''
-    funcAttributes =  test.__class__.__dict__[test._testMethodName]
-    if not hasattr(funcAttributes,'_attributes'):
-        funcAttributes._attributes = {}
-    attributes =funcAttributes._attributes  # get the decorated attributes for this test
-    if name in attributes:
-        return attributes[name]
-    return None
+    step = getattr(test, 'step', None) # set by decorateTest
+    if step is None:
+        step = TestPlan.forSuite(test.__class__).steps[test._testMethodName]
+    return step
 
 
 def labelForTest(test):
@@ -188,42 +272,42 @@ def labelForTest(test):
     Note that a None value for the label indicates that the test is run 'quietly', without a label showing up
     :param test:
     '''
-    return _decoratedAttribute(test, 'label')
+    return stepForTest(test).label
 
 def failMessageForTest(test):
     '''
     Get the @progress
     :param test:
     '''
-    return _decoratedAttribute(test, 'failMessage')
+    return stepForTest(test).failMessage
 
 def errorNumberForTest(test):
     '''
     Get the @progress
     :param test:
     '''
-    return _decoratedAttribute(test, 'errorNumber')
+    return stepForTest(test).errorNumber
 
 def promptBeforeForTest(test):
     '''
     Get the @promptBefore
     :param test:
     '''
-    return _decoratedAttribute(test, 'promptBefore')
+    return stepForTest(test).promptBefore
 
 def promptAfterForTest(test):
     '''
     Get the @promptAfter
     :param test:
     '''
-    return _decoratedAttribute(test, 'promptAfter')
+    return stepForTest(test).promptAfter
 
 def timeoutForTest(test):
     '''
     Get the @timeout
     :param test:
     '''
-    return _decoratedAttribute(test, 'timeout')
+    return stepForTest(test).timeout
 
 def requiredFixtureForTest(test):
     '''
@@ -231,21 +315,35 @@ def requiredFixtureForTest(test):
     :param test:
     '''
     #TODO this should return a unique value- the pointer ideally
-    return _decoratedAttribute(test, 'requiredFixture')
+    return stepForTest(test).requiresFixture
 
 def progressForTest(test):
     '''
     Get the @progress
     :param test:
     '''
-    return _decoratedAttribute(test, 'progress')
+    return stepForTest(test).progress
 
 def mutexForTest(test):
     '''
     Get the @progress
     :param test:
     '''
-    return _decoratedAttribute(test, 'mutex')
+    return stepForTest(test).mutex
+
+def bandwidthForTest(test):
+    '''
+    Get the @bandwidth
+    :param test:
+    '''
+    return stepForTest(test).bandwidth
+
+def resumableForTest(test):
+    '''
+    Get the @resumable device states
+    :param test:
+    '''
+    return stepForTest(test).resumable
 
 def methodForTest(test):
     '''
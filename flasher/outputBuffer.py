@@ -0,0 +1,53 @@
+import threading
+
+class OutputBuffer(object):
+    '''
+    The output of a run, kept as a list of appended chunks.
+    Appending is cheap no matter how long the transcript is. The full text is only joined when someone asks for it,
+    and the joined text is kept so asking again costs nothing until more is appended.
+    Every append gets a sequence number so a consumer of the deltas can tell where they fit.
+    '''
+    def __init__(self, text=""):
+        self.lock = threading.Lock()
+        self.chunks = []
+        self.length = 0
+        self.seq = 0
+        if text:
+            self.append(text)
+
+    def append(self, text):
+        '''
+        :param text: text to add to the end
+        :return the sequence number of this chunk
+        '''
+        with self.lock:
+            self.chunks.append(text)
+            self.length += len(text)
+            self.seq += 1
+            return self.seq
+
+    def reset(self, text=""):
+        '''
+        Replace the contents, for example at the start of a new run
+        '''
+        with self.lock:
+            self.chunks = [text] if text else []
+            self.length = len(text)
+            self.seq = 0
+
+    def getvalue(self):
+        '''
+        :return the full text
+        '''
+        with self.lock:
+            if len(self.chunks) > 1:
+                self.chunks = [''.join(self.chunks)] # join once, then keep the result
+            if not self.chunks:
+                return ""
+            return self.chunks[0]
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self.getvalue()
@@ -0,0 +1,220 @@
+import errno
+import heapq
+import itertools
+import logging
+import os
+import re
+import select
+import signal
+import subprocess
+import threading
+import time
+from future import Future
+
+LINE_END_REGEX = re.compile(r"[\r\n]")
+REAP_INTERVAL = .05 # how often to check for exited children whose pipes are already closed
+KILL_GRACE_PERIOD = 5 # seconds a process group has to exit after SIGTERM, before it is sent SIGKILL
+log = logging.getLogger("global") # LogManager's global log, once it is set up
+
+class _Child(object):
+    '''
+    Book keeping for one supervised process
+    '''
+    def __init__(self, proc, timeout, stallTimeout, lineObserver):
+        now = time.time()
+        self.proc = proc
+        self.deadline = now + timeout if timeout else None
+        self.stallTimeout = stallTimeout
+        self.lastOutputTime = now
+        self.lineObserver = lineObserver
+        self.out = []
+        self.partial = {}
+        self.killed = False
+        self.killDeadline = None # when SIGKILL follows the SIGTERM
+        self.timedOut = False
+        self.stalled = False
+        self.scheduled = False # whether its deadlines are in the heap yet
+        self.future = Future()
+
+class ProcessSupervisor(object):
+    '''
+    One thread which owns every child process started through it, normally chip-flash for every port.
+    The pipes of all children are multiplexed with poll, the timeouts come from a single heap of deadlines,
+    and a process group is terminated when it runs over its deadline or stalls, then killed if it doesn't exit.
+    The output and return code are delivered through a Future.
+    '''
+    _instance = None
+    _instanceLock = threading.Lock()
+
+    @staticmethod
+    def get():
+        '''
+        The shared supervisor, started on first use
+        '''
+        with ProcessSupervisor._instanceLock:
+            if not ProcessSupervisor._instance:
+                ProcessSupervisor._instance = ProcessSupervisor()
+                ProcessSupervisor._instance.start()
+            return ProcessSupervisor._instance
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.children = {} # fd -> child
+        self.registrations = [] # (fd, child) waiting to be added to the poll set by the supervisor thread
+        self.reaping = [] # children whose pipes are closed, waiting for exit
+        self.deadlines = [] # heap of (when, sequence, child)
+        self.sequence = itertools.count()
+        self.poller = select.poll()
+        self.wakeRead, self.wakeWrite = os.pipe()
+        self.poller.register(self.wakeRead, select.POLLIN)
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="ProcessSupervisor")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def spawn(self, cmd, cwd=None, env=None, timeout=None, stallTimeout=None, lineObserver=None, captureStderr=True):
+        '''
+        Start a process in its own process group and supervise it
+        :param cmd: Command to run. Can be array
+        :param timeout: seconds before the process group is sent SIGTERM. SIGKILL follows after KILL_GRACE_PERIOD
+        :param stallTimeout: seconds without output before the process group is sent SIGTERM, like timeout
+        :param lineObserver: called from the supervisor thread with every line of output, including its line end
+        :param captureStderr: if False, stderr is inherited instead of being read
+        :return a Future whose result is (output, returncode)
+        '''
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, shell=False, preexec_fn=os.setsid, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE if captureStderr else None, close_fds=True)
+        child = _Child(proc, timeout, stallTimeout, lineObserver)
+        pipes = [proc.stdout, proc.stderr] if captureStderr else [proc.stdout]
+        with self.lock:
+            for pipe in pipes:
+                child.partial[pipe.fileno()] = ''
+                self.registrations.append((pipe.fileno(), child))
+        self._wake()
+        return child.future
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _wake(self):
+        try:
+            os.write(self.wakeWrite, 'x')
+        except OSError:
+            pass
+
+    def _run(self):
+        while True:
+            self._addRegistrations()
+            timeout = self._nextTimeout()
+            try:
+                events = self.poller.poll(None if timeout is None else timeout * 1000)
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd, event in events:
+                if fd == self.wakeRead:
+                    os.read(self.wakeRead, 4096)
+                    continue
+                self._read(fd)
+            self._expireDeadlines()
+            self._reap()
+
+    def _addRegistrations(self):
+        with self.lock:
+            registrations = self.registrations
+            self.registrations = []
+        for fd, child in registrations:
+            self.children[fd] = child
+            self.poller.register(fd, select.POLLIN | select.POLLHUP | select.POLLERR)
+            if not child.scheduled:
+                child.scheduled = True
+                if child.deadline:
+                    heapq.heappush(self.deadlines, (child.deadline, next(self.sequence), child))
+                if child.stallTimeout:
+                    heapq.heappush(self.deadlines, (child.lastOutputTime + child.stallTimeout, next(self.sequence), child))
+
+    def _nextTimeout(self):
+        timeouts = []
+        if self.deadlines:
+            timeouts.append(max(0, self.deadlines[0][0] - time.time()))
+        if self.reaping:
+            timeouts.append(REAP_INTERVAL)
+        if not timeouts:
+            return None
+        return min(timeouts)
+
+    def _read(self, fd):
+        child = self.children[fd]
+        try:
+            data = os.read(fd, 4096)
+        except OSError:
+            data = ''
+        if not data: # EOF
+            self.poller.unregister(fd)
+            del self.children[fd]
+            text = child.partial.pop(fd)
+            if text:
+                self._onLine(child, text)
+            if not child.partial: # all pipes closed
+                self.reaping.append(child)
+            return
+        child.lastOutputTime = time.time()
+        child.out.append(data)
+        text = child.partial[fd] + data
+        start = 0
+        for match in LINE_END_REGEX.finditer(text):
+            self._onLine(child, text[start:match.end()])
+            start = match.end()
+        child.partial[fd] = text[start:]
+
+    def _onLine(self, child, line):
+        if child.lineObserver:
+            try:
+                child.lineObserver(line)
+            except Exception: # an observer must never take down the supervisor
+                log.exception("Line observer %r failed", child.lineObserver)
+
+    def _expireDeadlines(self):
+        now = time.time()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            when, sequence, child = heapq.heappop(self.deadlines)
+            if child.future.done():
+                continue
+            if child.killed:
+                if now >= child.killDeadline: # still has its pipes open or hasn't exited since SIGTERM
+                    self._signal(child, signal.SIGKILL)
+                continue
+            if child.deadline and now >= child.deadline:
+                child.timedOut = True
+                self._kill(child)
+            elif child.stallTimeout:
+                stallDeadline = child.lastOutputTime + child.stallTimeout
+                if now >= stallDeadline:
+                    child.stalled = True
+                    self._kill(child)
+                else: # there was output since this was scheduled
+                    heapq.heappush(self.deadlines, (stallDeadline, next(self.sequence), child))
+
+    def _kill(self, child):
+        child.killed = True
+        child.killDeadline = time.time() + KILL_GRACE_PERIOD
+        self._signal(child, signal.SIGTERM)
+        heapq.heappush(self.deadlines, (child.killDeadline, next(self.sequence), child))
+
+    def _signal(self, child, signum):
+        try:
+            os.killpg(child.proc.pid, signum)
+        except OSError: # the group is gone already
+            pass
+
+    def _reap(self):
+        for child in list(self.reaping):
+            if child.proc.poll() is not None:
+                self.reaping.remove(child)
+                for pipe in [child.proc.stdout, child.proc.stderr]:
+                    if pipe:
+                        pipe.close()
+                child.future.setResult((''.join(child.out), child.proc.returncode))
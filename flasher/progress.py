@@ -4,7 +4,10 @@ class Progress(object):
     '''
     Small class to keep track of progress and update progress observers on change
     '''
-    def __init__(self, progressObservers = [], timeoutObservers = [], start = 0.0, finish=1.0, timeout=None):
+    def __init__(self, progressObservers = [], timeoutObservers = [], start = 0.0, finish=1.0, timeout=None, interval=1):
+        '''
+        :param interval: seconds between automatic progress steps. None if progress is only set explicitly
+        '''
         self.progressObservers = progressObservers
         self.timeoutObservers = timeoutObservers
         self.start = start
@@ -12,7 +15,9 @@ class Progress(object):
         self.current = start
         self.timeout = timeout
         self.timedOut = False
-        self.cancelProgressSchedule = call_repeatedly(1,self.addProgress.__get__(self,Progress), 1 )
+        self.cancelProgressSchedule = lambda: None
+        if interval:
+            self.cancelProgressSchedule = call_repeatedly(interval,self.addProgress.__get__(self,Progress), interval )
     
     def stopListening(self):
         self.cancelProgressSchedule()
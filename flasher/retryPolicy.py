@@ -0,0 +1,83 @@
+import collections
+import threading
+from config import *
+from observable_test import resumableForTest
+
+class RetryPolicy(object):
+    '''
+    Decides whether a failed run is tried again without the operator replugging the CHIP, and from which test.
+    A failure is retried when its suite lists the test's exit code in retryableErrors (e.g. Flasher's fastboot failures),
+    from the latest test at or before the failed one that is @resumable in the state the device is in after the backoff.
+    So a CHIP still in fastboot after a failed UBI upload only uploads again, without going through FEL and the "fel" mutex.
+    Attempts are capped and the backoff between them doubles up to a maximum.
+    Every failed attempt is written to the log database
+    '''
+    def __init__(self, maxAttempts=RETRY_MAX_ATTEMPTS, backoff=RETRY_BACKOFF, maxBackoff=RETRY_MAX_BACKOFF):
+        '''
+        :param maxAttempts: runs of a failing stage at most, the first one included. 1 never retries
+        :param backoff: seconds to wait before the first retry
+        :param maxBackoff: seconds to wait at most between two attempts
+        '''
+        self.maxAttempts = maxAttempts
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.lock = threading.Lock()
+        self.outcomes = collections.defaultdict(int) # (exit code, "retried" | "recovered" | "gave up" | "fatal") -> count
+        self.databaseLogger = None
+
+    def attach(self, databaseLogger):
+        '''
+        Write every failed attempt to the log database
+        :param databaseLogger: DatabaseLogger of this host
+        '''
+        self.databaseLogger = databaseLogger
+
+    def isRetryable(self, testCase, exitCode):
+        '''
+        :param exitCode: what the failed test left in testCase.exitCode, None if it didn't say
+        '''
+        return exitCode is not None and exitCode in getattr(testCase.__class__, 'retryableErrors', [])
+
+    def delay(self, attempt):
+        '''
+        :param attempt: the attempt that just failed, 1 for the first one
+        :return seconds to wait before the next one
+        '''
+        return min(self.maxBackoff, self.backoff * 2 ** (attempt - 1))
+
+    def resumeIndex(self, tests, failedIndex, deviceState):
+        '''
+        :param tests: the tests of the suite, in the order they run
+        :param failedIndex: index of the test that failed
+        :param deviceState: DeviceDescriptor.getDeviceState() of the port now
+        :return index of the test to run again from, None if none can be entered in this state
+        '''
+        for index in range(failedIndex, -1, -1):
+            if deviceState in (resumableForTest(tests[index]) or []):
+                return index
+        return None
+
+    def record(self, suite, stage, port, attempt, exitCode, resumeStage, seconds, outcome):
+        '''
+        An attempt ended
+        :param suite: name of the suite class
+        :param stage: name of the test method that failed, or that passed after retries
+        :param resumeStage: name of the test the next attempt starts from, "" if there is none
+        :param outcome: "retried", "recovered" (passed after retrying), "gave up" (retryable but out of attempts or no test to resume from) or "fatal"
+        '''
+        with self.lock:
+            self.outcomes[(exitCode, outcome)] += 1
+        if self.databaseLogger and outcome != "recovered":
+            self.databaseLogger.logRetryAttempt(suite, stage, port, attempt, exitCode, resumeStage, seconds)
+
+    def formatMetrics(self):
+        '''
+        :return text with the number of failures of each exit code retried, recovered, given up on, or not retryable
+        '''
+        lines = ["Retries: at most %d attempts, %g to %g seconds apart" % (self.maxAttempts, self.backoff, self.maxBackoff)]
+        with self.lock:
+            outcomes = dict(self.outcomes)
+        for exitCode in sorted(set(exitCode for exitCode, outcome in outcomes.keys())):
+            lines.append("   exit code %s: " % exitCode + ", ".join("%d %s" % (outcomes[(exitCode, outcome)], outcome)
+                for outcome in ["retried", "recovered", "gave up", "fatal"] if (exitCode, outcome) in outcomes))
+        return "\n".join(lines) + "\n"
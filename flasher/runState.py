@@ -1,4 +1,5 @@
 #states
+from outputBuffer import OutputBuffer
 
 class RunState:
     '''
@@ -16,7 +17,7 @@ class RunState:
     def __init__(self, uid):
         self.uid = uid
         self.state = self.PASSIVE_STATE
-        self.output = " "
+        self.output = OutputBuffer(" ")
         
     def isActive(self):
         return self.state == self.ACTIVE_STATE
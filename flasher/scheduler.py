@@ -1,8 +1,16 @@
-
 #This code taken from http://stackoverflow.com/questions/12435211/python-threading-timer-repeat-function-every-n-seconds
 
+import atexit
+import heapq
+import itertools
+import logging
+import math
 import threading
-from threading import Event, Thread
+import time
+from threading import Thread
+
+TICK = .05 # resolution of the scheduler in seconds. Callbacks due in the same tick run in one wake up
+log = logging.getLogger("global") # LogManager's global log, once it is set up
 
 
 def setInterval(interval):
@@ -21,10 +29,172 @@ def setInterval(interval):
         return wrapper
     return decorator
 
-def call_repeatedly(interval, func, *args):
-    stopped = Event()
-    def loop():
-        while not stopped.wait(interval): # the first call is in `interval` secs
+
+class Handle(object):
+    '''
+    A scheduled callback. Call cancel to stop it
+    '''
+    __slots__ = ['tick', 'interval', 'func', 'args', 'batch', 'cancelled']
+
+    def __init__(self, tick, interval, func, args, batch):
+        self.tick = tick
+        self.interval = interval
+        self.func = func
+        self.args = args
+        self.batch = batch
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler(object):
+    '''
+    A single thread which runs every timed callback in the application from a heap of deadlines,
+    so the number of threads does not depend on how many ports are busy.
+    Deadlines are rounded up to a TICK. Within a tick, identical callbacks (same function and arguments) run once,
+    and callbacks scheduled with a batch function are collected and handed to it in one call.
+    '''
+    _instance = None
+    _instanceLock = threading.Lock()
+
+    @staticmethod
+    def get():
+        '''
+        The shared scheduler, started on first use
+        '''
+        with Scheduler._instanceLock:
+            if not Scheduler._instance:
+                Scheduler._instance = Scheduler()
+                Scheduler._instance.start()
+                atexit.register(Scheduler._instance.shutdown)
+            return Scheduler._instance
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.heap = [] # (tick, sequence, handle)
+        self.sequence = itertools.count()
+        self.stopped = False
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self._run, name="Scheduler")
+        self.thread.daemon = True # stop if the program exits
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def shutdown(self):
+        '''
+        Stop and wait briefly for the thread, so it isn't torn down mid-callback when the interpreter exits
+        '''
+        self.stop()
+        self.thread.join(1)
+
+    def wait(self):
+        '''
+        Block the calling thread until the scheduler is stopped. Used by apps whose main thread has nothing else to do
+        '''
+        while self.thread.is_alive():
+            self.thread.join(1) # a join with a timeout can be interrupted with ctrl-c
+
+    def call_later(self, delay, func, *args):
+        '''
+        Call func once after delay seconds
+        :return a Handle
+        '''
+        return self._schedule(delay, None, func, args, None)
+
+    def call_repeatedly(self, interval, func, *args):
+        '''
+        Call func every interval seconds. The first call is in interval seconds
+        :return a Handle
+        '''
+        return self._schedule(interval, interval, func, args, None)
+
+    def call_batched(self, interval, batch, item):
+        '''
+        Every interval seconds, batch is called once with a list of all of the items registered with it that are due in that tick
+        :return a Handle
+        '''
+        return self._schedule(interval, interval, None, (item,), batch)
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _toTick(self, when):
+        return int(math.ceil(when / TICK))
+
+    def _schedule(self, delay, interval, func, args, batch):
+        handle = Handle(self._toTick(time.time() + delay), interval, func, args, batch)
+        with self.condition:
+            heapq.heappush(self.heap, (handle.tick, next(self.sequence), handle))
+            if self.heap[0][2] is handle: # new earliest deadline, so wake up sooner
+                self.condition.notify()
+        return handle
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.stopped:
+                    if self.heap:
+                        wait = self.heap[0][0] * TICK - time.time()
+                        if wait <= 0:
+                            break
+                        self.condition.wait(wait)
+                    else:
+                        self.condition.wait()
+                if self.stopped:
+                    return
+                due = []
+                currentTick = self._toTick(time.time())
+                while self.heap and self.heap[0][0] <= currentTick:
+                    due.append(heapq.heappop(self.heap)[2])
+                for handle in due: # reschedule the repeating ones before running anything, skipping missed ticks
+                    if handle.interval and not handle.cancelled:
+                        step = max(1, int(round(handle.interval / TICK)))
+                        handle.tick += step * max(1, (currentTick - handle.tick) // step + 1)
+                        heapq.heappush(self.heap, (handle.tick, next(self.sequence), handle))
+            self._runDue(due)
+
+    def _runDue(self, due):
+        called = set()
+        batches = [] # (function, items). A list because bound methods compare equal but aren't always hashable
+        for handle in due:
+            if handle.cancelled:
+                continue
+            if handle.batch:
+                for batch, items in batches:
+                    if batch == handle.batch:
+                        items.append(handle.args[0])
+                        break
+                else:
+                    batches.append((handle.batch, [handle.args[0]]))
+                continue
+            key = (handle.func, handle.args)
+            try:
+                if key in called: # coalesce identical callbacks due in the same tick
+                    continue
+                called.add(key)
+            except TypeError: # unhashable arguments can't be coalesced
+                pass
+            self._call(handle.func, *handle.args)
+        for batch, items in batches:
+            self._call(batch, items)
+
+    def _call(self, func, *args):
+        try:
             func(*args)
-    Thread(target=loop).start()    
-    return stopped.set
\ No newline at end of file
+        except Exception: # one bad callback must not stop every other timer
+            log.exception("Scheduled callback %r failed", func)
+
+
+def call_repeatedly(interval, func, *args):
+    '''
+    Call func every interval seconds from the shared scheduler thread
+    :return a function that cancels the calls
+    '''
+    return Scheduler.get().call_repeatedly(interval, func, *args).cancel
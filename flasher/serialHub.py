@@ -0,0 +1,301 @@
+import atexit
+import errno
+import heapq
+import itertools
+import os
+import re
+import select
+import threading
+import time
+import serial
+from future import Future, TimeoutError
+from streamMatcher import StreamMatcher, RateLimitedLog
+
+def promptRegex(prompt):
+    '''
+    :return a regex matching a shell prompt at the end of what has been received so far, optionally followed by spaces
+    '''
+    return re.compile(re.escape(prompt) + r'\s*\Z')
+
+class _Waiter(object):
+    '''
+    One pending expect on a stream
+    '''
+    def __init__(self, patterns, answer, nudge, nudgeInterval):
+        self.patterns = patterns
+        self.answer = answer
+        self.nudge = nudge
+        self.nudgeInterval = nudgeInterval
+        self.future = Future()
+
+class SerialStream(object):
+    '''
+    One serial device registered with the hub. Received text is kept in a StreamMatcher until an expect consumes it,
+    so each read only costs a search of the new text
+    '''
+    def __init__(self, hub, path, port):
+        self.hub = hub
+        self.path = path
+        self.port = port
+        self.fd = port.fileno()
+        self.lock = threading.Lock()
+        self.portLock = threading.Lock() # the hub closes the port on a disconnect, possibly while another thread is writing
+        self.matcher = StreamMatcher() # received and not consumed yet
+        self.waiters = []
+        self.matching = None # the waiter whose patterns the matcher has
+        self.closed = False
+        self.log = RateLimitedLog(path + ": ")
+        self.received = 0
+
+    def write(self, text):
+        with self.portLock:
+            if not self.port.isOpen(): # is_open needs pyserial 3
+                raise IOError("Serial device closed: " + self.path)
+            self.port.write(text)
+
+    def discard(self):
+        '''
+        Forget everything received so far, like the boot messages before a login
+        '''
+        with self.lock:
+            self.matcher.discard()
+
+    def expect(self, pattern, timeout=None, answer=None, nudge=None, nudgeInterval=1):
+        '''
+        Wait for pattern to show up in what is received
+        :param pattern: regex or compiled regex, or a list of them, searched for in the received text that has not been consumed yet.
+        With a list, the earliest match wins and match.re tells which one it was
+        :param timeout: seconds before the future fails with TimeoutError. None waits forever
+        :param answer: text written, followed by a new line, as soon as the pattern is found
+        :param nudge: text written every nudgeInterval seconds until the pattern is found, e.g. '\n' to get a prompt again
+        :return a Future whose result is (match, text), text being everything received up to the end of the match.
+        That text is consumed, so the next expect only looks at what follows it
+        '''
+        patterns = pattern if isinstance(pattern, list) else [pattern]
+        waiter = _Waiter([re.compile(item) if isinstance(item, basestring) else item for item in patterns], answer, nudge, nudgeInterval)
+        with self.lock:
+            if self.closed:
+                waiter.future.setException(IOError("Serial device closed: " + self.path))
+                return waiter.future
+            self.waiters.append(waiter)
+            matched = self._match()
+        self._finish(matched)
+        if not waiter.future.done():
+            self.hub._schedule(self, waiter, timeout)
+        return waiter.future
+
+    def close(self):
+        self.hub._unregister(self)
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _onData(self, data):
+        with self.lock:
+            self.matcher.feed(data)
+            self.received += len(data)
+            matched = self._match()
+        self.log.log(str(self.received) + " bytes read")
+        self._finish(matched)
+
+    def _match(self):
+        '''
+        Consume the text for every waiter whose pattern is found, in order. Call with the lock held
+        :return list of (waiter, match, text)
+        '''
+        matched = []
+        while self.waiters:
+            waiter = self.waiters[0]
+            if waiter.future.done(): # timed out
+                self.waiters.pop(0)
+                continue
+            if not self.matching is waiter:
+                self.matching = waiter
+                self.matcher.setPatterns(waiter.patterns)
+            found = self.matcher.search()
+            if not found:
+                break
+            index, match, offset, text = found
+            self.waiters.pop(0)
+            matched.append((waiter, match, text))
+        return matched
+
+    def _finish(self, matched):
+        for waiter, match, text in matched:
+            if waiter.answer is not None:
+                try:
+                    self.write(waiter.answer + '\n')
+                except Exception, e:
+                    waiter.future.setException(e)
+                    continue
+            waiter.future.setResult((match, text))
+
+    def _fail(self, exception):
+        with self.lock:
+            self.closed = True
+            waiters = self.waiters
+            self.waiters = []
+        for waiter in waiters:
+            if not waiter.future.done():
+                waiter.future.setException(exception)
+
+
+class SerialHub(object):
+    '''
+    One thread which reads every open serial device (normally each CHIP's serial gadget) with a single poll,
+    hands the bytes to each device's stream, and runs the timeouts and nudges of the pending expects from one heap.
+    Test code blocks on futures instead of each port's thread polling its own device.
+    '''
+    _instance = None
+    _instanceLock = threading.Lock()
+
+    @staticmethod
+    def get():
+        '''
+        The shared hub, started on first use
+        '''
+        with SerialHub._instanceLock:
+            if not SerialHub._instance:
+                SerialHub._instance = SerialHub()
+                SerialHub._instance.start()
+                atexit.register(SerialHub._instance.shutdown)
+            return SerialHub._instance
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.streams = {} # fd -> stream. Only touched by the hub thread
+        self.changes = [] # (stream, add) waiting for the hub thread
+        self.timers = [] # heap of (when, sequence, stream, waiter, isNudge)
+        self.sequence = itertools.count()
+        self.poller = select.poll()
+        self.wakeRead, self.wakeWrite = os.pipe()
+        self.poller.register(self.wakeRead, select.POLLIN)
+        self.stopped = False
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="SerialHub")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def shutdown(self):
+        '''
+        Stop the thread and wait briefly for it, so it isn't torn down mid-read when the interpreter exits
+        '''
+        self.stopped = True
+        self._wake()
+        self.thread.join(1)
+
+    def open(self, path, baudrate=115200):
+        '''
+        Open a serial device and start reading it
+        :return a SerialStream
+        '''
+        port = serial.Serial(path, baudrate, timeout=0) # reads never block. The hub only reads when poll says there is data
+        stream = SerialStream(self, path, port)
+        with self.lock:
+            self.changes.append((stream, True))
+        self._wake()
+        return stream
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _unregister(self, stream):
+        with self.lock:
+            self.changes.append((stream, False))
+        self._wake()
+
+    def _schedule(self, stream, waiter, timeout):
+        now = time.time()
+        with self.lock:
+            if timeout is not None:
+                heapq.heappush(self.timers, (now + timeout, next(self.sequence), stream, waiter, False))
+            if waiter.nudge is not None:
+                heapq.heappush(self.timers, (now + waiter.nudgeInterval, next(self.sequence), stream, waiter, True))
+        self._wake()
+
+    def _wake(self):
+        try:
+            os.write(self.wakeWrite, 'x')
+        except OSError:
+            pass
+
+    def _run(self):
+        while not self.stopped:
+            self._applyChanges()
+            try:
+                events = self.poller.poll(self._nextTimeout())
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd, event in events:
+                if fd == self.wakeRead:
+                    os.read(self.wakeRead, 4096)
+                    continue
+                self._read(fd)
+            self._runTimers()
+
+    def _applyChanges(self):
+        with self.lock:
+            changes = self.changes
+            self.changes = []
+        for stream, add in changes:
+            if add:
+                self.streams[stream.fd] = stream
+                self.poller.register(stream.fd, select.POLLIN | select.POLLHUP | select.POLLERR)
+            else:
+                self._remove(stream, IOError("Serial device closed: " + stream.path))
+
+    def _remove(self, stream, exception):
+        if self.streams.get(stream.fd) is stream: # a stream closed after a disconnect may share its fd number with a newer one
+            del self.streams[stream.fd]
+            self.poller.unregister(stream.fd)
+        stream._fail(exception)
+        with stream.portLock:
+            try:
+                stream.port.close()
+            except Exception:
+                pass
+
+    def _nextTimeout(self):
+        with self.lock:
+            if not self.timers:
+                return None
+            return max(0, self.timers[0][0] - time.time()) * 1000
+
+    def _read(self, fd):
+        stream = self.streams.get(fd)
+        if not stream:
+            return
+        try:
+            data = os.read(fd, 4096)
+        except OSError, e:
+            if e.errno == errno.EAGAIN:
+                return
+            data = ''
+        if not data: # the device went away, e.g. the CHIP was unplugged or powered off
+            self._remove(stream, IOError("Serial device disconnected: " + stream.path))
+            return
+        stream._onData(data)
+
+    def _runTimers(self):
+        now = time.time()
+        due = []
+        with self.lock:
+            while self.timers and self.timers[0][0] <= now:
+                due.append(heapq.heappop(self.timers))
+        for when, sequence, stream, waiter, isNudge in due:
+            if waiter.future.done():
+                continue
+            if not isNudge:
+                waiter.future.setException(TimeoutError("Timed out waiting for " + " or ".join(regex.pattern for regex in waiter.patterns) + " on " + stream.path))
+                continue
+            try:
+                stream.write(waiter.nudge)
+            except Exception, e:
+                waiter.future.setException(e)
+                continue
+            with self.lock:
+                heapq.heappush(self.timers, (now + waiter.nudgeInterval, next(self.sequence), stream, waiter, True))
@@ -3,23 +3,30 @@ import logging
 import os
 import serial
 import sys
+import threading
 import time
 import re
 
+from serialHub import SerialHub
+from future import TimeoutError
+from metrics import Histogram
+
 # from usb import USB #it would be nice if we could get the device this way, but I don't see how -HK
 # import termios
-from pexpect import fdpexpect
-import pexpect
 
-COMMAND_PROMPT = r'.*chip.*[$#] '
-COMMAND_PROMPT_REGEX = re.compile(r'.*chip.*[$#] ')
+COMMAND_PROMPT = r'[^\r\n]*chip[^\r\n]*[$#] '
+COMMAND_PROMPT_REGEX = re.compile(COMMAND_PROMPT + r'\Z') # prompts only count when they are the last thing received
 COMMAND_DELIMETER = "END_COMMAND" # careful not to put any special REGEX chars in this string
 DELIMETER_NEW_LINE_REGEX = re.compile(COMMAND_DELIMETER +  r"\r\n")
 DELIMITER_NEW_LINE_COMMAND_PROMPT_REGEX = re.compile(COMMAND_DELIMETER + r"\r\n" + COMMAND_PROMPT)
+BEGIN_DELIMETER = "BEGIN_COMMAND"
+# The output of command n of a batch, framed by send_many as BEGIN_COMMAND_n, the output, then END_COMMAND_n:<exit status>.
+# The echoed command lines hold "$?" rather than digits, and the marker is never right before a new line in them, so they can't match
+FRAMED_RESULT_REGEX = re.compile(BEGIN_DELIMETER + r"_(\d+)\r?\n(.*?)" + COMMAND_DELIMETER + r"_\1:(\d+)\r?\n", re.DOTALL)
 
-LOGIN_REGEX = re.compile(r".*login: ")
-PASSWORD_REGEX = re.compile(r".*assword.*")
-UBOOT_REGEX = re.compile(r"=>")
+LOGIN_REGEX = re.compile(r"login: \Z")
+PASSWORD_REGEX = re.compile(r"assword:\s*\Z")
+UBOOT_REGEX = re.compile(r"=> \Z")
 LOGIN_INCORRECT = re.compile(r"Login incorrect")
 # COMMAND_PROMPT_REGEX = 'root@chip:~#'
 # COMMAND_PROMPT_REGEX = '# '
@@ -29,143 +36,143 @@ BAUD=115200
 # BAUD=9600
 
 SERIAL_DEVICE_NAME="/dev/chip-2-1-serial" 
-TIMEOUT = 10 #this really doesn't do much
+TIMEOUT = 10 #how long commands wait for the prompt to come back
+LOGIN_TIMEOUT = 15 # seconds to wait for each prompt while logging in
+BOOT_TIMEOUT = 60 # seconds to wait for the login prompt after resetting from u-boot
+NUDGE_INTERVAL = .5 # seconds between blank lines sent to get a prompt printed, while the console state is unknown
+RETRY_BACKOFF = .1 # seconds before the first retry of a failed connection or login. Doubles on each retry
+RETRY_BACKOFF_MAX = 2
 # 
 # logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 # serialLog = logging.getLogger("serial")
 
 class SerialConnection(object):
     '''
-    Class which manages a serial connection. Once connected, it can be used to send and receive commands
+    Class which manages a serial connection. Once connected, it can be used to send and receive commands.
+    The console is read by the SerialHub, and logging in only waits on prompts: each answer is sent as soon as its prompt shows up
     '''
-    
+    loginLatency = {} # serial device name -> Histogram of the seconds from connect to a command prompt
+    loginLatencyLock = threading.Lock()
+
     def __init__(self,login=LOGIN, password=PASSWORD, serialDeviceName=SERIAL_DEVICE_NAME):
         '''
         Constructor
         :param login: remote login
         :param password: remote password
         '''
-#         if serialDeviceName is None:
-#             self.usb = USB()
-#             device = self.usb.find_device("serial-gadget")
-#             pass
-#             
-            
-#         usb1.USBContext.getByVendorIDAndProductID(self, vendor_id, product_id, skip_on_access_error, skip_on_error)
         self.login = login;
         self.password = password;
         # self.serialDeviceName = "/dev/tty.usbmodem1421"
         self.serialDeviceName = serialDeviceName
         self.timeout = TIMEOUT #how long commands should wait for until timing out.
         self.loggedIn = False
-        self.tty = None
-        self.ser = None
+        self.stream = None
+        self.lastLoginSeconds = None
     def __del__(self):
         self.close()
-    
+
+    @staticmethod
+    def formatLoginLatency():
+        '''
+        :return text with the login latency of each port
+        '''
+        with SerialConnection.loginLatencyLock:
+            return "".join(name + ": " + histogram.format() + "\n" for name, histogram in sorted(SerialConnection.loginLatency.iteritems()))
+
     def __connectUsingSerial(self):
         try:
             print "connecting to " + self.serialDeviceName
-            self.ser = serial.Serial(port=self.serialDeviceName, baudrate=BAUD, timeout=self.timeout)  # open the serial port. Must make a class member so it won't get cleaned up
+            self.stream = SerialHub.get().open(self.serialDeviceName, BAUD)
+            return True
         except Exception, e:
-            if e.errno == 2:
+            if getattr(e, 'errno', None) == 2:
                 print ("Could not open serial device: " + self.serialDeviceName)
             else:
                 print (e)
-            self.ser = None
+            self.stream = None
             return False
 
-        try:
-            self.tty = fdpexpect.fdspawn(self.ser)  # , 'wb', timeout=50)
-            assert (self.tty.isalive())
-            print "have a tty"
-        except Exception, e:
-            self.ser = None
-            self.tty = None
-            print ("Could not open serial device [2]: " + self.serialDeviceName)
-            return False
-            
     def connect(self, timeout=60):
         '''
-        Connect AND login
-        :param tries:
+        Connect AND login. Failed attempts are retried after a backoff that doubles each time, up to RETRY_BACKOFF_MAX
+        :param timeout: seconds before giving up
         '''
-        elapsedTime = 0
-        startTime = time.time() 
+        startTime = time.time()
+        deadline = startTime + timeout
+        backoff = RETRY_BACKOFF
         print ("connecting")
         while not self.loggedIn: #when either no conneciton or login
-            if not self.ser: #if no connection
+            if not self.stream: #if no connection
                 self.__connectUsingSerial() # try and get one
-            if self.ser and self.tty: #if have a connection, try to use it
+            if self.stream: #if have a connection, try to use it
                 print ("Trying to login ")
-                if self.doLogin(): #if can use it, success
+                if self.doLogin(min(LOGIN_TIMEOUT, max(deadline - time.time(), 0)), startTime): #if can use it, success
                     break
 
-            elapsedTime = elapsedTime +1
-            if time.time() - startTime > timeout:
+            remaining = deadline - time.time()
+            if remaining <= 0:
                 raise Exception("TIMEOUT")
-            time.sleep(1) # wait and try again
+            time.sleep(min(backoff, remaining)) # wait and try again
+            backoff = min(backoff * 2, RETRY_BACKOFF_MAX)
 
-        
-    def doLogin(self):
+    def doLogin(self, timeout=LOGIN_TIMEOUT, startTime=None):
         '''
-        Logs in if necessary. The result of this call is the remote has a command prompt and is ready
+        Logs in if necessary. The result of this call is the remote has a command prompt and is ready.
+        Until a prompt shows, blank lines are sent to get one printed. After an answer, only the next prompt is waited for.
+        :param timeout: seconds to wait for each prompt
+        :param startTime: when the login started, for the latency. Defaults to now
+        :return True if logged in
         '''
+        startTime = startTime or time.time()
         try:
             sawLogin = False # if already saw login prompt, don't send a second one. This is because login message contains the word login:
+            nudge = '\n'
+            wait = timeout
             while True:
                 try:
-                    index = self.tty.expect_list([LOGIN_REGEX, PASSWORD_REGEX, UBOOT_REGEX, COMMAND_PROMPT_REGEX, pexpect.EOF, pexpect.TIMEOUT,LOGIN_INCORRECT], timeout=15)
-                except Exception, e:
-                    print ("couldn't read, maybe timeout")
-#                     serialLog.exception(e)
-                    return False;
-                # Go through the various possibilities. The index corresponds to the array passed into expect() above
-                print (self.tty.before)
-                if index == 0:
+                    match, text = self.stream.expect([LOGIN_REGEX, PASSWORD_REGEX, UBOOT_REGEX, COMMAND_PROMPT_REGEX, LOGIN_INCORRECT],
+                                                     timeout=wait, nudge=nudge, nudgeInterval=NUDGE_INTERVAL).result()
+                except TimeoutError:
+                    print ("timeout")
+                    return False
+                # Go through the various possibilities
+                print (text)
+                nudge = None # a prompt was printed, so the next one follows whatever is sent now
+                wait = timeout
+                if match.re is LOGIN_REGEX:
                     if sawLogin: # ignore if already saw - this is for the post login message
                         continue
                     print ("Sending login")
                     sawLogin = True
-                    self.tty.sendline(self.login)
-                    time.sleep(.5)
-                elif index == 1:
+                    self.stream.write(self.login + '\n')
+                elif match.re is PASSWORD_REGEX:
                     print ("Sending password")
-                    self.tty.sendline(self.password)
-                    time.sleep(2)
-                elif index == 2:
+                    self.stream.write(self.password + '\n')
+                elif match.re is UBOOT_REGEX:
                     print ("Uboot prompt detected")
                     sawLogin = False
-                    self.tty.sendline("reset") # Reset CHIP so that we're no longer in the uboot environment.
-                    time.sleep(5) # Wait to make sure we're passed the "press any key to stop autoboot" prompt
-                    self.tty = None
-                elif index == 3:
+                    self.stream.write("reset\n") # Reset CHIP so that we're no longer in the uboot environment.
+                    wait = max(timeout, BOOT_TIMEOUT) # no blank lines until the login prompt, which would stop the autoboot
+                elif match.re is COMMAND_PROMPT_REGEX:
                     print ("Have prompt, logged in")
+                    self.stream.write("stty columns 180\n") #without this, long commands will hang!
+                    self.stream.expect(COMMAND_PROMPT_REGEX, timeout=timeout).result() # the prompt is back once it took effect
                     self.loggedIn = True
-                    self.tty.sendline("stty columns 180") #without this, long commands will hang!
-                    time.sleep(1) #give this command time to take effect. 
                     break  # we have a command prompt, either through login or already there
-                elif index == 4: #benign, try again
-                    if not sawLogin:
-                        print ("sending blank line")
-                        self.tty.sendline("")
-                        return False
-                    print ("EOF on login. benign")
-                    time.sleep(1) #wait and try again
-                elif index == 5: # The session was closed by the remote.
-                    print ("timeout")
-                    return False
-#                     self.close()
-                elif index == 6:
+                elif match.re is LOGIN_INCORRECT:
                     print ("Login failed")
-                    self.sawLogin = False
-                    time.sleep(2)
+                    sawLogin = False # the login prompt follows
+        except IOError, e: # the device went away. connect opens it again
+            print e
+            self.close()
+            print ("unable to log in")
+            return False
         except Exception, e:
             print e
-            self.tty = None
 #             serialLog.exception(e)
             print ("unable to log in")
             return False
+        self._recordLogin(time.time() - startTime)
         return True
         
     def send(self, cmd,  blind=False, timeout = TIMEOUT):
@@ -176,19 +183,19 @@ class SerialConnection(object):
         :return The response from the device. None in case of error
         '''
         if not self.loggedIn:
-            if not self.doLogin():
+            if not self.stream or not self.doLogin():
                 print "error could not login"
                 return None
 
         try:
-#             self.tty.read() # read everything currently in buffer
-            self.tty.expect(pexpect.EOF,timeout=1)
-            self.tty.sendline(cmd) #send command to remote
+            self.stream.discard() # forget anything printed since the last prompt
+            self.stream.write(cmd + '\n') #send command to remote
             if (blind): #if don't care about the result. For example, poweroff
                 return None
-            commandRegex = re.compile(re.escape(cmd +"\r\n")) #regex to strip off the command just issued
-            bf1 = self._expect(commandRegex) # if this is ever hanging, check to see the line length isn't too long!
-            result = self._expect(COMMAND_PROMPT_REGEX, timeout=TIMEOUT) #Now _expect the newline and command prompt
+            commandRegex = re.compile(re.escape(cmd) + r"\r?\n") #regex to strip off the command just issued
+            self.stream.expect(commandRegex, timeout=timeout).result() # if this is ever hanging, check to see the line length isn't too long!
+            match, result = self.stream.expect(COMMAND_PROMPT_REGEX, timeout=timeout).result() #Now expect the newline and command prompt
+            result = result[:len(result) - len(match.group(0))]
             result = result.rstrip("\r\n") #in most cases there will be a new line. Only if the return is blank will it be empty
             return result
         except Exception, e: # This will happen if the command is invalid on the remote. 
@@ -196,38 +203,59 @@ class SerialConnection(object):
 #             serialLog.exception(e)
             return None
 
-
-    def _expect(self,findString , timeout=TIMEOUT, exact = False):
+    def send_many(self, cmds, timeout = TIMEOUT):
         '''
-        :param findString:either a regex or a string (if exact)
-        :param timeout: how long to try before timeout
-        :param exact: find the string literally as opposed to treating it as a regex
+        Send several commands in one write and read all their results in one pass, instead of a round trip per command.
+        Each command is framed with delimiter lines holding its index and exit status, so no command waits for the prompt of the one before
+        :param cmds: list of shell commands, run in order, one line each so no prompt or echo lands inside the framing.
+        Each runs even if the one before failed
+        :param timeout: seconds for the whole batch
+        :return list of (output, exit status) in the order of cmds, or None in case of error
         '''
-        index = 0
-        start = time.clock()
-        end = start + timeout
-        step = .1
-        
-        while index == 0:
-            if time.clock() > end: #this timeout behavior isn't really coret since the _expect below has its own timeout
+        if not cmds:
+            return []
+        if not self.loggedIn:
+            if not self.stream or not self.doLogin():
+                print "error could not login"
                 return None
-            time.sleep(step)
-            if exact:
-                index = self.tty.expect_exact([pexpect.EOF, findString],timeout=timeout) 
-            else:
-                index = self.tty.expect_list([pexpect.EOF, findString],timeout=timeout) 
-        return self.tty.before
-            
-           
+
+        try:
+            self.stream.discard() # forget anything printed since the last prompt
+            lines = ["echo {0}_{1}; {2}; echo {3}_{1}:$?\n".format(BEGIN_DELIMETER, index, cmd, COMMAND_DELIMETER) for index, cmd in enumerate(cmds)]
+            self.stream.write("".join(lines))
+            lastRegex = re.compile(COMMAND_DELIMETER + "_" + str(len(cmds) - 1) + r":\d+\r?\n")
+            match, text = self.stream.expect(lastRegex, timeout=timeout).result()
+            results = [None] * len(cmds)
+            for framed in FRAMED_RESULT_REGEX.finditer(text):
+                results[int(framed.group(1))] = (framed.group(2).rstrip("\r\n"), int(framed.group(3)))
+            self.stream.expect(COMMAND_PROMPT_REGEX, timeout=timeout).result()
+            if None in results:
+                print "missing results in: " + text
+                return None
+            return results
+        except Exception, e:
+            print e
+            return None
+
     def close(self):
         '''
         Close the connection. Call when you are done. Also gets called if EOF found
         '''
         self.loggedIn = False
-        if self.tty:
-            self.tty.close()
-        self.tty = None
+        if self.stream:
+            self.stream.close()
+        self.stream = None
 
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _recordLogin(self, seconds):
+        self.lastLoginSeconds = seconds
+        with SerialConnection.loginLatencyLock:
+            if not self.serialDeviceName in SerialConnection.loginLatency:
+                SerialConnection.loginLatency[self.serialDeviceName] = Histogram()
+            SerialConnection.loginLatency[self.serialDeviceName].add(seconds)
+        print "Logged in to " + self.serialDeviceName + " in %.2f seconds" % seconds
 
 
 # Example to test with
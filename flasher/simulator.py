@@ -0,0 +1,272 @@
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import flasher
+from fakeChip import FakeChip
+from scheduler import Scheduler
+from runState import RunState
+
+class Timing(object):
+    '''
+    A duration, drawn from a normal distribution and clipped at a minimum
+    '''
+    def __init__(self, mean, spread=0, minimum=0, scaled=True):
+        '''
+        :param mean: seconds, at real speed
+        :param spread: standard deviation in seconds
+        :param scaled: whether the simulation speed applies. Operators don't get faster
+        '''
+        self.mean = mean
+        self.spread = spread
+        self.minimum = minimum
+        self.scaled = scaled
+
+    def sample(self, speed, generator=random):
+        seconds = max(self.minimum, generator.gauss(self.mean, self.spread) if self.spread else self.mean)
+        return seconds * speed if self.scaled else seconds
+
+# Roughly what a station sees. Keys are the steps of a board's life
+DEFAULT_TIMING = {
+    'plug': Timing(4, 1, 1, scaled=False), # operator puts a board in an empty port
+    'unplug': Timing(3, 1, 1, scaled=False), # operator takes a board out once it is done
+    'stage0': Timing(6, 1), 'stage1': Timing(5, 1), 'stage2': Timing(2, .5), 'stage3': Timing(1), 'stage4': Timing(1), # chip-flash stages
+    'stage5': Timing(300, 30),
+    'felToFastboot': Timing(3, 1), # u-boot script running until fastboot enumerates
+    'reboot': Timing(1, .2, scaled=False), # fastboot going away after the last stage, so it always comes after chip-flash exits
+    'boot': Timing(25, 3), # fastboot gone until the serial gadget shows up
+    'subtest': Timing(5, 2), # each line of hwtest
+}
+
+# Probabilities
+DEFAULT_FAILURES = {
+    'flash': .01, # each chip-flash stage
+    'hwtest': .05, # a board fails one subtest
+    'login': .05, # the first password is rejected
+}
+
+HWTEST_SUBTESTS = ["Turn on wlan0", "Turn on wlan1", "Hardware list", "I2C bus 0", "I2C bus 1", "I2C bus 2",
+                   "testing AXP209 on I2C bus 0", "GPIO expander test", "Doing 10s stress test", "Wifi enumeration test"]
+STAGE_ERRORS = {0: 128, 1: 128, 2: 130, 3: 130, 4: 131, 5: 133} # exit code of a failed stage, from Flasher.err_codes
+NODE_TYPES = [('fel', '1f3a', 'efe8'), ('fastboot', '1f3a', '1010'), ('serial', '0525', 'a4a7')]
+PORTS_PER_HUB = 7
+
+# The fake chip-flash. It asks the simulator how long the stage takes and how it ends, then takes that long
+CHIP_FLASH_SCRIPT = '''#!{python}
+import socket, sys, time
+stage = int(sys.argv[sys.argv.index("--stage") + 1])
+chipPath = sys.argv[sys.argv.index("--chip-path") + 1]
+control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+control.connect({control!r})
+control.sendall("%s %d\\n" % (chipPath, stage))
+seconds, code = control.makefile().readline().split()
+print "== stage %d ==" % stage
+sys.stdout.flush()
+if stage == 5:
+    for part in range(1, 5):
+        sys.stderr.write("sending sparse 'UBI' %d/4 (65536 KB)...\\n" % part)
+        start = time.time()
+        time.sleep(float(seconds) / 4)
+        sys.stderr.write("OKAY [%7.3fs]\\nwriting 'UBI' %d/4...\\nOKAY [  0.100s]\\n" % (time.time() - start, part))
+else:
+    time.sleep(float(seconds))
+sys.exit(int(code))
+'''
+
+class _Board(object):
+    '''
+    The board currently in a port, and the nodes it shows
+    '''
+    def __init__(self, uid, hub, devRoot):
+        self.uid = uid
+        self.hub = hub
+        self.nodes = dict((kind, os.path.join(devRoot, "chip-%s-%s-%s" % (uid, hub, kind))) for kind, vendor, product in NODE_TYPES)
+        self.number = 0 # boards plugged in this port so far
+        self.chip = None # console, once booted
+        self.failAt = None # subtest this board fails
+        self.badLogins = 0
+
+class SimulatedFleet(object):
+    '''
+    CHIPs going through a station, without hardware. Device nodes are files (and pty symlinks for the serial gadget)
+    in a temporary directory, named by a generated udev rules file, so a Controller given both runs unchanged.
+    Each port gets a board plugged, shows FEL, goes to fastboot and then to the serial gadget as the fake chip-flash
+    runs its stages, answers the login and hwtest on a pty, and is unplugged and replaced after poweroff.
+    Durations come from Timing distributions and failures are injected with the given probabilities.
+    '''
+    def __init__(self, ports, speed=1.0, timing=None, failures=None, seed=None):
+        '''
+        :param ports: number of ports, PORTS_PER_HUB to a hub
+        :param speed: factor applied to the scaled durations. .01 runs a flash in a few seconds
+        :param timing: dictionary overriding entries of DEFAULT_TIMING
+        :param failures: dictionary overriding entries of DEFAULT_FAILURES
+        '''
+        self.speed = speed
+        self.timing = dict(DEFAULT_TIMING)
+        self.timing.update(timing or {})
+        self.failures = dict(DEFAULT_FAILURES)
+        self.failures.update(failures or {})
+        self.random = random.Random(seed)
+        self.devRoot = tempfile.mkdtemp(prefix="chipsim")
+        self.rulesFile = os.path.join(self.devRoot, "flasher.rules")
+        self.chipFlash = os.path.join(self.devRoot, "chip-flash")
+        self.controlPath = os.path.join(self.devRoot, "control")
+        self.lock = threading.Lock()
+        self.boards = {} # uid -> _Board
+        self.byFel = {} # fel node -> _Board, to find the board chip-flash was run for
+        for i in range(1, ports + 1):
+            board = _Board(str(i), str((i - 1) / PORTS_PER_HUB + 1), self.devRoot)
+            self.boards[board.uid] = board
+            self.byFel[board.nodes['fel']] = board
+        self.stopped = False
+        self.server = None
+        self.previousChipFlash = None
+        self._writeRules()
+        self._writeChipFlash()
+
+    def start(self):
+        '''
+        Start serving chip-flash and plug the first boards. Flasher is pointed at the fake chip-flash until stop
+        '''
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.controlPath)
+        self.server.listen(128)
+        thread = threading.Thread(target=self._serve, name="SimulatedFleet")
+        thread.daemon = True
+        thread.start()
+        self.previousChipFlash = flasher.CHIP_FLASH
+        flasher.CHIP_FLASH = self.chipFlash
+        for uid in self.boards:
+            Scheduler.get().call_later(self._sample('plug'), self._plug, uid)
+        return self
+
+    def stop(self):
+        self.stopped = True
+        if self.previousChipFlash:
+            flasher.CHIP_FLASH = self.previousChipFlash
+        try:
+            self.server.close()
+        except Exception:
+            pass
+        for board in self.boards.values():
+            if board.chip:
+                board.chip.close()
+        shutil.rmtree(self.devRoot, ignore_errors=True)
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _sample(self, step):
+        return self.timing[step].sample(self.speed, self.random)
+
+    def _writeRules(self):
+        with open(self.rulesFile, 'w') as rules:
+            for kind, vendor, product in NODE_TYPES:
+                for board in sorted(self.boards.values(), key=lambda board: int(board.uid)):
+                    kernel = "1-%s.%d" % (board.hub, (int(board.uid) - 1) % PORTS_PER_HUB + 1)
+                    rules.write('SUBSYSTEMS=="usb",  KERNELS=="%s", ATTRS{idVendor}=="%s", ATTRS{idProduct}=="%s",   SYMLINK+="%s"\n' %
+                                (kernel, vendor, product, os.path.basename(board.nodes[kind])))
+
+    def _writeChipFlash(self):
+        with open(self.chipFlash, 'w') as script:
+            script.write(CHIP_FLASH_SCRIPT.format(python=sys.executable, control=self.controlPath))
+        os.chmod(self.chipFlash, 0755)
+
+    def _serve(self):
+        while not self.stopped:
+            try:
+                connection, address = self.server.accept()
+            except Exception:
+                break
+            try:
+                request = connection.makefile().readline().split()
+                seconds, code = self._onStage(self.byFel[request[0]], int(request[1]))
+                connection.sendall("%f %d\n" % (seconds, code))
+            except Exception, e:
+                print "simulator: bad chip-flash request: " + str(e)
+            finally:
+                connection.close()
+
+    def _onStage(self, board, stage):
+        '''
+        chip-flash started a stage
+        :return (seconds it takes, exit code)
+        '''
+        seconds = self._sample('stage' + str(stage))
+        code = STAGE_ERRORS[stage] if self.random.random() < self.failures['flash'] else 0
+        Scheduler.get().call_later(seconds, self._afterStage, board, stage, code)
+        return seconds, code
+
+    def _afterStage(self, board, stage, code):
+        if code:
+            Scheduler.get().call_later(self._sample('unplug'), self._unplug, board.uid)
+        elif stage == 4: # the u-boot script switches to fastboot
+            self._removeNode(board, 'fel')
+            Scheduler.get().call_later(self._sample('felToFastboot'), self._createNode, board, 'fastboot')
+        elif stage == 5: # reboots into Linux
+            Scheduler.get().call_later(self._sample('reboot'), self._removeNode, board, 'fastboot')
+            Scheduler.get().call_later(self._sample('reboot') + self._sample('boot'), self._boot, board)
+
+    def _plug(self, uid):
+        if self.stopped:
+            return
+        board = self.boards[uid]
+        with self.lock:
+            board.number += 1
+            board.failAt = self.random.choice(HWTEST_SUBTESTS) if self.random.random() < self.failures['hwtest'] else None
+            board.badLogins = 1 if self.random.random() < self.failures['login'] else 0
+        self._createNode(board, 'fel')
+
+    def _boot(self, board):
+        if self.stopped:
+            return
+        board.chip = FakeChip(badLogins=board.badLogins, commands=lambda line: self._command(board, line),
+                              onPowerOff=lambda: self._poweredOff(board)).start()
+        os.symlink(board.chip.path, board.nodes['serial'])
+
+    def _command(self, board, line):
+        if 'hwtest' in line:
+            return self._hwtest(board)
+        return ''
+
+    def _hwtest(self, board):
+        '''
+        hwtest's output, a line at a time. A failing board stops at its ERROR line, as if hwtest was interrupted there
+        '''
+        yield "mac=7c:c7:09:%02x:%02x:%02x\n" % (int(board.uid) / 256 % 256, int(board.uid) % 256, board.number % 256)
+        for subtest in HWTEST_SUBTESTS:
+            time.sleep(self._sample('subtest'))
+            if subtest == board.failAt:
+                yield "# " + subtest + "...ERROR\n"
+                return
+            yield "# " + subtest + "...OK\n"
+        yield "# Checking bit flips on NAND... 0 49.9 1.64012\n"
+        yield "# Checking bad blocks on NAND... 52 4\n"
+        yield "### ALL TESTS PASSED ###\n"
+
+    def _poweredOff(self, board):
+        self._removeNode(board, 'serial')
+        Scheduler.get().call_later(self._sample('unplug'), self._unplug, board.uid)
+
+    def _unplug(self, uid):
+        board = self.boards[uid]
+        for kind in board.nodes:
+            self._removeNode(board, kind)
+        if board.chip:
+            board.chip.close()
+            board.chip = None
+        Scheduler.get().call_later(self._sample('plug'), self._plug, uid)
+
+    def _createNode(self, board, kind):
+        if not self.stopped:
+            open(board.nodes[kind], 'w').close()
+
+    def _removeNode(self, board, kind):
+        try:
+            os.unlink(board.nodes[kind])
+        except OSError:
+            pass
@@ -0,0 +1,141 @@
+import sys
+import time
+import traceback
+import unittest
+from observable_test import *
+
+PASSED = "passed"
+FAILED = "failed" # an assertion failed
+ERROR = "error" # the test raised
+SKIPPED = "skipped"
+
+
+class StepRecord(object):
+    '''
+    How one test of a run went
+    '''
+    __slots__ = ['method', 'outcome', 'seconds', 'error', 'errorNumber']
+
+    def __init__(self, method, errorNumber):
+        self.method = method
+        self.outcome = PASSED
+        self.seconds = 0.0
+        self.error = None # the formatted exception if it didn't pass
+        self.errorNumber = errorNumber # its @errorNumber
+
+
+class RunRecord(object):
+    '''
+    The result of a run, for StepRunner. Implements the part of unittest.TestResult that TestCase.run and observeTest call,
+    and nothing else: no stream, no buffering of stdout, no signal handling
+    '''
+    __slots__ = ['steps', 'errors', 'failures', 'shouldStop', 'failfast', '_start']
+
+    def __init__(self, failfast=True):
+        self.steps = [] # StepRecord of each test run, in order
+        self.errors = [] # (test, formatted exception), like unittest.TestResult, which observeTest counts
+        self.failures = []
+        self.shouldStop = False
+        self.failfast = failfast
+        self._start = None
+
+    def wasSuccessful(self):
+        return not self.errors and not self.failures
+
+    def failedStep(self):
+        '''
+        :return the StepRecord of the test that failed, None if all passed
+        '''
+        for step in self.steps:
+            if step.outcome in [FAILED, ERROR]:
+                return step
+        return None
+
+    def startTest(self, test):
+        self.steps.append(StepRecord(methodForTest(test), stepForTest(test).errorNumber))
+        self._start = time.time()
+
+    def stopTest(self, test):
+        self.steps[-1].seconds = time.time() - self._start
+
+    def addSuccess(self, test):
+        pass
+
+    def addError(self, test, err):
+        self._addProblem(self.errors, ERROR, test, err)
+
+    def addFailure(self, test, err):
+        self._addProblem(self.failures, FAILED, test, err)
+
+    def addSkip(self, test, reason):
+        self.steps[-1].outcome = SKIPPED
+
+    def addExpectedFailure(self, test, err):
+        pass
+
+    def addUnexpectedSuccess(self, test):
+        pass
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _addProblem(self, problems, outcome, test, err):
+        error = ''.join(traceback.format_exception(*err))
+        problems.append((test, error))
+        if isinstance(test, unittest.TestCase) and self.steps and self.steps[-1].method == methodForTest(test): # setUpClass and tearDownClass errors come with the suite class, outside of any test
+            self.steps[-1].outcome = outcome
+            self.steps[-1].error = error
+        if self.failfast:
+            self.shouldStop = True
+
+
+class StepRunner(object):
+    '''
+    Runs the tests of an observable_test suite in order, for a TestingThread. Replaces unittest.TextTestRunner, which prints
+    dots and tracebacks on the sys.stderr shared by every port's thread. Tests still go through TestCase.run, so setUp, tearDown,
+    the observeTest wrapper and the decorators work as before. setUpClass and tearDownClass are called around each run, like a TestSuite does
+    '''
+    def __init__(self, failfast=True):
+        '''
+        :param failfast: stop at the first test that fails
+        '''
+        self.failfast = failfast
+
+    def run(self, tests):
+        '''
+        :param tests: the test cases, e.g. a suite made by TestPlan.makeSuite or a part of it
+        :return a RunRecord
+        '''
+        result = RunRecord(self.failfast)
+        suiteClass = None
+        for test in tests:
+            if test.__class__ is not suiteClass:
+                self._tearDownClass(suiteClass, result)
+                suiteClass = test.__class__
+                if not self._setUpClass(suiteClass, result):
+                    break
+            test(result)
+            if result.shouldStop:
+                break
+        self._tearDownClass(suiteClass, result)
+        return result
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _setUpClass(self, suiteClass, result):
+        try:
+            suiteClass.setUpClass()
+            return True
+        except Exception:
+            result.addError(suiteClass, sys.exc_info())
+            return False
+
+    def _tearDownClass(self, suiteClass, result):
+        if suiteClass is None:
+            return
+        try:
+            suiteClass.tearDownClass()
+        except Exception:
+            result.addError(suiteClass, sys.exc_info())
+
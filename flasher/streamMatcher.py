@@ -0,0 +1,123 @@
+import re
+import time
+
+WINDOW = 1024 # longest text a single match may span. Only this much of the already searched text is searched again
+BUFFER_LIMIT = 1 << 20 # unconsumed characters kept. The oldest are dropped first
+
+class StreamMatcher(object):
+    '''
+    Finds regex matches in text that arrives in pieces, e.g. from a serial console.
+    Text is kept as a list of chunks until a match consumes it. When more text arrives, only the new text
+    plus the last WINDOW characters searched before are searched again, so the cost of each piece doesn't grow with the transcript.
+    Patterns therefore shouldn't depend on ^ being the start of the stream, and a match can't be longer than the window.
+    '''
+    def __init__(self, window=WINDOW, limit=BUFFER_LIMIT):
+        self.window = window
+        self.limit = limit
+        self.chunks = [] # unconsumed text
+        self.length = 0 # characters in chunks
+        self.consumed = 0 # stream offset of the first unconsumed character
+        self.scanned = 0 # unconsumed characters already searched with the current patterns
+        self.patterns = []
+
+    def setPatterns(self, patterns):
+        '''
+        :param patterns: list of regexes or compiled regexes to look for. The unconsumed text is searched again from the start
+        '''
+        self.patterns = [re.compile(pattern) if isinstance(pattern, basestring) else pattern for pattern in patterns]
+        self.scanned = 0
+
+    def feed(self, data):
+        '''
+        Add text to the end
+        '''
+        if not data:
+            return
+        self.chunks.append(data)
+        self.length += len(data)
+        while self.length > self.limit and len(self.chunks) > 1:
+            dropped = len(self.chunks.pop(0))
+            self.length -= dropped
+            self.consumed += dropped
+            self.scanned = max(0, self.scanned - dropped)
+
+    def search(self):
+        '''
+        Look for the earliest match of any pattern in the text that hasn't been searched yet. A match consumes the text up to its end
+        :return (index of the pattern, match, stream offset of the match, transcript up to the end of the match), or None.
+        The match's positions are relative to the searched window, the offset is from the start of the stream
+        '''
+        if not self.patterns or self.scanned >= self.length:
+            return None
+        start = max(0, self.scanned - self.window)
+        text = self._textFrom(start)
+        best = None
+        for index, pattern in enumerate(self.patterns):
+            match = pattern.search(text)
+            if match and (not best or match.start() < best[1].start()):
+                best = (index, match)
+        if not best:
+            self.scanned = self.length
+            return None
+        index, match = best
+        end = start + match.end()
+        unconsumed = ''.join(self.chunks)
+        transcript = unconsumed[:end]
+        rest = unconsumed[end:]
+        offset = self.consumed + start + match.start()
+        self.chunks = [rest] if rest else []
+        self.length = len(rest)
+        self.consumed += end
+        self.scanned = 0
+        return index, match, offset, transcript
+
+    def getvalue(self):
+        '''
+        :return the text that hasn't been consumed
+        '''
+        return ''.join(self.chunks)
+
+    def discard(self):
+        self.consumed += self.length
+        self.chunks = []
+        self.length = 0
+        self.scanned = 0
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _textFrom(self, start):
+        '''
+        :return the unconsumed text from position start, joining only the chunks needed
+        '''
+        pieces = []
+        position = self.length
+        for chunk in reversed(self.chunks):
+            if position <= start:
+                break
+            position -= len(chunk)
+            pieces.append(chunk)
+        pieces.reverse()
+        return ''.join(pieces)[start - position:]
+
+
+class RateLimitedLog(object):
+    '''
+    Prints at most one message per interval. Messages in between are counted, and the count is printed with the next one
+    '''
+    def __init__(self, prefix="", interval=1):
+        self.prefix = prefix
+        self.interval = interval
+        self.last = 0
+        self.suppressed = 0
+
+    def log(self, message):
+        now = time.time()
+        if now - self.last < self.interval:
+            self.suppressed += 1
+            return
+        if self.suppressed:
+            message += " (" + str(self.suppressed) + " more messages)"
+        print self.prefix + message
+        self.last = now
+        self.suppressed = 0
@@ -1,10 +1,11 @@
 import threading
 from progress import Progress
-import unittest
 import time
 from observable_test import *
 from ui_strings import *
 from runState import *
+from outputBuffer import OutputBuffer
+from stepRunner import StepRunner
 
 class TestResult:
     def __init__(self):
@@ -12,18 +13,24 @@ class TestResult:
     aborted = False
     success = None
     resultText = None
+    record = None # stepRunner.RunRecord of the last attempt: outcome, time and exception of each test
 
 class TestingThread(threading.Thread):
-    def __init__(self,  log, suite, deviceDescriptor,runId, mutexes, updateQueue, testResult, timeoutMultiplier = 1.0,imageInfo=""):
+    def __init__(self,  log, suite, deviceDescriptor,runId, mutexes, updateQueue, testResult, timeoutMultiplier = 1.0,imageInfo="", admission=None, timingModel=None, retryPolicy=None, deviceMonitor=None):
         '''
         I am intentionally not passing in the parent to prevent abuse of threads
         :param suite: The unittest suite to run
         :param deviceDescriptor:
         :param runId: counter of current number of runs. used for logs
-        :param mutexes: Dictionary of mutexes
+        :param mutexes: MutexRegistry holding the @mutex locks shared by all runs
         :param updateQueue: queue to manage Kivy updates
         :param testResult: The result of the tests will be stored here for the main thread to use
         :param timeoutMultiplier: Increase the timeout on slow devices
+        :param imageInfo: hash of the image, or a function returning it when the test asks
+        :param admission: AdmissionScheduler deciding when @bandwidth tests may run. None runs them right away
+        :param timingModel: TimingModel learning how long each test takes. None keeps the @progress values and the suites' timeouts
+        :param retryPolicy: RetryPolicy deciding whether a failed run resumes from a @resumable test. None never retries
+        :param deviceMonitor: DeviceMonitor the tests can wait on for the port's device nodes. None when devices are polled
         '''
         threading.Thread.__init__(self)
         self.log = log
@@ -32,17 +39,32 @@ class TestingThread(threading.Thread):
         self.runId = runId #used for traces for how many runs
         self.chipId = 0 #for the future
         self.mutexes =  mutexes
+        self.admission = admission
+        self.timingModel = timingModel
+        self.retryPolicy = retryPolicy
         self.updateQueue = updateQueue
         self.testResult = testResult
         self.timeoutMultiplier = timeoutMultiplier
         self.uid = deviceDescriptor.uid
-        self.testCaseAttributes = {'deviceDescriptor': deviceDescriptor, 'log':self.log, 'imageInfo':imageInfo} #such as for the flasher to get the port. Passed along to the unittest
+        self.testCaseAttributes = {'deviceDescriptor': deviceDescriptor, 'log':self.log, 'imageInfo':imageInfo, 'admission':admission, 'deviceMonitor':deviceMonitor} #such as for the flasher to get the port. Passed along to the unittest
         self.returnValues = {}
-        self.totalProgressSeconds = sum( progressForTest(testCase) for testCase in suite)
-        self.output = ""
+        self.plan = TestPlan.forSuite(suite.suiteClass) # the decorator values of the suite's tests, compiled once
+        if timingModel:
+            self.totalProgressSeconds = sum( self._expectedSeconds(testCase, self.plan.steps[methodForTest(testCase)].progress) for testCase in suite)
+        else:
+            self.totalProgressSeconds = self.plan.totalProgressSeconds
+        self.output = OutputBuffer() # the transcript of this run. Only what is appended is sent along
+        self.progress = None
         self.currentStateName = ""
+        self.currentStateFailMessage = None # @failMessage of the current test
+        self.currentStateErrorNumber = None # @errorNumber of the current test
+        self.errorCode = None # an error code produced by the current test
         self.event = None # event gets set when a prompt goes up
         self.aborted = False
+        self.testStartTime = None # when the current test got past its mutex and admission waits
+        self.failedTest = None # the test that failed in the current attempt
+        self.retried = None # (suite, stage, exit code) of the last failure retried
+        self.attemptStartTime = None
 
     def run(self):
         '''
@@ -50,17 +72,40 @@ class TestingThread(threading.Thread):
         '''
         self.startTime = time.time()
         stateInfoCallback = self.onStateChange.__get__(self, TestingThread) #Register for state changes from the unittest suite - meaning when a test case is about to run or has run
-        progressCallback = self._onProgressChange.__get__(self,TestingThread) #this progress is not used right now, but can be.
+        progressCallback = self._onMeasuredProgress.__get__(self,TestingThread) #tests which can measure their progress report it here
+        outputCallback = self._onOutput.__get__(self,TestingThread) #tests which stream their output report it here
 
         #Decorate all of the tests to add observers to them
         for testCase in self.suite:
-            decorateTest(testCase, stateInfoObservers = [stateInfoCallback], progressObservers = [progressCallback], attributes = self.testCaseAttributes, returnValues = self.returnValues ) #Decorate the test cases to add the callback observer and logging above
+            decorateTest(testCase, stateInfoObservers = [stateInfoCallback], progressObservers = [progressCallback], attributes = self.testCaseAttributes, returnValues = self.returnValues, outputObservers = [outputCallback] ) #Decorate the test cases to add the callback observer and logging above
 
         #RUN THE TESTS!
-        result = unittest.TextTestRunner(verbosity=1, failfast=True).run(self.suite) # This runs the whole suite of tests. For now, using TextTestRunner
+        tests = list(self.suite)
+        runner = StepRunner(failfast=True) # prints nothing, the transcript is in self.output
+        self.attemptStartTime = time.time()
+        result = runner.run(tests) # This runs the whole suite of tests
+        attempt = 1
+        while self.failedTest and not self.aborted: #a retryable failure runs the suite again from the test the RetryPolicy picks
+            resume = self._retry(tests, attempt)
+            if resume is None:
+                break
+            attempt += 1
+            self.failedTest = None
+            self.attemptStartTime = time.time()
+            result = runner.run(tests[resume:])
+        if self.retried and not self.failedTest:
+            suite, stage, exitCode = self.retried
+            self.retryPolicy.record(suite, stage, self.uid, attempt, exitCode, "", time.time() - self.attemptStartTime, "recovered")
 
         #Process test results. self.testResult is populated. The calling thread can use it if it wants
-        self.testResult.success = len(result.errors) + len(result.failures) == 0 # Any errors?
+        self.testResult.success = result.wasSuccessful() # Any errors?
+        self.testResult.record = result
+        failedStep = result.failedStep()
+        if failedStep and self.log: #the traceback TextTestRunner used to print
+            self.log.error(str(self.runId) + ": " + failedStep.method + " failed on " + self.uid + " after " + "%.1f" % failedStep.seconds + " seconds\n" + failedStep.error)
+        elif result.errors and self.log: #setUpClass or tearDownClass raised, outside of any test
+            suiteClass, error = result.errors[0]
+            self.log.error(str(self.runId) + ": " + suiteClass.__name__ + " setUpClass or tearDownClass failed on " + self.uid + "\n" + error)
         errorNumber = 0
         if self.testResult.success:
             state = RunState.PASS_STATE
@@ -83,10 +128,8 @@ class TestingThread(threading.Thread):
         if self.aborted:
             self.testResult.resultText += "\nABORTED"
 
-        self.output += self.testResult.resultText
-
         #update the UI. Fields from this thread are explicitly added to the info for logging/database. This thread will be gone by the time logging/db happens
-        self._updateStateInfo({'state': state, 'stateLabel': stateLabel, 'output': self.output, 'errorNumber':errorNumber,
+        self._updateStateInfo({'state': state, 'stateLabel': stateLabel, 'outputDelta': self.testResult.resultText, 'outputSeq': self.output.append(self.testResult.resultText), 'errorNumber':errorNumber,
              'chipId': self.chipId, 'suiteClass':self.suite.suiteClass, 'returnValues': self.returnValues, 'elapsedTime':self.getElapsedTime()})
         #the main thread can access the result through testResult
 
@@ -114,48 +157,66 @@ class TestingThread(threading.Thread):
         before = stateInfo['when']== "before"
 
         #get any decorators for the test case
-        progressSeconds =  progressForTest(testCase) # @progress
-        timeout =  timeoutForTest(testCase) # @timeout - this is not hooked in yet
-        mutex = mutexForTest(testCase) # @mutex
-        self.currentStateFailMessage = failMessageForTest(testCase) # a fail message to show
-        self.currentStateErrorNumber = errorNumberForTest(testCase)
+        step = testCase.step # set by decorateTest from the suite's TestPlan
+        progressSeconds =  step.progress # @progress
+        timeout =  step.timeout # @timeout - this is not hooked in yet
+        mutex = step.mutex # @mutex
+        bandwidth = step.bandwidth and self.admission # @bandwidth
+        self.currentStateFailMessage = step.failMessage # a fail message to show
+        self.currentStateErrorNumber = step.errorNumber
         if before:
             #initialize pre-test stuff
-            self.output += (str(self.runId) + ": BEFORE: " + englishName + " device: "+ self.deviceDescriptor.uid + "\n")
-            self._updateStateInfo({'state': RunState.ACTIVE_STATE, 'label': label, 'output': self.output, 'progress': 0})
+            text = str(self.runId) + ": BEFORE: " + englishName + " device: "+ self.deviceDescriptor.uid + "\n"
+            info = {'state': RunState.ACTIVE_STATE, 'label': label, 'progress': 0}
+            if self.output.seq == 0: #first output of the run replaces whatever was shown for the last one
+                info['output'] = text
+            else:
+                info['outputDelta'] = text
+            info['outputSeq'] = self.output.append(text)
+            self._updateStateInfo(info)
             testCase.output=""
             testCase.timeoutMultiplier = self.timeoutMultiplier #ideally this would use the timeout decorator instead and set a timeout
             self.progress = None
-            self._showPromptIfAny(promptBeforeForTest(testCase)) # @promptBefore
+            self._showPromptIfAny(step.promptBefore) # @promptBefore
             testCase.errorCode = None
             self.errorCode = None
 
             if mutex: #if this test needs a mutex as indicated in the test suite
-                if not mutex in self.mutexes:
-                    self.mutexes[mutex] = threading.Lock() #make a new one. This should only get called once per mutex, per app run
-                lock = self.mutexes[mutex] #get the lock
+                lock = self.mutexes.get(mutex) #made on first use
                 self._updateStateInfo({'state': RunState.PAUSED_STATE, 'stateLabel': PAUSED_TEXT})
-                lock.acquire() #Wait, if necessary, until the lock is free and then grab it
+                lock.acquire(self.uid) #Wait, if necessary, until it is this port's turn and then grab it
+            if bandwidth:
+                self._updateStateInfo({'state': RunState.PAUSED_STATE, 'stateLabel': PAUSED_TEXT})
+                self.admission.admit(self.uid) #Wait, if necessary, until the usb hubs of this port have room
 
             # We've got the lock now, so now indicate we are active
             self._updateStateInfo({'state': RunState.ACTIVE_STATE, 'stateLabel': RUNNING_TEXT})
+            if self.timingModel: #a timeout learned from the previous runs, for tests which can be stopped. None until there are enough of them
+                testCase.learnedTimeout = self.timingModel.timeout(testCase.__class__.__name__, methodForTest(testCase), self.uid, None)
+            self.testStartTime = time.time()
             if progressSeconds: #progress bar should be shown
-                self.progress = Progress(progressObservers = [self._onProgressChange.__get__(self,TestingThread)], finish=progressSeconds, timeout = timeout )
+                self.progress = Progress(progressObservers = [self._onProgressChange.__get__(self,TestingThread)], finish=self._expectedSeconds(testCase, progressSeconds), timeout = timeout )
 
 
         else: #AFTER
+            if self.timingModel and self.testStartTime:
+                self.timingModel.record(testCase.__class__.__name__, methodForTest(testCase), self.uid, time.time() - self.testStartTime, stateInfo.get('passed'))
+            self.testStartTime = None
+            if not stateInfo.get('passed'):
+                self.failedTest = testCase
             if testCase.errorCode:
                 self.errorCode = testCase.errorCode
-            self._showPromptIfAny(promptAfterForTest(testCase)) # @promptAfter
+            self._showPromptIfAny(step.promptAfter) # @promptAfter
             if mutex: # @mutex is an annotation defined in observable_test
-                self.mutexes[mutex].release() #free up the lock
+                self.mutexes.get(mutex).release(self.uid) #free up the lock for the next port in line
+            if bandwidth:
+                self.admission.release(self.uid)
             if progressSeconds:
                 self.progress.stopListening() #no longer want to get progress
 
             #update the output from the test case
-            self.output += testCase.output
-            self.output += (str(self.runId) + ": AFTER: " + englishName + " device: "+ str(self.uid) + " time: " + str(stateInfo['executionTime']) + "\n")
-            self._updateStateInfo({'state': RunState.PASSIVE_STATE, 'output': self.output})
+            text = testCase.output + str(self.runId) + ": AFTER: " + englishName + " device: "+ str(self.uid) + " time: " + str(stateInfo['executionTime']) + "\n"
+            self._updateStateInfo({'state': RunState.PASSIVE_STATE, 'outputDelta': text, 'outputSeq': self.output.append(text)})
 
     def getElapsedTime(self):
         return time.time() - self.startTime
@@ -170,6 +231,45 @@ class TestingThread(threading.Thread):
             self.event.wait() #now wait for a call to processButtonClick sent main mainthread
             self._updateStateInfo({'state': RunState.ACTIVE_STATE, 'label': label}) #after resume, now active. also reset label because prompt used it
 
+    def _retry(self, tests, attempt):
+        '''
+        The failed test's exit code decides with the RetryPolicy whether to try again. If so, wait for the backoff
+        and find the test to resume from for the state the device is in then
+        :param attempt: the attempt that failed, 1 for the first one
+        :return index in tests to run again from, None to give up
+        '''
+        if not self.retryPolicy:
+            return None
+        testCase = self.failedTest
+        suite, stage = testCase.__class__.__name__, methodForTest(testCase)
+        exitCode = getattr(testCase, 'exitCode', None)
+        seconds = time.time() - self.attemptStartTime
+        if not self.retryPolicy.isRetryable(testCase, exitCode):
+            if exitCode is not None:
+                self.retryPolicy.record(suite, stage, self.uid, attempt, exitCode, "", seconds, "fatal")
+            return None
+        resume = None
+        if attempt < self.retryPolicy.maxAttempts:
+            delay = self.retryPolicy.delay(attempt)
+            text = str(self.runId) + ": RETRY " + str(attempt + 1) + " of " + stage + " in " + str(delay) + " seconds, device: " + self.uid + "\n"
+            self._updateStateInfo({'state': RunState.PAUSED_STATE, 'stateLabel': RETRYING_TEXT.format(attempt + 1), 'outputDelta': text, 'outputSeq': self.output.append(text)})
+            time.sleep(delay) #let the device settle, e.g. fastboot come back
+            if not self.aborted:
+                resume = self.retryPolicy.resumeIndex(tests, tests.index(testCase), self.deviceDescriptor.getDeviceState())
+        self.retryPolicy.record(suite, stage, self.uid, attempt, exitCode, methodForTest(tests[resume]) if resume is not None else "", seconds,
+                                "retried" if resume is not None else "gave up")
+        if resume is not None:
+            self.retried = (suite, stage, exitCode)
+        return resume
+
+    def _expectedSeconds(self, testCase, progressSeconds):
+        '''
+        How long the test should take, learned from previous runs if there are enough, else its @progress value
+        '''
+        if not self.timingModel or not progressSeconds:
+            return progressSeconds
+        return self.timingModel.expectedSeconds(testCase.__class__.__name__, methodForTest(testCase), self.uid, progressSeconds)
+
     def _updateStateInfo(self,info):
         '''
         Queue a dictionary of GUI changes which Kivy will process in its main thread
@@ -187,3 +287,19 @@ class TestingThread(threading.Thread):
         :param progress:
         '''
         self._updateStateInfo({'progress': progress})
+
+    def _onMeasuredProgress(self,progress):
+        '''
+        Callback for progress measured by the test itself. This replaces the timer based @progress estimate
+        :param progress:
+        '''
+        if self.progress:
+            self.progress.stopListening()
+        self._onProgressChange(progress)
+
+    def _onOutput(self,text):
+        '''
+        Callback for output streamed by the test while it runs
+        :param text:
+        '''
+        self._updateStateInfo({'outputDelta': text, 'outputSeq': self.output.append(text)})
@@ -0,0 +1,134 @@
+import bisect
+import collections
+import threading
+from config import *
+
+class RollingSamples(object):
+    '''
+    The last few durations of a stage, kept sorted so percentiles are a lookup
+    '''
+    def __init__(self, size):
+        self.size = size
+        self.order = collections.deque() # in the order they were added, to drop the oldest
+        self.sorted = []
+
+    def add(self, value):
+        self.order.append(value)
+        bisect.insort(self.sorted, value)
+        if len(self.order) > self.size:
+            oldest = self.order.popleft()
+            del self.sorted[bisect.bisect_left(self.sorted, oldest)]
+
+    def __len__(self):
+        return len(self.sorted)
+
+    def percentile(self, p):
+        '''
+        :param p: between 0 and 100
+        :return the smallest sample with at least p percent of the samples at or below it, None without samples
+        '''
+        if not self.sorted:
+            return None
+        index = int(len(self.sorted) * p / 100.0 + .5) - 1 # nearest rank
+        return self.sorted[max(0, min(index, len(self.sorted) - 1))]
+
+
+class TimingModel(object):
+    '''
+    How long each stage of a suite takes on this host, overall and on each port, learned from the stages that passed.
+    Gives the progress bars an expected duration (the median) and the stages a timeout (a high percentile times a margin),
+    falling back to the values hard coded in the suites until TIMING_MIN_SAMPLES stages have been seen.
+    Durations are written to the log database and the latest ones read back on startup, so a restart doesn't forget them
+    '''
+    def __init__(self, window=TIMING_WINDOW, minSamples=TIMING_MIN_SAMPLES, timeoutPercentile=TIMING_TIMEOUT_PERCENTILE,
+                 timeoutMargin=TIMING_TIMEOUT_MARGIN, minTimeout=TIMING_MIN_TIMEOUT):
+        '''
+        :param window: number of recent durations kept per stage, and per stage and port
+        :param minSamples: durations needed before they are used instead of the defaults
+        :param timeoutPercentile: percentile of the durations the timeout is based on
+        :param timeoutMargin: factor applied to that percentile
+        :param minTimeout: seconds below which no timeout goes
+        '''
+        self.window = window
+        self.minSamples = minSamples
+        self.timeoutPercentile = timeoutPercentile
+        self.timeoutMargin = timeoutMargin
+        self.minTimeout = minTimeout
+        self.lock = threading.Lock()
+        self.samples = {} # (suite, stage) or (suite, stage, port) -> RollingSamples
+        self.databaseLogger = None
+
+    def attach(self, databaseLogger):
+        '''
+        Load the recent durations from the log database, and write every new one to it
+        :param databaseLogger: DatabaseLogger of this host
+        '''
+        for port, suite, stage, seconds in reversed(databaseLogger.loadStageTimes(self.window * 50)): # oldest first
+            self._add(suite, stage, port, seconds)
+        self.databaseLogger = databaseLogger
+
+    def record(self, suite, stage, port, seconds, passed):
+        '''
+        A stage finished. Only the ones that passed are learned from, a failure may have been cut short or hung until its timeout
+        :param suite: name of the suite class, e.g. Flasher
+        :param stage: name of the test method, e.g. test_Stage5
+        :param port: uid of the port
+        '''
+        if passed:
+            self._add(suite, stage, port, seconds)
+        if self.databaseLogger:
+            self.databaseLogger.logStageTime(suite, stage, port, seconds, passed)
+
+    def expectedSeconds(self, suite, stage, port, default):
+        '''
+        :return the median duration, for progress bars and ETAs, or default if there aren't enough samples
+        '''
+        samples = self._samplesFor(suite, stage, port)
+        if not samples:
+            return default
+        return samples.percentile(50)
+
+    def timeout(self, suite, stage, port, default):
+        '''
+        :return the seconds after which the stage should be considered stuck, or default if there aren't enough samples
+        '''
+        samples = self._samplesFor(suite, stage, port)
+        if not samples:
+            return default
+        return max(self.minTimeout, samples.percentile(self.timeoutPercentile) * self.timeoutMargin)
+
+    def formatMetrics(self):
+        '''
+        :return text with the expected duration and timeout of each stage
+        '''
+        with self.lock:
+            keys = sorted(key for key in self.samples.keys() if len(key) == 2)
+        lines = ["Stage timing (seconds, from the last %d passes):" % self.window]
+        for suite, stage in keys:
+            samples = self.samples[(suite, stage)]
+            lines.append("   %s.%s: n=%d p50=%.1f p%d=%.1f timeout=%s" % (suite, stage, len(samples), samples.percentile(50),
+                self.timeoutPercentile, samples.percentile(self.timeoutPercentile),
+                "%.1f" % self.timeout(suite, stage, None, 0) if len(samples) >= self.minSamples else "default"))
+        return "\n".join(lines) + "\n"
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _add(self, suite, stage, port, seconds):
+        with self.lock:
+            for key in [(suite, stage), (suite, stage, port)]:
+                if not key in self.samples:
+                    self.samples[key] = RollingSamples(self.window)
+                self.samples[key].add(seconds)
+
+    def _samplesFor(self, suite, stage, port):
+        '''
+        :return the port's samples if there are enough, else those of the whole host if there are enough, else None
+        '''
+        with self.lock:
+            for key in [(suite, stage, port), (suite, stage)]:
+                samples = self.samples.get(key)
+                if samples and len(samples) >= self.minSamples:
+                    return samples
+        return None
+
@@ -16,6 +16,7 @@ UI_UPLOAD_UBI = u"Upload UBI\n上传UBI固件"
 DISCONNECTED_TEXT= u"Disconnected\n没连接"
 WAITING_TEXT= u"Waiting\n等候"
 PAUSED_TEXT= u"Paused\n暂停"
+RETRYING_TEXT= u"Retry {0}\n重试 {0}"
 
 RUNNING_TEXT= u"Running\n运行中"
 FLASHING_TEXT= u"Flashing\n正在烧录固件"
@@ -0,0 +1,186 @@
+import collections
+import re
+import threading
+import time
+from metrics import Histogram
+
+KERNEL_REGEX = re.compile(r'^(\d+)-([\d.]+)$') # udev KERNELS of a usb device: bus-port[.port...]
+SENDING_REGEX = re.compile(r"sending (?:sparse )?'[^']*'(?: \d+/\d+)? \((\d+) KB\)\.\.\.")
+OKAY_REGEX = re.compile(r'OKAY \[\s*([\d.]+)s\]')
+MIN_TRANSFER_BYTES = 1 << 20 # smaller uploads are mostly latency, their rate says nothing about the bandwidth
+RATE_BOUNDS = [.5, 1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 25, 30, 40] # MB/s
+
+def upstreamOf(kernel):
+    '''
+    The usb nodes between a port and the host, nearest first.
+    e.g. 1-1.2.3 is port 3 of the hub on port 2 of the hub on port 1 of root hub usb1: ['1-1.2', '1-1', 'usb1']
+    :param kernel: KERNELS value of the port in the udev rules
+    :return the list, empty if the value can't be parsed
+    '''
+    match = KERNEL_REGEX.match(kernel)
+    if not match:
+        return []
+    bus, path = match.groups()
+    ports = path.split('.')
+    hubs = [bus + '-' + '.'.join(ports[:depth]) for depth in range(len(ports) - 1, 0, -1)]
+    return hubs + ['usb' + bus]
+
+
+class UsbTopology(object):
+    '''
+    The tree of hubs the ports hang off, built from the KERNELS paths of the udev rules
+    '''
+    def __init__(self, deviceDescriptors):
+        '''
+        :param deviceDescriptors: dictionary of uid -> DeviceDescriptor, as read by DeviceDescriptor.readRules
+        '''
+        self.upstream = {} # uid -> usb nodes between it and the host, nearest first
+        self.ports = collections.OrderedDict() # usb node -> uids below it
+        for uid, deviceDescriptor in deviceDescriptors.iteritems():
+            nodes = upstreamOf(deviceDescriptor.kernel)
+            self.upstream[uid] = nodes
+            for node in nodes:
+                self.ports.setdefault(node, []).append(uid)
+
+    def hubOf(self, uid):
+        '''
+        :return the hub the port is on, None if unknown
+        '''
+        nodes = self.upstream.get(uid)
+        return nodes[0] if nodes else None
+
+    def rootOf(self, uid):
+        '''
+        :return the root hub (bus) the port is on, None if unknown
+        '''
+        nodes = self.upstream.get(uid)
+        return nodes[-1] if nodes else None
+
+
+class TransferRateParser(object):
+    '''
+    An output observer for fastboot. Each "sending ... (N KB)..." followed by its "OKAY [ s]" is one measured upload
+    '''
+    def __init__(self, onTransfer):
+        '''
+        :param onTransfer: function(bytes, seconds) called for each upload
+        '''
+        self.onTransfer = onTransfer
+        self.pendingKb = None
+
+    def onLine(self, line):
+        match = SENDING_REGEX.search(line)
+        if match:
+            self.pendingKb = int(match.group(1))
+            line = line[match.end():] # fastboot prints OKAY on the same line once the upload is done
+        match = OKAY_REGEX.search(line)
+        if match and self.pendingKb is not None:
+            self.onTransfer(self.pendingKb * 1024, float(match.group(1)))
+            self.pendingKb = None
+
+
+class AdmissionScheduler(object):
+    '''
+    Caps how many ports run a bandwidth heavy stage (@bandwidth) at once on each hub and below each root hub,
+    since the ports of a hub share its upstream link and all slow down when too many upload together.
+    The hub limit applies to the hub a port is plugged in, not to the hubs chained above it, which carry more ports.
+    Waiting ports are admitted in the order they asked, skipping those whose hub is still full so one busy hub doesn't hold up the others.
+    Records the wait for admission and the upload rate measured on each port, hub and root hub, so the limits can be tuned
+    '''
+    def __init__(self, topology, hubLimit=None, rootLimit=None):
+        '''
+        :param topology: UsbTopology of the ports
+        :param hubLimit: ports allowed at once on a hub, None for no limit
+        :param rootLimit: ports allowed at once below a root hub, None for no limit
+        '''
+        self.topology = topology
+        self.hubLimit = hubLimit
+        self.rootLimit = rootLimit
+        self.lock = threading.Lock()
+        self.active = collections.defaultdict(int) # hub or root hub -> number of admitted ports on it, or below it for a root hub
+        self.admitted = {} # uid -> time it was admitted
+        self.waiters = collections.deque() # (uid, event) in the order they asked
+        self.waitTime = Histogram()
+        self.rates = {} # uid or usb node -> Histogram of MB/s
+
+    def admit(self, uid):
+        '''
+        Wait, if necessary, until the port's hub and root hub have room, and take it
+        '''
+        start = time.time()
+        event = threading.Event()
+        with self.lock:
+            self.waiters.append((uid, event))
+            self._admitWaiters()
+        event.wait()
+        self.waitTime.add(time.time() - start)
+
+    def release(self, uid):
+        with self.lock:
+            if self.admitted.pop(uid, None) is None:
+                return
+            for node in self._limitedNodes(uid):
+                self.active[node] -= 1
+            self._admitWaiters()
+
+    def recordTransfer(self, uid, bytes, seconds):
+        '''
+        An upload measured on a port, e.g. from fastboot's output with a TransferRateParser
+        '''
+        if seconds <= 0 or bytes < MIN_TRANSFER_BYTES:
+            return
+        rate = bytes / seconds / 1e6
+        with self.lock:
+            for key in [uid] + self.topology.upstream.get(uid, []):
+                if not key in self.rates:
+                    self.rates[key] = Histogram(RATE_BOUNDS)
+                self.rates[key].add(rate)
+
+    def formatMetrics(self):
+        '''
+        :return text with the limits, the admission waits, and the upload rates of each hub and port
+        '''
+        lines = ["Bandwidth limits: %s per hub, %s per root hub, %d admitted, %d waiting" % (
+            self.hubLimit or "no limit", self.rootLimit or "no limit", len(self.admitted), len(self.waiters))]
+        lines.append("   wait (seconds): " + self.waitTime.format())
+        with self.lock:
+            rates = dict(self.rates)
+        lines.append("Upload rates (MB/s):")
+        for node, uids in self.topology.ports.iteritems():
+            if node in rates:
+                lines.append("   " + node + " (" + str(len(uids)) + " ports): " + rates[node].format())
+        for uid in self.topology.upstream:
+            if uid in rates:
+                lines.append("   port " + uid + " on " + str(self.topology.hubOf(uid)) + ": " + rates[uid].format())
+        return "\n".join(lines) + "\n"
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _limitedNodes(self, uid):
+        '''
+        :return the port's hub and root hub, once if they are the same
+        '''
+        return set(node for node in [self.topology.hubOf(uid), self.topology.rootOf(uid)] if node is not None)
+
+    def _isFull(self, uid):
+        '''
+        Call with the lock held
+        '''
+        for node, limit in [(self.topology.hubOf(uid), self.hubLimit), (self.topology.rootOf(uid), self.rootLimit)]:
+            if node is not None and limit is not None and self.active[node] >= limit:
+                return True
+        return False
+
+    def _admitWaiters(self):
+        '''
+        Admit every waiter, oldest first, whose hubs have room. Call with the lock held
+        '''
+        for uid, event in list(self.waiters):
+            if self._isFull(uid):
+                continue
+            for node in self._limitedNodes(uid):
+                self.active[node] += 1
+            self.admitted[uid] = time.time()
+            self.waiters.remove((uid, event))
+            event.set()
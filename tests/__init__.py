@@ -0,0 +1,12 @@
+import logging
+import os
+import sys
+
+# The modules in flasher/ and web/ import each other by plain name, as when the apps are started from those directories
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _directory in ["web", "flasher"]:
+    _directory = os.path.join(_root, _directory)
+    if not _directory in sys.path:
+        sys.path.insert(0, _directory)
+
+logging.getLogger("global").addHandler(logging.NullHandler()) # failures the code under test logs on purpose
@@ -0,0 +1,75 @@
+import unittest
+import chipHardwareTest # not its names, or the loader would run ChipHardwareTest itself
+from chipHardwareTest import HWTEST_TIMEOUT_ERROR, errorCodeMap
+from future import Future, TimeoutError
+
+class _FakeStream(object):
+    '''
+    Stands in for a SerialStream, answering expect with the matching line of a script, or a timeout once the script runs out
+    '''
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.written = []
+        self.timeouts = []
+
+    def expect(self, pattern, timeout=None, answer=None, nudge=None):
+        self.timeouts.append(timeout)
+        future = Future()
+        patterns = pattern if isinstance(pattern, list) else [pattern]
+        if not self.lines:
+            future.setException(TimeoutError("no more output"))
+            return future
+        line = self.lines.pop(0)
+        for regex in patterns:
+            match = regex.search(line)
+            if match:
+                future.setResult((match, line))
+                break
+        if answer:
+            self.written.append(answer + '\n')
+        return future
+
+    def write(self, text):
+        self.written.append(text)
+
+
+class FollowHwtestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test = chipHardwareTest.ChipHardwareTest('test_020_hwtest')
+        self.output = []
+        self.test.progressObservers = []
+        self.test.outputObservers = [self.output.append]
+        self.test.returnValues = {}
+
+    def test_passed(self):
+        stream = _FakeStream(["# Turn on wlan0...OK\n", "# Hardware list...OK\n", "### ALL TESTS PASSED ###\n"])
+        transcript, errorCode = self.test.followHwtest(stream)
+        self.assertEqual(errorCode, 0)
+        self.assertEqual(transcript, "# Turn on wlan0...OK\n# Hardware list...OK\n### ALL TESTS PASSED ###\n")
+        self.assertEqual(stream.written, ['poweroff\n'])
+        self.assertTrue(all(timeout for timeout in stream.timeouts))
+
+    def test_failedSubtest(self):
+        '''
+        The first failing subtest stops hwtest and powers the board off
+        '''
+        stream = _FakeStream(["# Turn on wlan0...OK\n", "# I2C bus 0...ERROR\n", "# "])
+        transcript, errorCode = self.test.followHwtest(stream)
+        self.assertEqual(errorCode, errorCodeMap["I2C bus 0"])
+        self.assertEqual(stream.written, ['\x03', 'poweroff\n'])
+        self.assertEqual(self.output[-1], "---> I2C bus 0 failed, stopping hwtest\n")
+
+    def test_timeout(self):
+        '''
+        hwtest going quiet is an error instead of a port stuck forever
+        '''
+        stream = _FakeStream(["# Turn on wlan0...OK\n"])
+        transcript, errorCode = self.test.followHwtest(stream)
+        self.assertEqual(errorCode, HWTEST_TIMEOUT_ERROR)
+        self.assertEqual(transcript, "# Turn on wlan0...OK\n")
+        self.assertEqual(stream.written, ['\x03'])
+        self.assertTrue(self.output[1].startswith("---> hwtest printed nothing"))
+        self.assertTrue(self.output[2].startswith("Could not power off"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import logging
+import unittest
+from commandRunner import CommandRunner, ProgressParser
+
+class ProgressParserTestCase(unittest.TestCase):
+    def test_fastboot(self):
+        parser = ProgressParser()
+        self.assertEqual(parser.feed("sending sparse 'UBI' 1/2 (1024 KB)...\n"), 0)
+        self.assertEqual(parser.feed("OKAY [  2.000s]\n"), .25)
+        self.assertEqual(parser.feed("writing 'UBI' 1/2...\n"), .25)
+        self.assertEqual(parser.feed("OKAY [  1.000s]\n"), .5)
+        self.assertEqual(parser.getThroughput(), 1024 * 1024 / 2.0)
+        self.assertEqual(parser.feed("target reported max download size\n"), None)
+
+    def test_fel(self):
+        self.assertEqual(ProgressParser().feed(" 42% [========            ]   2048 kB,  512.3 kB/s\r"), .42)
+
+
+class CommandRunnerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.progress = []
+        self.lines = []
+        self.runner = CommandRunner(logging.getLogger("test"), progressObservers=[self.progress.append])
+        self.runner.parser = ProgressParser()
+        self.runner.lastRedraw = None
+
+    def test_progressBar(self):
+        '''
+        Lines ending in a carriage return drive the progress, and are passed on once for each new value
+        '''
+        for text in [" 10% [==      ]   16 kB,  1.0 kB/s\r", " 10% [==      ]   16 kB,  1.0 kB/s\r", " 20% [===     ]   32 kB,  1.0 kB/s\r"]:
+            self.runner._onLine(text, [self.lines.append])
+        self.assertEqual(self.progress, [.1, .1, .2])
+        self.assertEqual(self.lines, [" 10% [==      ]   16 kB,  1.0 kB/s\n", " 20% [===     ]   32 kB,  1.0 kB/s\n"])
+
+    def test_split(self):
+        self.runner._onLine(" 50% [====    ]   64 kB,  1.0 kB/s\r 60% [=====   ]   80 kB,  1.0 kB/s\rdone\r\n", [self.lines.append])
+        self.assertEqual(self.progress, [.5, .6])
+        self.assertEqual(self.lines, [" 50% [====    ]   64 kB,  1.0 kB/s\n", " 60% [=====   ]   80 kB,  1.0 kB/s\n", "done\r\n"])
+
+if __name__ == "__main__":
+    unittest.main()
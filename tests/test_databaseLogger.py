@@ -0,0 +1,135 @@
+import os
+import shutil
+import sqlite3 as sql
+import tempfile
+import unittest
+import databaseLogger
+from databaseLogger import DatabaseLogger, StatsWindow
+from runState import RunState
+
+class _Suite():
+    @staticmethod
+    def statsTableName():
+        return "suite"
+
+    @staticmethod
+    def statsTableColumns():
+        return [['flashTime', 'REAL', 0], ['stage', 'TEXT', '']]
+
+
+class DatabaseLoggerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.directory, "log.db")
+        self.logger = DatabaseLogger(fileName=self.fileName, batchSeconds=.01)
+        self.localOffset = databaseLogger.LOCAL_OFFSET
+
+    def tearDown(self):
+        self.logger.close()
+        databaseLogger.LOCAL_OFFSET = self.localOffset
+        shutil.rmtree(self.directory)
+
+    def test_write(self):
+        for i in range(5):
+            self._finish(i, RunState.PASS_STATE if i % 2 else RunState.FAIL_STATE)
+        self.logger.flush()
+        self.assertEqual(self._count("suite"), 5)
+        self.assertEqual(self._query("SELECT sum(total), sum(passed) FROM suite_rollup"), (5, 2))
+        self.assertEqual(self._query("SELECT sum(count) FROM suite_rollup_errors"), (3,))
+
+    def test_retryAfterTableDropped(self):
+        '''
+        A batch that fails because its table was dropped by hand is written once the tables are checked again
+        '''
+        self._finish(1, RunState.PASS_STATE)
+        self.logger.flush()
+        con = sql.connect(self.fileName)
+        con.execute("DROP TABLE suite")
+        con.commit()
+        con.close()
+        self._finish(2, RunState.PASS_STATE)
+        self.logger.flush()
+        self.assertEqual(self._count("suite"), 1)
+
+    def test_failedBatch(self):
+        '''
+        A batch that can't be written at all is dropped, and later rows are still written
+        '''
+        self.logger.queue.put((_Suite, ["too few values"]))
+        self.logger.flush()
+        self._finish(1, RunState.PASS_STATE)
+        self.logger.flush()
+        self.assertEqual(self._count("suite"), 1)
+
+    def test_statsWhileMigrating(self):
+        '''
+        Stats are empty until existing tables are migrated, instead of blocking the UI thread
+        '''
+        self._finish(1, RunState.PASS_STATE)
+        self.logger.flush()
+        queries = ["select count(*) as 'total' from suite_rollup where {0}".format(StatsWindow.today().where('hour'))]
+        self.logger.migrated.clear()
+        self.assertEqual(dict(self.logger.computeStats(queries)), {})
+        self.logger.migrated.set()
+        self.assertEqual(dict(self.logger.computeStats(queries)), {'total': 1})
+
+    def test_noRollupsForTimings(self):
+        '''
+        Stage times and retry attempts are written without rollups, and the rollups an older version made for them are dropped
+        '''
+        self.logger.logStageTime("Flasher", "test_Stage5", "1", 200.5, True)
+        self.logger.logRetryAttempt("Flasher", "test_Stage5", "1", 1, 133, "test_Stage5", 30)
+        self.logger.flush()
+        self.assertEqual((self._count("stage_time"), self._count("retry_attempt")), (1, 1))
+        self.assertEqual(self._tables("%rollup%"), [])
+        self.logger.close()
+        con = sql.connect(self.fileName)
+        con.execute("CREATE TABLE stage_time_rollup (runName TEXT, port TEXT, hour INTEGER)")
+        con.commit()
+        con.close()
+        self.logger = DatabaseLogger(fileName=self.fileName, batchSeconds=.01)
+        self.logger.migrated.wait(5)
+        self.assertEqual(self._tables("%rollup%"), [])
+
+    def test_localHours(self):
+        '''
+        Rollup hours start on local hours, also where the offset from UTC isn't whole hours.
+        Rollups written with other hours are rebuilt on startup
+        '''
+        databaseLogger.LOCAL_OFFSET = 0
+        self._finish(1, RunState.PASS_STATE)
+        self.logger.close()
+        databaseLogger.LOCAL_OFFSET = 5 * 3600 + 1800
+        self.logger = DatabaseLogger(fileName=self.fileName, batchSeconds=.01)
+        self._finish(2, RunState.PASS_STATE)
+        self.logger.flush()
+        self.assertEqual(self._query("SELECT sum(total), sum((hour + 19800) % 3600) FROM suite_rollup"), (2, 0))
+        start = StatsWindow.lastHours(2, now=1000000).start
+        self.assertEqual(((start + 19800) % 3600, 1000000 - start > 7200, 1000000 - start <= 3 * 3600), (0, True, True))
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _finish(self, i, state):
+        self.logger.onUpdateStateInfo({'uid': i % 3, 'state': state, 'suiteClass': _Suite, 'errorNumber': 0 if state == RunState.PASS_STATE else 130,
+                                       'elapsedTime': 100, 'chipId': 'chip%d' % i, 'returnValues': {'flashTime': 90.5, 'stage': 'Stage5'}})
+
+    def _query(self, query):
+        con = sql.connect(self.fileName)
+        try:
+            return con.execute(query).fetchone()
+        finally:
+            con.close()
+
+    def _tables(self, pattern):
+        con = sql.connect(self.fileName)
+        try:
+            return [row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ?", (pattern,))]
+        finally:
+            con.close()
+
+    def _count(self, tableName):
+        return self._query("SELECT count(*) FROM " + tableName)[0]
+
+if __name__ == "__main__":
+    unittest.main()
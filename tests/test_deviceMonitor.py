@@ -0,0 +1,147 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from os import path
+from deviceDescriptor import DeviceDescriptor
+import deviceMonitor
+from deviceMonitor import DeviceMonitor, FakeDeviceMonitor, InotifyDeviceMonitor, UdevDeviceMonitor
+from deviceStateMachine import DeviceStateMachine, DEADLINES, WAIT_FOR_FASTBOOT
+
+class DeviceMonitorTestCase(unittest.TestCase):
+    '''
+    Devices are plugged into a FakeDeviceMonitor, whose events drive a DeviceStateMachine the way the Controller does
+    '''
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.deviceDescriptors = {}
+        for uid in ["1", "2"]:
+            deviceDescriptor = DeviceDescriptor(uid, "hub", "1-1." + uid, "1f3a", "efe8", "usb")
+            deviceDescriptor.fel = path.join(self.directory, "chip-%s-fel" % uid)
+            deviceDescriptor.fastboot = path.join(self.directory, "chip-%s-fastboot" % uid)
+            deviceDescriptor.serial = path.join(self.directory, "chip-%s-serial" % uid)
+            self.deviceDescriptors[uid] = deviceDescriptor
+        self.now = 0
+        self.events = []
+        self.triggers = []
+        self.done = set()
+        self.stateMachine = DeviceStateMachine(self.deviceDescriptors.keys(), self._getDeviceState, lambda uid: uid in self.done,
+                                               lambda uid, state: self.triggers.append((uid, state)))
+        self.monitor = FakeDeviceMonitor(self.deviceDescriptors.values(), self._onEvent)
+        self.monitor.start()
+
+    def tearDown(self):
+        self.monitor.stop()
+        shutil.rmtree(self.directory)
+
+    def test_abstract(self):
+        self.assertRaises(TypeError, DeviceMonitor, [], None)
+
+    def test_events(self):
+        self.monitor.plug(self.deviceDescriptors["2"].fel)
+        self.monitor.plug(path.join(self.directory, "unknown"))
+        self.monitor.unplug(self.deviceDescriptors["2"].fel)
+        self.assertEqual(self.events, ["2", "2"])
+        self.monitor.stop()
+        self.monitor.plug(self.deviceDescriptors["1"].fel)
+        self.assertEqual(self.events, ["2", "2"])
+
+    def test_felTriggers(self):
+        self.monitor.plug(self.deviceDescriptors["1"].fel)
+        self.assertEqual(self.triggers, [("1", DeviceDescriptor.DEVICE_FEL)])
+        self.assertEqual(self.stateMachine.getState("2"), DeviceDescriptor.DEVICE_NULL)
+
+    def test_felToFastboot(self):
+        '''
+        FEL going away is not a disconnect while fastboot may still come up
+        '''
+        self.monitor.plug(self.deviceDescriptors["1"].fel)
+        self.now = 5
+        self.monitor.unplug(self.deviceDescriptors["1"].fel)
+        self.assertEqual(self.stateMachine.getState("1"), DeviceDescriptor.DEVICE_WAITING_FOR_FASTBOOT)
+        self.assertTrue(self.stateMachine.hasDeadlines())
+        self.now = 10
+        self.monitor.plug(self.deviceDescriptors["1"].fastboot)
+        self.assertEqual(self.stateMachine.getState("1"), DeviceDescriptor.DEVICE_FASTBOOT)
+        self.assertFalse(self.stateMachine.hasDeadlines())
+        self.stateMachine.expireDeadlines(self.now + DEADLINES[WAIT_FOR_FASTBOOT])
+        self.assertEqual(self.triggers, [("1", DeviceDescriptor.DEVICE_FEL)])
+
+    def test_fastbootNeverComes(self):
+        self.monitor.plug(self.deviceDescriptors["1"].fel)
+        self.now = 5
+        self.monitor.unplug(self.deviceDescriptors["1"].fel)
+        self.stateMachine.expireDeadlines(self.now + DEADLINES[WAIT_FOR_FASTBOOT] - 1)
+        self.assertEqual(len(self.triggers), 1)
+        self.stateMachine.expireDeadlines(self.now + DEADLINES[WAIT_FOR_FASTBOOT])
+        self.assertEqual(self.triggers, [("1", DeviceDescriptor.DEVICE_FEL), ("1", DeviceDescriptor.DEVICE_DISCONNECTED)])
+        self.assertEqual(self.stateMachine.getState("1"), DeviceDescriptor.DEVICE_DISCONNECTED)
+
+    def test_serialDisconnect(self):
+        '''
+        A serial gadget going away after its run doesn't trigger the port
+        '''
+        self.monitor.plug(self.deviceDescriptors["1"].serial)
+        self.done.add("1")
+        self.monitor.unplug(self.deviceDescriptors["1"].serial)
+        self.assertEqual(self.triggers, [("1", DeviceDescriptor.DEVICE_SERIAL)])
+
+    def test_waitFor(self):
+        '''
+        A wait for the fastboot device wakes up when the monitor reports it, and gives up at its timeout
+        '''
+        deviceDescriptor = self.deviceDescriptors["1"]
+        self.assertFalse(self.monitor.waitFor(deviceDescriptor.isFastBoot, .05))
+        plugger = threading.Timer(.05, self.monitor.plug, [deviceDescriptor.fastboot])
+        plugger.start()
+        self.assertTrue(self.monitor.waitFor(deviceDescriptor.isFastBoot, 5))
+        plugger.join()
+        self.monitor.stop()
+        self.assertFalse(self.monitor.waitFor(self.deviceDescriptors["2"].isFastBoot, 5)) # returns right away
+
+    def test_inotify(self):
+        events = []
+        received = threading.Event()
+        def onEvent(uid):
+            events.append(uid)
+            received.set()
+        try:
+            monitor = InotifyDeviceMonitor(self.deviceDescriptors.values(), onEvent)
+        except (OSError, AttributeError), e:
+            self.skipTest("no inotify: " + str(e))
+        monitor.start()
+        open(self.deviceDescriptors["1"].fel, 'a').close()
+        received.wait(5)
+        monitor.stop() # must return while the thread waits for events
+        self.assertFalse(monitor.thread.is_alive())
+        self.assertEqual(events[:1], ["1"])
+
+    def test_udevStop(self):
+        if not deviceMonitor.pyudev:
+            self.skipTest("pyudev is not installed")
+        try:
+            monitor = UdevDeviceMonitor(self.deviceDescriptors.values(), self._onEvent)
+        except Exception, e:
+            self.skipTest("no udev netlink: " + str(e))
+        monitor.start()
+        monitor.stop() # must return while the thread waits for events
+        self.assertFalse(monitor.thread.is_alive())
+
+    def test_stopTwice(self):
+        self.monitor.stop()
+        self.monitor.stop()
+        self.assertFalse(self.monitor.waitFor(self.deviceDescriptors["1"].isFel, 5))
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _getDeviceState(self, uid):
+        return self.deviceDescriptors[uid].getDeviceState()
+
+    def _onEvent(self, uid):
+        self.events.append(uid)
+        self.stateMachine.onDeviceState(uid, self._getDeviceState(uid), self.now)
+
+if __name__ == "__main__":
+    unittest.main()
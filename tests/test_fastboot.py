@@ -0,0 +1,115 @@
+import os
+import unittest
+from fastboot import Transport, FakeDevice, FastbootClient, FastbootError, splitImage, isSparse
+from fastboot import SPARSE_HEADER, SPARSE_MAGIC, CHUNK_HEADER, CHUNK_RAW, CHUNK_FILL, CHUNK_DONT_CARE, RAW_BLOCK_SIZE
+
+BLOCK_SIZE = 4096
+
+def makeSparseImage(rounds=3, rawBlocks=8):
+    '''
+    A sparse image of raw chunks separated by fill and don't care chunks
+    :return (image, the unsparsed data)
+    '''
+    chunks = []
+    data = bytearray()
+    blocks = 0
+    for i in range(rounds):
+        raw = os.urandom(rawBlocks * BLOCK_SIZE)
+        chunks.append(CHUNK_HEADER.pack(CHUNK_RAW, 0, rawBlocks, CHUNK_HEADER.size + len(raw)) + raw)
+        data.extend(raw)
+        chunks.append(CHUNK_HEADER.pack(CHUNK_FILL, 0, 2, CHUNK_HEADER.size + 4) + '\xab\xcd\xef\x01')
+        data.extend('\xab\xcd\xef\x01' * (2 * BLOCK_SIZE / 4))
+        chunks.append(CHUNK_HEADER.pack(CHUNK_DONT_CARE, 0, 2, CHUNK_HEADER.size))
+        data.extend('\0' * 2 * BLOCK_SIZE)
+        blocks += rawBlocks + 4
+    header = SPARSE_HEADER.pack(SPARSE_MAGIC, 1, 0, SPARSE_HEADER.size, CHUNK_HEADER.size, BLOCK_SIZE, blocks, len(chunks), 0)
+    return header + ''.join(chunks), data
+
+
+class FastbootClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.output = []
+        self.progress = []
+
+    def test_abstract(self):
+        self.assertRaises(TypeError, Transport)
+
+    def test_plain(self):
+        image = os.urandom(10000)
+        device = FakeDevice(keep=True)
+        client = self._client(device)
+        client.flash("UBI", buffer(image), 10)
+        client.resume()
+        self.assertEqual(device.partitions["UBI"], image)
+        self.assertTrue(device.continued)
+        self.assertEqual(self.progress[-1], 1.0)
+        self.assertTrue(self.output[0].startswith("sending 'UBI' (9 KB)...OKAY ["))
+        self.assertEqual(self.output[1], "(bootloader) writing\n")
+        self.assertTrue(self.output[2].startswith("writing 'UBI'...OKAY ["))
+
+    def test_sparse(self):
+        '''
+        A sparse image larger than max-download-size goes in several sparse downloads, which the device unsparses into the original data
+        '''
+        image, data = makeSparseImage()
+        device = FakeDevice(maxDownload=20000, keep=True)
+        self._client(device).flash("UBI", buffer(image), 10)
+        self.assertEqual(device.partitions["UBI"], data)
+        sending = [line for line in self.output if line.startswith("sending")]
+        self.assertTrue(len(sending) > 1)
+        self.assertTrue(sending[0].startswith("sending sparse 'UBI' 1/%d (" % len(sending)))
+        self.assertEqual(self.progress[-1], 1.0)
+
+    def test_plainSplit(self):
+        '''
+        A plain image too large for one download is sent as sparse images of raw chunks
+        '''
+        image = os.urandom(10 * RAW_BLOCK_SIZE)
+        device = FakeDevice(maxDownload=3 * RAW_BLOCK_SIZE, keep=True)
+        self._client(device).flash("UBI", buffer(image), 10)
+        self.assertEqual(device.partitions["UBI"], image)
+
+    def test_fail(self):
+        device = FakeDevice()
+        client = self._client(device)
+        self.assertRaises(FastbootError, client.command, "erase:UBI")
+        self.assertEqual(client.maxDownloadSize(), device.maxDownload)
+        self.assertRaises(FastbootError, client.download, [buffer('x' * 100)], device.maxDownload + 1, 0, None)
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _client(self, device):
+        return FastbootClient(device, onOutput=self.output.append, onProgress=self.progress.append)
+
+
+class SplitImageTestCase(unittest.TestCase):
+    def test_small(self):
+        image = buffer(os.urandom(1000))
+        self.assertEqual(list(splitImage(image, 4096)), [([image], 1000)])
+
+    def test_sparse(self):
+        '''
+        Every download fits and is a sparse image covering all of the blocks, and raw data is never copied
+        '''
+        image, data = makeSparseImage(rawBlocks=16)
+        maxSize = 5 * BLOCK_SIZE
+        downloads = list(splitImage(buffer(image), maxSize))
+        self.assertTrue(len(downloads) > 3)
+        totalBlocks = SPARSE_HEADER.unpack(image[:SPARSE_HEADER.size])[6]
+        for pieces, size in downloads:
+            self.assertTrue(size <= maxSize)
+            self.assertEqual(size, sum(len(piece) for piece in pieces))
+            self.assertTrue(isSparse(pieces[0]))
+            download = ''.join(str(piece) for piece in pieces)
+            self.assertEqual(SPARSE_HEADER.unpack_from(download)[6], totalBlocks)
+            self.assertTrue(all(type(piece) in [str, buffer] for piece in pieces))
+            self.assertTrue(all(len(piece) <= 4 * BLOCK_SIZE for piece in pieces if type(piece) is buffer))
+
+    def test_errors(self):
+        self.assertRaises(FastbootError, list, splitImage(buffer('x' * 5000), 4096)) # not sparse nor made of blocks
+        image, data = makeSparseImage()
+        self.assertRaises(FastbootError, list, splitImage(buffer(image), BLOCK_SIZE)) # no room for a block
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from imageCache import hashFile, fileKey, ImageCache
+
+class _Records(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class ImageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hashFile(self):
+        data = os.urandom(3 << 19) # more than one chunk
+        self._write("rootfs.ubi", data)
+        self.assertEqual(hashFile(os.path.join(self.directory, "rootfs.ubi")),
+                         (hashlib.sha1(data).hexdigest(), hashlib.sha256(data).hexdigest()))
+        self.assertEqual(fileKey(os.path.join(self.directory, "missing")), None)
+
+    def test_get(self):
+        self._write("spl.bin", "spl")
+        cache = ImageCache(self.directory)
+        self.assertEqual(cache.peek("spl.bin"), None)
+        self.assertEqual(cache.get("spl.bin")['sha1'], hashlib.sha1("spl").hexdigest())
+        self.assertEqual(cache.peek("spl.bin")['sha1'], hashlib.sha1("spl").hexdigest())
+        self.assertEqual(cache.get("missing"), None)
+
+    def test_manifest(self):
+        '''
+        A second launch reads the hashes from the manifest, and hashes a file again only once it changed
+        '''
+        self._write("spl.bin", "spl")
+        ImageCache(self.directory).start().thread.join()
+        cache = ImageCache(self.directory)
+        self.assertEqual(cache.peek("spl.bin")['sha256'], hashlib.sha256("spl").hexdigest())
+        self._write("spl.bin", "new spl")
+        self.assertEqual(cache.peek("spl.bin"), None)
+        self.assertEqual(cache.get("spl.bin")['sha1'], hashlib.sha1("new spl").hexdigest())
+
+    def test_listing(self):
+        self._write("spl.bin", "spl")
+        self._write("uboot.bin", "uboot")
+        hashed = []
+        cache = ImageCache(self.directory)
+        cache.addListener(hashed.append)
+        self.assertEqual(cache.listing().count("hashing..."), 2)
+        cache.start().thread.join()
+        self.assertEqual(hashed, ["spl.bin", "uboot.bin"])
+        lines = cache.listing().splitlines()
+        self.assertEqual(len(lines), 2) # not the manifest
+        self.assertTrue(lines[0].startswith("3 ") and lines[0].endswith("spl.bin " + hashlib.sha1("spl").hexdigest()))
+
+    def test_errorsLogged(self):
+        '''
+        The hashing thread reports a directory it can't list to the log
+        '''
+        records = _Records()
+        logging.getLogger("global").addHandler(records)
+        try:
+            ImageCache(os.path.join(self.directory, "missing")).start().thread.join()
+        finally:
+            logging.getLogger("global").removeHandler(records)
+        self.assertEqual([record.levelno for record in records.records], [logging.ERROR])
+        self.assertTrue(records.records[0].getMessage().startswith("Could not list the images in "))
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _write(self, name, data):
+        with open(os.path.join(self.directory, name), 'wb') as image:
+            image.write(data)
+
+if __name__ == "__main__":
+    unittest.main()
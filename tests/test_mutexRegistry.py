@@ -0,0 +1,90 @@
+import threading
+import time
+import unittest
+from mutexRegistry import FairLock, MutexRegistry
+
+class FairLockTestCase(unittest.TestCase):
+    def test_order(self):
+        '''
+        Permits go to waiters in the order they asked, whoever releases
+        '''
+        lock = FairLock("fel")
+        lock.acquire("holder")
+        granted = []
+        threads = []
+        for owner in range(5):
+            thread = threading.Thread(target=self._takeTurn, args=(lock, owner, granted))
+            thread.start()
+            threads.append(thread)
+            self._waitFor(lambda: lock.waiting() == owner + 1)
+        lock.release("holder")
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(granted, range(5))
+
+    def test_noBarging(self):
+        '''
+        A free permit isn't taken by a newcomer while others are waiting for it
+        '''
+        lock = FairLock("fel")
+        lock.acquire(1)
+        granted = []
+        waiter = threading.Thread(target=self._takeTurn, args=(lock, 2, granted))
+        waiter.start()
+        self._waitFor(lambda: lock.waiting() == 1)
+        lock.release(1)
+        lock.acquire(3)
+        granted.append(3)
+        lock.release(3)
+        waiter.join(5)
+        self.assertEqual(granted, [2, 3])
+
+    def test_permits(self):
+        lock = FairLock("upload", permits=2)
+        lock.acquire(1)
+        lock.acquire(2)
+        self.assertEqual(lock.available, 0)
+        granted = []
+        waiter = threading.Thread(target=self._takeTurn, args=(lock, 3, granted))
+        waiter.start()
+        self._waitFor(lambda: lock.waiting() == 1)
+        self.assertEqual(granted, [])
+        lock.release(2)
+        waiter.join(5)
+        self.assertEqual(granted, [3])
+        lock.release(1)
+        self.assertEqual(lock.available, 2)
+
+    def test_metrics(self):
+        lock = FairLock("fel")
+        lock.acquire("1")
+        lock.release("1")
+        self.assertEqual((lock.waitTime.count, lock.holdTime.count), (1, 1))
+        self.assertEqual(sorted(lock.ownerHoldTime.keys()), ["1"])
+        self.assertTrue(lock.formatMetrics().startswith("fel: 1 permit(s), 0 holding, 0 waiting"))
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _takeTurn(self, lock, owner, granted):
+        lock.acquire(owner)
+        granted.append(owner)
+        lock.release(owner)
+
+    def _waitFor(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(.001)
+        self.assertTrue(condition())
+
+
+class MutexRegistryTestCase(unittest.TestCase):
+    def test_get(self):
+        registry = MutexRegistry({"upload": 3})
+        self.assertTrue(registry.get("fel") is registry.get("fel"))
+        self.assertEqual(registry.get("fel").permits, 1)
+        self.assertEqual(registry.get("upload").permits, 3)
+        self.assertEqual(MutexRegistry().formatMetrics(), "No mutex used yet\n")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from observable_test import TestPlan, label, progress, mutex, resumable
+
+class TestPlanTestCase(unittest.TestCase):
+    '''
+    The suite is a class attribute, so the test loader doesn't run it
+    '''
+    class _Suite(unittest.TestCase):
+        @label("fel")
+        @progress(10)
+        @resumable(1)
+        def test_0_fel(self):
+            pass
+
+        @mutex("fel")
+        @progress(5)
+        def test_1_spl(self):
+            pass
+
+    def test_plan(self):
+        plan = TestPlan.forSuite(self._Suite)
+        self.assertTrue(TestPlan.forSuite(self._Suite) is plan)
+        self.assertEqual(plan.methods, ("test_0_fel", "test_1_spl"))
+        self.assertEqual(plan.totalProgressSeconds, 15)
+        step = plan.steps["test_0_fel"]
+        self.assertEqual((step.method, step.label, step.progress, step.resumable, step.mutex), ("test_0_fel", "fel", 10, (1,), None))
+        self.assertEqual(plan.steps["test_1_spl"].mutex, "fel")
+        self.assertEqual([test._testMethodName for test in plan.makeSuite()], ["test_0_fel", "test_1_spl"])
+
+    def test_stepImmutable(self):
+        step = TestPlan.forSuite(self._Suite).steps["test_1_spl"]
+        self.assertRaises(AttributeError, setattr, step, "mutex", "other")
+        self.assertRaises(AttributeError, setattr, step, "extra", 1)
+        self.assertRaises(AttributeError, delattr, step, "progress")
+        self.assertEqual((step.mutex, step.progress), ("fel", 5))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import logging
+import signal
+import time
+import unittest
+import processSupervisor
+from processSupervisor import ProcessSupervisor
+
+class _Records(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class ProcessSupervisorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.supervisor = ProcessSupervisor()
+        self.supervisor.start()
+        self.gracePeriod = processSupervisor.KILL_GRACE_PERIOD
+        processSupervisor.KILL_GRACE_PERIOD = .2
+        self.records = _Records()
+        logging.getLogger("global").addHandler(self.records)
+
+    def tearDown(self):
+        processSupervisor.KILL_GRACE_PERIOD = self.gracePeriod
+        logging.getLogger("global").removeHandler(self.records)
+
+    def test_output(self):
+        lines = []
+        out, returncode = self.supervisor.spawn(["sh", "-c", "echo one; printf 'two\\rthree'; exit 3"], timeout=10,
+                                                lineObserver=lines.append).result()
+        self.assertEqual(out, "one\ntwo\rthree")
+        self.assertEqual(lines, ["one\n", "two\r", "three"])
+        self.assertEqual(returncode, 3)
+
+    def test_failingObserver(self):
+        '''
+        An observer that raises is logged with its traceback, and the output is still collected
+        '''
+        def observer(line):
+            raise ValueError("bad line")
+        out, returncode = self.supervisor.spawn(["sh", "-c", "echo one; echo two"], timeout=10, lineObserver=observer).result()
+        self.assertEqual((out, returncode), ("one\ntwo\n", 0))
+        self.assertEqual(len(self.records.records), 2)
+        self.assertEqual(self.records.records[0].levelno, logging.ERROR)
+        self.assertTrue(self.records.records[0].exc_info[0] is ValueError)
+
+    def test_timeout(self):
+        out, returncode = self.supervisor.spawn(["sleep", "10"], timeout=.1).result()
+        self.assertEqual(returncode, -signal.SIGTERM)
+
+    def test_stall(self):
+        start = time.time()
+        out, returncode = self.supervisor.spawn(["sh", "-c", "echo started; sleep 10"], stallTimeout=.2).result()
+        self.assertEqual(out, "started\n")
+        self.assertTrue(time.time() - start < 5)
+
+    def test_killAfterGracePeriod(self):
+        '''
+        A process group ignoring SIGTERM is sent SIGKILL once the grace period is over
+        '''
+        start = time.time()
+        out, returncode = self.supervisor.spawn(["sh", "-c", "trap '' TERM; while true; do sleep .05; done"], timeout=.1).result()
+        self.assertEqual(returncode, -signal.SIGKILL)
+        self.assertTrue(time.time() - start >= .3)
+
+if __name__ == "__main__":
+    unittest.main()
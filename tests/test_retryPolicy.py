@@ -0,0 +1,71 @@
+import unittest
+from deviceDescriptor import DeviceDescriptor
+from observable_test import resumable
+from retryPolicy import RetryPolicy
+
+class RetryPolicyTestCase(unittest.TestCase):
+    class _Suite(unittest.TestCase):
+        '''
+        Laid out like Flasher. A class attribute, so the test loader doesn't run it
+        '''
+        retryableErrors = [132, 133]
+
+        @resumable(DeviceDescriptor.DEVICE_FEL)
+        def test_0_fel(self):
+            pass
+
+        def test_1_spl(self):
+            pass
+
+        def test_2_uboot(self):
+            pass
+
+        @resumable(DeviceDescriptor.DEVICE_FASTBOOT, DeviceDescriptor.DEVICE_SERIAL)
+        def test_3_ubi(self):
+            pass
+
+        def test_4_boot(self):
+            pass
+
+    def setUp(self):
+        self.tests = list(unittest.TestLoader().loadTestsFromTestCase(self._Suite))
+
+    def test_isRetryable(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.isRetryable(self.tests[3], 133))
+        self.assertFalse(policy.isRetryable(self.tests[3], 135))
+        self.assertFalse(policy.isRetryable(self.tests[3], None))
+        self.assertFalse(policy.isRetryable(self, 133)) # a suite without retryableErrors
+
+    def test_delay(self):
+        policy = RetryPolicy(maxAttempts=5, backoff=2, maxBackoff=10)
+        self.assertEqual([policy.delay(attempt) for attempt in range(1, 6)], [2, 4, 8, 10, 10])
+
+    def test_resumeIndex(self):
+        '''
+        The latest @resumable test at or before the failed one, for the state the device is in
+        '''
+        policy = RetryPolicy()
+        self.assertEqual(policy.resumeIndex(self.tests, 3, DeviceDescriptor.DEVICE_FASTBOOT), 3)
+        self.assertEqual(policy.resumeIndex(self.tests, 4, DeviceDescriptor.DEVICE_SERIAL), 3)
+        self.assertEqual(policy.resumeIndex(self.tests, 4, DeviceDescriptor.DEVICE_FEL), 0)
+        self.assertEqual(policy.resumeIndex(self.tests, 2, DeviceDescriptor.DEVICE_FASTBOOT), None) # no going forward
+        self.assertEqual(policy.resumeIndex(self.tests, 4, DeviceDescriptor.DEVICE_DISCONNECTED), None)
+
+    def test_record(self):
+        attempts = []
+        class DatabaseLogger(object):
+            def logRetryAttempt(self, *args):
+                attempts.append(args)
+        policy = RetryPolicy(maxAttempts=3, backoff=1, maxBackoff=4)
+        policy.attach(DatabaseLogger())
+        policy.record("Flasher", "test_3_ubi", "1", 1, 133, "test_3_ubi", 10, "retried")
+        policy.record("Flasher", "test_3_ubi", "1", 2, 133, "", 12, "recovered")
+        policy.record("Flasher", "test_1_spl", "2", 1, 130, "", 5, "fatal")
+        self.assertEqual(attempts, [("Flasher", "test_3_ubi", "1", 1, 133, "test_3_ubi", 10), ("Flasher", "test_1_spl", "2", 1, 130, "", 5)])
+        self.assertEqual(policy.formatMetrics(), "Retries: at most 3 attempts, 1 to 4 seconds apart\n"
+                                                 "   exit code 130: 1 fatal\n"
+                                                 "   exit code 133: 1 retried, 1 recovered\n")
+
+if __name__ == "__main__":
+    unittest.main()
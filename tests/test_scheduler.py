@@ -0,0 +1,58 @@
+import logging
+import threading
+import unittest
+from scheduler import Handle, Scheduler
+
+class _Records(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+        self.records = _Records()
+        logging.getLogger("global").addHandler(self.records)
+
+    def tearDown(self):
+        logging.getLogger("global").removeHandler(self.records)
+        self.scheduler.shutdown()
+
+    def test_callLater(self):
+        called = threading.Event()
+        self.scheduler.call_later(.05, called.set)
+        self.assertTrue(called.wait(2))
+
+    def test_coalesce(self):
+        '''
+        Identical callbacks due in the same tick run once, and batched items are handed over together
+        '''
+        calls = []
+        def call(value):
+            calls.append(value)
+        due = [Handle(0, None, call, ("same",), None) for i in range(3)]
+        due += [Handle(0, .1, None, (i,), calls.append) for i in range(3)]
+        self.scheduler._runDue(due)
+        self.assertEqual(calls, ["same", [0, 1, 2]])
+
+    def test_failingCallback(self):
+        '''
+        A callback that raises is logged with its traceback, and the other callbacks still run
+        '''
+        def fail():
+            raise ValueError("broken")
+        called = threading.Event()
+        self.scheduler.call_later(.05, fail)
+        self.scheduler.call_later(.1, called.set)
+        self.assertTrue(called.wait(2))
+        self.assertEqual(len(self.records.records), 1)
+        self.assertEqual(self.records.records[0].levelno, logging.ERROR)
+        self.assertTrue("ValueError: broken" in self.records.format(self.records.records[0]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from fakeChip import FakeChip
+from serialconnection import SerialConnection
+
+class SerialConnectionTestCase(unittest.TestCase):
+    '''
+    Logging in and sending commands to a FakeChip's console on a pty
+    '''
+    def tearDown(self):
+        self.connection.close()
+        self.chip.close()
+
+    def test_login(self):
+        self._connect(FakeChip(bootTime=.1))
+        self.assertTrue(self.connection.loggedIn)
+        self.assertEqual(self.connection.send("echo hi"), "hi")
+
+    def test_loginFromUboot(self):
+        '''
+        A console at the u-boot prompt is reset, then logged in to once it has booted
+        '''
+        self._connect(FakeChip(bootTime=.1, uboot=True))
+        self.assertTrue(self.connection.loggedIn)
+        self.assertTrue("reset" in self.chip.received)
+
+    def test_loginRejected(self):
+        '''
+        A password rejected while the CHIP is still booting is sent again
+        '''
+        self._connect(FakeChip(badLogins=1))
+        self.assertTrue(self.connection.loggedIn)
+        self.assertEqual(self.chip.received.count("chip"), 2)
+
+    def test_send(self):
+        self._connect(FakeChip(commands={"cat /etc/hostname": "chip\r\n", "hwtest": "# Hardware list...OK\r\n"}))
+        self.assertEqual(self.connection.send("cat /etc/hostname"), "chip")
+        self.assertEqual(self.connection.send("hwtest"), "# Hardware list...OK")
+        self.assertEqual(self.connection.send("true"), "")
+
+    def test_sendMany(self):
+        '''
+        Each command's output and exit status come back in order, from one write
+        '''
+        self._connect(FakeChip(latency=.001))
+        self.assertEqual(self.connection.send_many(["echo one", "false", "echo two; true", "true"]), [("one", 0), ("", 1), ("two", 0), ("", 0)])
+        self.assertEqual(self.connection.send_many([]), [])
+        self.assertEqual(self.connection.send("echo after"), "after")
+
+    def test_sendManyShell(self):
+        '''
+        Commands run by a real shell: output spanning lines, and a failure in the middle of the batch
+        '''
+        self._connect(FakeChip())
+        results = self.connection.send_many(["printf 'a\\nb\\n'", "ls /nonexistent 2>/dev/null", "expr 6 + 36"])
+        self.assertEqual(results[0], ("a\r\nb", 0))
+        self.assertNotEqual(results[1][1], 0)
+        self.assertEqual(results[2], ("42", 0))
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _connect(self, chip):
+        self.chip = chip.start()
+        self.connection = SerialConnection(serialDeviceName=self.chip.path)
+        self.connection.connect(timeout=10)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from socketBridge import SocketBridge
+
+class _Emitter(object):
+    '''
+    Stands in for SocketIO
+    '''
+    def __init__(self):
+        self.messages = []
+
+    def emit(self, event, changes, broadcast=False):
+        self.messages.append((event, changes))
+
+
+class SocketBridgeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.emitter = _Emitter()
+        self.bridge = SocketBridge(self.emitter)
+
+    def test_merge(self):
+        '''
+        Changes of a port in one frame go out as one delta, holding the latest values
+        '''
+        self.bridge.put({'uid': '1', 'state': 'active', 'progress': 10})
+        self.bridge.put({'uid': '1', 'progress': 20})
+        self.bridge.put({'uid': '2', 'state': 'idle'})
+        self.assertEqual(self.bridge.flush(), 2)
+        self.assertEqual(self.emitter.messages, [("stateChanges", [{'uid': '1', 'state': 'active', 'progress': 20}, {'uid': '2', 'state': 'idle'}])])
+
+    def test_unchanged(self):
+        '''
+        Keys equal to what was last emitted are left out, and a port with no changes isn't sent
+        '''
+        self.bridge.put({'uid': '1', 'state': 'active', 'progress': 10})
+        self.bridge.flush()
+        self.bridge.put({'uid': '1', 'state': 'active', 'progress': 30})
+        self.bridge.put({'uid': '2', 'state': 'idle'})
+        self.bridge.flush()
+        self.bridge.put({'uid': '2', 'state': 'idle'})
+        self.assertEqual(self.bridge.flush(), 0)
+        self.assertEqual(self.emitter.messages[1][1], [{'uid': '1', 'progress': 30}, {'uid': '2', 'state': 'idle'}])
+
+    def test_changedBack(self):
+        '''
+        A key changed and changed back within a frame is still sent
+        '''
+        self.bridge.put({'uid': '1', 'state': 'active'})
+        self.bridge.flush()
+        self.bridge.put({'uid': '1', 'state': 'fail'})
+        self.bridge.put({'uid': '1', 'state': 'active'})
+        self.bridge.flush()
+        self.assertEqual(self.emitter.messages[1][1], [{'uid': '1', 'state': 'active'}])
+
+    def test_outputDeltas(self):
+        '''
+        Output deltas are never deduplicated against what was sent, and deltas in one frame are concatenated
+        '''
+        self.bridge.put({'uid': '1', 'outputDelta': 'ok\n', 'outputSeq': 1})
+        self.bridge.flush()
+        self.bridge.put({'uid': '1', 'outputDelta': 'ok\n', 'outputSeq': 2})
+        self.bridge.put({'uid': '1', 'outputDelta': 'done\n', 'outputSeq': 3})
+        self.bridge.flush()
+        self.assertEqual(self.emitter.messages[1][1], [{'uid': '1', 'outputDelta': 'ok\ndone\n', 'outputSeq': 3}])
+
+    def test_outputReplaced(self):
+        self.bridge.put({'uid': '1', 'outputDelta': 'lost\n', 'outputSeq': 1})
+        self.bridge.put({'uid': '1', 'output': 'new\n'})
+        self.bridge.put({'uid': '1', 'outputDelta': 'more\n', 'outputSeq': 2})
+        self.bridge.flush()
+        self.assertEqual(self.emitter.messages[0][1], [{'uid': '1', 'output': 'new\nmore\n', 'outputSeq': 2}])
+
+if __name__ == "__main__":
+    unittest.main()
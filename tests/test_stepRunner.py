@@ -0,0 +1,112 @@
+import unittest
+from observable_test import errorNumber
+from stepRunner import StepRunner, PASSED, FAILED, ERROR, SKIPPED
+
+class StepRunnerTestCase(unittest.TestCase):
+    '''
+    The suites are class attributes, so the test loader doesn't run them
+    '''
+    class _Suite(unittest.TestCase):
+        ran = []
+
+        @errorNumber(201)
+        def test_0_pass(self):
+            self.ran.append("test_0_pass")
+
+        @errorNumber(202)
+        def test_1_fail(self):
+            self.ran.append("test_1_fail")
+            self.fail("bad cable")
+
+        @unittest.skip("not today")
+        def test_2_skip(self):
+            pass
+
+        def test_3_error(self):
+            self.ran.append("test_3_error")
+            raise Exception("no device")
+
+    class _SetUpClassFails(unittest.TestCase):
+        ran = []
+
+        @classmethod
+        def setUpClass(cls):
+            raise Exception("no fixture")
+
+        def test_0(self):
+            self.ran.append("test_0")
+
+    class _TearDownClassFails(unittest.TestCase):
+        ran = []
+
+        @classmethod
+        def tearDownClass(cls):
+            raise Exception("fixture stuck")
+
+        def test_0(self):
+            self.ran.append("test_0")
+
+        def test_1(self):
+            self.ran.append("test_1")
+
+    def setUp(self):
+        for suite in [self._Suite, self._SetUpClassFails, self._TearDownClassFails]:
+            del suite.ran[:]
+
+    def test_failfast(self):
+        result = StepRunner().run(self._tests(self._Suite))
+        self.assertFalse(result.wasSuccessful())
+        self.assertEqual(self._Suite.ran, ["test_0_pass", "test_1_fail"])
+        self.assertEqual([(step.method, step.outcome, step.errorNumber) for step in result.steps],
+                         [("test_0_pass", PASSED, 201), ("test_1_fail", FAILED, 202)])
+        self.assertEqual(result.failedStep().method, "test_1_fail")
+        self.assertTrue("bad cable" in result.failedStep().error)
+        self.assertEqual(len(result.failures), 1)
+
+    def test_noFailfast(self):
+        result = StepRunner(failfast=False).run(self._tests(self._Suite))
+        self.assertEqual([step.outcome for step in result.steps], [PASSED, FAILED, SKIPPED, ERROR])
+        self.assertEqual((len(result.failures), len(result.errors)), (1, 1))
+        self.assertTrue("no device" in result.steps[3].error)
+
+    def test_setUpClassFails(self):
+        '''
+        No test runs and no step is marked, the error is recorded against the class
+        '''
+        result = StepRunner().run(self._tests(self._SetUpClassFails))
+        self.assertFalse(result.wasSuccessful())
+        self.assertEqual(self._SetUpClassFails.ran, [])
+        self.assertEqual(result.steps, [])
+        self.assertEqual(result.failedStep(), None)
+        self.assertTrue(result.errors[0][0] is self._SetUpClassFails)
+        self.assertTrue("no fixture" in result.errors[0][1])
+
+    def test_tearDownClassFails(self):
+        '''
+        The tests that passed stay passed, the error is recorded against the class
+        '''
+        result = StepRunner(failfast=False).run(self._tests(self._TearDownClassFails))
+        self.assertFalse(result.wasSuccessful())
+        self.assertEqual(self._TearDownClassFails.ran, ["test_0", "test_1"])
+        self.assertEqual([(step.method, step.outcome, step.error) for step in result.steps], [("test_0", PASSED, None), ("test_1", PASSED, None)])
+        self.assertEqual(result.failedStep(), None)
+        self.assertTrue(result.errors[0][0] is self._TearDownClassFails)
+        self.assertTrue("fixture stuck" in result.errors[0][1])
+
+    def test_suiteChange(self):
+        '''
+        The class fixtures are run around the tests of each suite class
+        '''
+        result = StepRunner(failfast=False).run(self._tests(self._TearDownClassFails) + self._tests(self._SetUpClassFails))
+        self.assertEqual(self._TearDownClassFails.ran, ["test_0", "test_1"])
+        self.assertEqual(self._SetUpClassFails.ran, [])
+        self.assertEqual([suiteClass for suiteClass, error in result.errors], [self._TearDownClassFails, self._SetUpClassFails])
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _tests(self, suiteClass):
+        return list(unittest.TestLoader().loadTestsFromTestCase(suiteClass))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import re
+import unittest
+from streamMatcher import StreamMatcher
+
+class StreamMatcherTestCase(unittest.TestCase):
+    def test_acrossChunks(self):
+        matcher = StreamMatcher()
+        matcher.setPatterns([r"login: "])
+        for piece in ["boot\nchip lo", "gin", ": "]:
+            matcher.feed(piece)
+        index, match, offset, transcript = matcher.search()
+        self.assertEqual((index, offset, transcript), (0, 10, "boot\nchip login: "))
+        self.assertEqual(matcher.getvalue(), "")
+
+    def test_earliestMatch(self):
+        '''
+        The match that starts first wins, whichever pattern it is, and consumes the text up to its end
+        '''
+        matcher = StreamMatcher()
+        matcher.setPatterns([r"### [^#]+ ###", re.compile(r"# \S+\.\.\.FAIL")])
+        matcher.feed("# wlan0...FAIL\n### SOME TESTS FAILED ###\n")
+        index, match, offset, transcript = matcher.search()
+        self.assertEqual((index, match.group(0), transcript), (1, "# wlan0...FAIL", "# wlan0...FAIL"))
+        index, match, offset, transcript = matcher.search()
+        self.assertEqual((index, offset), (0, 15))
+        self.assertEqual(matcher.getvalue(), "\n")
+        self.assertEqual(matcher.search(), None)
+
+    def test_window(self):
+        '''
+        Text already searched is only searched again within the window, so a match can span reads
+        '''
+        matcher = StreamMatcher(window=8)
+        matcher.setPatterns([r"OK\n"])
+        matcher.feed("x" * 100 + "O")
+        self.assertEqual(matcher.search(), None)
+        self.assertEqual(matcher.scanned, 101)
+        matcher.feed("K\n")
+        self.assertEqual(matcher.search()[2], 100)
+
+    def test_newPatterns(self):
+        '''
+        Setting patterns searches the unconsumed text again from the start
+        '''
+        matcher = StreamMatcher(window=4)
+        matcher.setPatterns([r"nothing"])
+        matcher.feed("# prompt $ ")
+        self.assertEqual(matcher.search(), None)
+        matcher.setPatterns([r"# prompt"])
+        self.assertEqual(matcher.search()[2], 0)
+
+    def test_limit(self):
+        '''
+        The oldest chunks are dropped once the unconsumed text is over the limit. Offsets still count from the start of the stream
+        '''
+        matcher = StreamMatcher(limit=15)
+        matcher.setPatterns([r"end"])
+        for piece in ["0123456789", "abcdefghij", "end"]:
+            matcher.feed(piece)
+        self.assertEqual(matcher.getvalue(), "abcdefghijend")
+        index, match, offset, transcript = matcher.search()
+        self.assertEqual((offset, transcript), (20, "abcdefghijend"))
+
+    def test_discard(self):
+        matcher = StreamMatcher()
+        matcher.setPatterns([r"\$ "])
+        matcher.feed("boot messages $ ")
+        matcher.discard()
+        matcher.feed("$ ")
+        self.assertEqual(matcher.search()[2], 16)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from deviceDescriptor import DeviceDescriptor
+from mutexRegistry import MutexRegistry
+from observable_test import TestPlan, label, errorNumber, failMessage
+from runState import RunState
+from testingThread import TestingThread, TestResult
+
+class _UpdateQueue(object):
+    def __init__(self):
+        self.updates = []
+
+    def put(self, info):
+        self.updates.append(info)
+
+
+class TestingThreadTestCase(unittest.TestCase):
+    '''
+    Runs are made the way the Controller makes them, and run on the test's thread. The suites are class attributes, so the test loader doesn't run them
+    '''
+    class _SetUpClassFails(unittest.TestCase):
+        @classmethod
+        def setUpClass(cls):
+            raise Exception("no fixture")
+
+        @label("first")
+        @errorNumber(201)
+        def test_0(self):
+            pass
+
+    class _Fails(unittest.TestCase):
+        @label("first")
+        @failMessage("Bad cable?")
+        @errorNumber(202)
+        def test_0(self):
+            self.fail("bad cable")
+
+    class _Passes(unittest.TestCase):
+        @label("first")
+        def test_0(self):
+            pass
+
+    def test_setUpClassFails(self):
+        '''
+        No test starts, and the run still ends in a FAIL state
+        '''
+        testResult, final = self._run(self._SetUpClassFails)
+        self.assertFalse(testResult.success)
+        self.assertEqual(testResult.record.steps, [])
+        self.assertEqual(final['state'], RunState.FAIL_STATE)
+        self.assertEqual(final['errorNumber'], None)
+
+    def test_testFails(self):
+        testResult, final = self._run(self._Fails)
+        self.assertFalse(testResult.success)
+        self.assertEqual((final['state'], final['stateLabel'], final['errorNumber']), (RunState.FAIL_STATE, "Bad cable?", 202))
+
+    def test_passes(self):
+        testResult, final = self._run(self._Passes)
+        self.assertTrue(testResult.success)
+        self.assertEqual(final['state'], RunState.PASS_STATE)
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _run(self, suiteClass):
+        '''
+        :return the TestResult, and the last update of the run, which the Controller logs to the database
+        '''
+        updateQueue = _UpdateQueue()
+        testResult = TestResult()
+        deviceDescriptor = DeviceDescriptor("1", "hub", "1-1.1", "1f3a", "efe8", "usb")
+        thread = TestingThread(None, TestPlan.forSuite(suiteClass).makeSuite(), deviceDescriptor, 1, MutexRegistry(), updateQueue, testResult)
+        thread.run()
+        return testResult, updateQueue.updates[-1]
+
+if __name__ == "__main__":
+    unittest.main()
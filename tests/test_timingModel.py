@@ -0,0 +1,69 @@
+import unittest
+from timingModel import RollingSamples, TimingModel
+
+class RollingSamplesTestCase(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(RollingSamples(10).percentile(50), None)
+
+    def test_percentile(self):
+        samples = RollingSamples(100)
+        for value in [7, 3, 9, 1, 5, 2, 10, 4, 8, 6]:
+            samples.add(value)
+        self.assertEqual(samples.percentile(0), 1)
+        self.assertEqual(samples.percentile(10), 1)
+        self.assertEqual(samples.percentile(50), 5)
+        self.assertEqual(samples.percentile(90), 9)
+        self.assertEqual(samples.percentile(99), 10)
+        self.assertEqual(samples.percentile(100), 10)
+
+    def test_single(self):
+        samples = RollingSamples(5)
+        samples.add(42)
+        self.assertEqual([samples.percentile(p) for p in [0, 50, 100]], [42, 42, 42])
+
+    def test_window(self):
+        '''
+        The oldest samples are dropped, even when they are duplicates of newer ones
+        '''
+        samples = RollingSamples(3)
+        for value in [100, 1, 100, 2, 3]:
+            samples.add(value)
+        self.assertEqual(len(samples), 3)
+        self.assertEqual(samples.sorted, [2, 3, 100])
+        samples.add(4)
+        self.assertEqual(samples.sorted, [2, 3, 4])
+        self.assertEqual(samples.percentile(100), 4)
+
+
+class TimingModelTestCase(unittest.TestCase):
+    def test_defaults(self):
+        model = TimingModel(minSamples=3)
+        model.record("Flasher", "test_Stage5", "1", 100, True)
+        model.record("Flasher", "test_Stage5", "1", 100, True)
+        self.assertEqual(model.expectedSeconds("Flasher", "test_Stage5", "1", 400), 400)
+        self.assertEqual(model.timeout("Flasher", "test_Stage5", "1", 920), 920)
+
+    def test_learned(self):
+        model = TimingModel(minSamples=3, timeoutPercentile=99, timeoutMargin=1.5, minTimeout=10)
+        for seconds in [100, 120, 110]:
+            model.record("Flasher", "test_Stage5", "1", seconds, True)
+        model.record("Flasher", "test_Stage5", "1", 900, False) # failures aren't learned from
+        self.assertEqual(model.expectedSeconds("Flasher", "test_Stage5", "1", 400), 110)
+        self.assertEqual(model.timeout("Flasher", "test_Stage5", "1", 920), 180)
+        self.assertEqual(model.timeout("Flasher", "test_Stage5", "2", 920), 180) # a new port uses the whole host's
+        self.assertTrue("Flasher.test_Stage5: n=3 p50=110.0 p99=120.0 timeout=180.0" in model.formatMetrics())
+
+    def test_perPort(self):
+        model = TimingModel(minSamples=2, timeoutMargin=1, minTimeout=10)
+        for port, seconds in [("1", 100), ("1", 100), ("2", 300), ("2", 300)]:
+            model.record("Flasher", "test_Stage5", port, seconds, True)
+        self.assertEqual(model.timeout("Flasher", "test_Stage5", "1", 920), 100)
+        self.assertEqual(model.timeout("Flasher", "test_Stage5", "2", 920), 300)
+
+    def test_minTimeout(self):
+        model = TimingModel(minSamples=1, minTimeout=10)
+        model.record("Flasher", "test_Stage1", "1", 1, True)
+        self.assertEqual(model.timeout("Flasher", "test_Stage1", "1", 60), 10)
+
+if __name__ == "__main__":
+    unittest.main()
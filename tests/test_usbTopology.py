@@ -0,0 +1,122 @@
+import threading
+import time
+import unittest
+from deviceDescriptor import DeviceDescriptor
+from usbTopology import upstreamOf, UsbTopology, TransferRateParser, AdmissionScheduler
+
+PORTS = {'a1': '1-1.1', 'a2': '1-1.2', 'a3': '1-1.3', 'b1': '1-2.1', 'b2': '1-2.2', 'c1': '2-1.1'} # uid -> KERNELS
+
+def makeTopology():
+    return UsbTopology(dict((uid, DeviceDescriptor(uid, None, kernel, None, None, None)) for uid, kernel in PORTS.iteritems()))
+
+
+class UsbTopologyTestCase(unittest.TestCase):
+    def test_upstreamOf(self):
+        self.assertEqual(upstreamOf('1-1.2.3'), ['1-1.2', '1-1', 'usb1'])
+        self.assertEqual(upstreamOf('2-4'), ['usb2'])
+        self.assertEqual(upstreamOf('garbage'), [])
+
+    def test_hubs(self):
+        topology = makeTopology()
+        self.assertEqual((topology.hubOf('a1'), topology.rootOf('a1')), ('1-1', 'usb1'))
+        self.assertEqual((topology.hubOf('c1'), topology.rootOf('c1')), ('2-1', 'usb2'))
+        self.assertEqual(topology.hubOf('unknown'), None)
+        self.assertEqual(sorted(topology.ports['usb1']), ['a1', 'a2', 'a3', 'b1', 'b2'])
+
+    def test_transferRateParser(self):
+        transfers = []
+        parser = TransferRateParser(lambda bytes, seconds: transfers.append((bytes, seconds)))
+        parser.onLine("sending sparse 'UBI' 1/4 (2048 KB)...\n")
+        parser.onLine("OKAY [  0.500s]\n")
+        parser.onLine("sending 'spl' (4 KB)... OKAY [  0.010s]\n")
+        self.assertEqual(transfers, [(2048 * 1024, .5), (4 * 1024, .01)])
+
+
+class AdmissionSchedulerTestCase(unittest.TestCase):
+    def test_noLimit(self):
+        scheduler = AdmissionScheduler(makeTopology())
+        for uid in PORTS:
+            scheduler.admit(uid)
+        self.assertEqual(len(scheduler.admitted), len(PORTS))
+
+    def test_hubLimit(self):
+        '''
+        A full hub holds back its own ports, in the order they asked, but not the ports of other hubs
+        '''
+        scheduler = AdmissionScheduler(makeTopology(), hubLimit=1)
+        scheduler.admit('a1')
+        admitted = []
+        threads = [self._admitLater(scheduler, uid, admitted) for uid in ['a2', 'a3']]
+        scheduler.admit('b1') # asked after a2 and a3, but its hub has room
+        scheduler.admit('c1')
+        self.assertEqual(admitted, [])
+        self.assertEqual(scheduler.active['1-1'], 1)
+        scheduler.release('a1')
+        self._waitFor(lambda: admitted == ['a2'])
+        scheduler.release('a2')
+        self._waitFor(lambda: admitted == ['a2', 'a3'])
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(scheduler.waiters), 0)
+
+    def test_rootLimit(self):
+        '''
+        The root hub limit counts the ports of every hub below it
+        '''
+        scheduler = AdmissionScheduler(makeTopology(), hubLimit=2, rootLimit=3)
+        scheduler.admit('a1')
+        scheduler.admit('a2')
+        scheduler.admit('b1')
+        admitted = []
+        threads = [self._admitLater(scheduler, uid, admitted) for uid in ['b2', 'a3']]
+        scheduler.admit('c1') # on another root hub
+        self.assertEqual(scheduler.active['usb1'], 3)
+        self.assertEqual(admitted, [])
+        scheduler.release('a1') # frees the root hub, b2 asked first
+        self._waitFor(lambda: admitted == ['b2'])
+        scheduler.release('b1')
+        self._waitFor(lambda: admitted == ['b2', 'a3'])
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual((scheduler.active['1-1'], scheduler.active['1-2'], scheduler.active['usb1']), (2, 1, 3))
+
+    def test_releaseUnknown(self):
+        scheduler = AdmissionScheduler(makeTopology(), hubLimit=1)
+        scheduler.admit('a1')
+        scheduler.release('a2')
+        scheduler.release('a1')
+        scheduler.release('a1')
+        self.assertEqual(scheduler.active['1-1'], 0)
+
+    def test_metrics(self):
+        scheduler = AdmissionScheduler(makeTopology(), hubLimit=2)
+        scheduler.recordTransfer('a1', 4 << 20, 2.)
+        scheduler.recordTransfer('a1', 1024, 1.) # too small to say anything about the bandwidth
+        self.assertEqual(sorted(scheduler.rates.keys()), ['1-1', 'a1', 'usb1'])
+        self.assertEqual(scheduler.rates['a1'].count, 1)
+        text = scheduler.formatMetrics()
+        self.assertTrue(text.startswith("Bandwidth limits: 2 per hub, no limit per root hub, 0 admitted, 0 waiting"))
+        self.assertTrue("port a1 on 1-1" in text)
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _admitLater(self, scheduler, uid, admitted):
+        '''
+        Admit uid from another thread, and wait until it is queued so the order of the waiters is known
+        '''
+        waiting = len(scheduler.waiters)
+        thread = threading.Thread(target=lambda: (scheduler.admit(uid), admitted.append(uid)))
+        thread.daemon = True
+        thread.start()
+        self._waitFor(lambda: len(scheduler.waiters) == waiting + 1)
+        return thread
+
+    def _waitFor(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(.001)
+        self.assertTrue(condition())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1 +1,2 @@
 from xioView import XioView
+from socketBridge import SocketBridge
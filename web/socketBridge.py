@@ -0,0 +1,83 @@
+import logging
+import threading
+from collections import OrderedDict
+
+EMIT_INTERVAL = .1 # seconds between emits. Everything that changed in between goes out in one message
+DELTA_KEYS = set(['outputDelta', 'outputSeq']) # describe a change instead of a value, so they are never compared with what was sent
+_MISSING = object()
+log = logging.getLogger("global")
+
+class SocketBridge(object):
+    '''
+    Carries state changes from controller listeners (any thread) to the socketio clients, in process.
+    Changes are merged per port, keeping only the keys that differ from what was last emitted,
+    and a socketio background task emits them once per frame as a single "stateChanges" message holding a list of port deltas.
+    Output deltas are always kept, and concatenated when several arrive in one frame.
+    '''
+    def __init__(self, socketio, event="stateChanges", interval=EMIT_INTERVAL):
+        '''
+        :param socketio: the SocketIO (or anything with emit, sleep and start_background_task)
+        :param event: name of the event the page listens for
+        :param interval: seconds between emits
+        '''
+        self.socketio = socketio
+        self.event = event
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = OrderedDict() # uid -> keys changed since the last emit
+        self.sent = {} # uid -> everything emitted so far, to find what changed
+        self.started = False
+
+    def start(self):
+        if not self.started:
+            self.started = True
+            self.socketio.start_background_task(self._run)
+
+    def put(self, info):
+        '''
+        Queue a state change. Cheap and never blocks on the network, so it can be called from the controller's thread
+        :param info: dictionary with a uid, as sent to Controller state listeners
+        '''
+        uid = info['uid']
+        with self.lock:
+            sent = self.sent.setdefault(uid, {})
+            delta = self.pending.get(uid)
+            changes = dict((key, value) for key, value in info.iteritems()
+                           if key in DELTA_KEYS or (delta and key in delta) or sent.get(key, _MISSING) != value)
+            if not changes:
+                return
+            if delta is None:
+                delta = self.pending[uid] = {'uid': uid}
+            if 'output' in changes: # a replacement makes earlier deltas irrelevant
+                delta.pop('outputDelta', None)
+            elif changes.get('outputDelta') and 'output' in delta:
+                delta['output'] = delta['output'] + changes.pop('outputDelta')
+            elif changes.get('outputDelta') and delta.get('outputDelta'):
+                changes['outputDelta'] = delta['outputDelta'] + changes['outputDelta']
+            delta.update(changes)
+
+    def flush(self):
+        '''
+        Emit everything pending now
+        :return the number of ports in the message
+        '''
+        with self.lock:
+            if not self.pending:
+                return 0
+            changes = self.pending.values()
+            self.pending = OrderedDict()
+            for delta in changes:
+                self.sent[delta['uid']].update((key, value) for key, value in delta.iteritems() if not key in DELTA_KEYS)
+        self.socketio.emit(self.event, changes, broadcast=True)
+        return len(changes)
+
+######################################################################################################################################
+# Privates
+######################################################################################################################################
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception: # keep emitting even if one message fails
+                log.exception("Could not emit state changes")
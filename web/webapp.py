@@ -2,19 +2,20 @@ from flask import Flask, render_template, request, jsonify, send_from_directory
 from flask_socketio import SocketIO, emit
 
 from flasher import call_repeatedly
+from flasher import Scheduler
 from flasher import RunState
 from flasher import Controller
-import requests
-import json
 import logging
 import sys
 from web import XioView
+from web import SocketBridge
 
 app = Flask(__name__,static_folder='static')
 app.config['SECRET_KEY'] = 'secret!'
 app.config['DEBUG'] = False
 # app.debug=True
 socketio = SocketIO(app)
+socketBridge = SocketBridge(socketio) # state changes go straight from the controller to socketio, batched per frame
 stateToClass = {RunState.PASSIVE_STATE: 'passive', RunState.PASS_STATE: 'success', RunState.FAIL_STATE: 'fail', RunState.PROMPT_STATE: 'prompt', RunState.ACTIVE_STATE:'active', RunState.PAUSED_STATE:'paused', RunState.IDLE_STATE: 'passive', RunState.DISCONNECTED_STATE: 'disconnected'}
 
 
@@ -23,7 +24,6 @@ class WebFlasher():
         self.controller = None
         logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
         self.log = logging.getLogger("flash")
-        self.base_url = None
         self._xio = xio
         
         
@@ -40,14 +40,14 @@ class WebFlasher():
         if self._xio:
             self._xioView = XioView(deviceDescriptors=self.controller.deviceDescriptors, hubs = self.controller.hubs)
             controller.addStateListener(lambda info: self._xioView.onUpdateStateInfo(info))
-         
+        socketBridge.start()
+
         call_repeatedly(1, lambda: controller.onPollingTick(0))
+        # process updates as soon as they are queued. Calls in the same scheduler tick are coalesced
+        controller.addUpdateQueueListener(lambda: Scheduler.get().call_later(0, controller.onUpdateTrigger, 0))
         call_repeatedly(2,lambda: controller.onUpdateTrigger(0))
- 
+
     def onUpdateStateInfo(self,info):
-        if not self.base_url: #ignore until we have a page listening
-            return
-        url = self.base_url + 'stateChange'
         fullInfo = info.copy() # get complete info, not just what changed
         if fullInfo.get('state'):
             fullInfo['stateClass'] = stateToClass[fullInfo['state']]
@@ -56,16 +56,7 @@ class WebFlasher():
         if fullInfo.get('stateLabel'):
             fullInfo['stateLabel'] = fullInfo['stateLabel'].replace("\n",'<br>')
 
-        payload = fullInfo #{'info': info}
-        headers = {'content-type': 'application/json'}
-
-        requests.post(url, data=json.dumps(payload), headers=headers) #post message to flask. This makes sure that socketio uses main thread
-
-@app.route('/stateChange',methods=['POST'])
-def stateChange():
-    info = request.get_json()
-    socketio.emit("stateChange",info,broadcast = True)
-    return jsonify("")
+        socketBridge.put(fullInfo) # only what differs from the last emit is sent, from socketio's own background task
 
 # @app.route('/js/<path:path>')
 # def send_js(path):
@@ -79,10 +70,6 @@ stateToClass = {RunState.PASSIVE_STATE: 'passive', RunState.PASS_STATE: 'success
     
 @app.route('/')
 def flashPage():
-#     webFlasher.base_url = request.base_url
-#     print "base url is" + webFlasher.base_url
-    webFlasher.base_url = "http://127.0.0.1/"
-
     return render_template('deviceTable.html', stateInfoArray=webFlasher.controller.stateInfo.values(), stateToClass=stateToClass)
  
 @app.route('/config')